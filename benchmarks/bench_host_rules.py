@@ -0,0 +1,67 @@
+"""
+Сравнение HostRules с прежним путём: re.search без компиляции на каждый вызов
+и перебор шаблонов исключения по одному.
+
+Запуск: python benchmarks/bench_host_rules.py [количество имён] [повторы]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from host_rules import DEFAULT_EXCLUDE_PATTERNS, DEFAULT_NORMALIZE_RULES, HostRules
+
+
+def legacy_normalize(vcenter_name):
+    match = re.search(r"VW-(\w+)-", vcenter_name)
+    if match:
+        return match.group(1)
+    return vcenter_name
+
+
+def legacy_is_excluded(vcenter_name):
+    return any(re.search(pattern, vcenter_name) for pattern in DEFAULT_EXCLUDE_PATTERNS)
+
+
+def generate_names(count, seed=42):
+    rnd = random.Random(seed)
+    names = []
+    for i in range(count):
+        kind = rnd.random()
+        if kind < 0.8:
+            names.append(f"VW-SWX{i:06d}-user{rnd.randint(0, 999)}")
+        elif kind < 0.9:
+            names.append(f"srv-{i:06d}_REP")
+        elif kind < 0.95:
+            names.append(f"temp-{i:06d}")
+        else:
+            names.append(f"db{i:06d}.example.com")
+    return names
+
+
+def measure(func, names, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for name in names:
+            func(name)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    names = generate_names(count)
+    rules = HostRules(DEFAULT_EXCLUDE_PATTERNS, DEFAULT_NORMALIZE_RULES)
+
+    legacy = measure(lambda name: legacy_is_excluded(name) or legacy_normalize(name), names, repeats)
+    cached = measure(lambda name: rules.is_excluded(name) or rules.normalize(name), names, repeats)
+    uncached_rules = HostRules(DEFAULT_EXCLUDE_PATTERNS, DEFAULT_NORMALIZE_RULES, cache_size=0)
+    compiled = measure(lambda name: uncached_rules.is_excluded(name) or uncached_rules.normalize(name), names, repeats)
+
+    print(f"Имён: {count}, повторов: {repeats}")
+    print(f"re.search на каждый вызов: {legacy:.3f} с")
+    print(f"HostRules без кэша:       {compiled:.3f} с ({legacy / compiled:.1f}x)")
+    print(f"HostRules с LRU-кэшем:    {cached:.3f} с ({legacy / cached:.1f}x)")
@@ -0,0 +1,65 @@
+"""
+Время запуска подкоманд cli.py: каждая подкоманда загружается (без выполнения)
+в отдельном процессе интерпретатора, измеряется медиана времени процесса
+за вычетом пустого запуска Python и проверяется, какие клиенты бэкендов
+оказались импортированы. Офлайн-сравнения (compare, compare-status)
+не должны загружать pyVmomi, pyzabbix и requests.
+
+Запуск: python benchmarks/bench_startup.py [повторы]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cli import COMMANDS
+
+BACKEND_MODULES = ("pyVmomi", "pyzabbix", "requests")
+OFFLINE_COMMANDS = ("compare", "compare-status")
+
+LOAD_SCRIPT = """
+import sys
+import cli
+cli.load(sys.argv[1])
+print(",".join(name for name in {modules!r} if name in sys.modules))
+"""
+
+
+def measure(args, repeats):
+    """
+    :return: Кортеж (медиана времени процесса в секундах, вывод последнего запуска).
+    """
+    timings = []
+    output = ""
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True, text=True)
+        timings.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        output = result.stdout.strip()
+    return statistics.median(timings), output
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baseline, _ = measure(["-c", "pass"], repeats)
+    print(f"Пустой запуск Python: {baseline * 1000:.1f} мс")
+
+    script = LOAD_SCRIPT.format(modules=BACKEND_MODULES)
+    failed = False
+    for command in COMMANDS:
+        try:
+            seconds, loaded = measure(["-c", script, command], repeats)
+        except RuntimeError as e:
+            print(f"  {command:<16} не загружается: {e}")
+            continue
+        print(f"  {command:<16} {(seconds - baseline) * 1000:8.1f} мс  бэкенды: {loaded or '-'}")
+        if command in OFFLINE_COMMANDS and loaded:
+            failed = True
+    if failed:
+        sys.exit("Офлайн-подкоманды загружают клиенты бэкендов.")
@@ -0,0 +1,232 @@
+"""
+Бенчмарк путей сравнения и исправления на синтетических инвентарях.
+Для каждой функции и размера измеряются время, пиковая память (tracemalloc)
+и число вызовов Zabbix API; результат сохраняется в JSON для отслеживания
+регрессий между версиями.
+
+Запуск: python benchmarks/bench_sync.py --sizes 1000 10000 100000 500000 --output bench.json
+Масштаб индекса (200k VM × 100k хостов): --sizes 200000 --functions host_index.HostIndex
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import CountingZabbixAPI, generate_inventory
+
+GROUP_ID = "100"
+
+
+def _import(module):
+    """
+    Импортирует модуль проекта; если нет зависимостей (pyVmomi, pyzabbix,
+    config.py), возвращает причину пропуска.
+    """
+    try:
+        return importlib.import_module(module), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def case_compare_missing(vms, zabbix_hosts):
+    compare_hosts, reason = _import("compare_hosts")
+    if compare_hosts is None:
+        return None, reason
+    ip_map = compare_hosts.build_zabbix_ip_map(zabbix_hosts)
+    return (lambda: compare_hosts.find_missing_hosts(vms, ip_map), None), None
+
+
+def case_main_missing(vms, zabbix_hosts):
+    main, reason = _import("main")
+    if main is None:
+        return None, reason
+    main_vms = [{"name": vm["host"], "ip": vm["ip"]} for vm in vms]
+    ip_map = {host["host"]: host["ips"] for host in zabbix_hosts}
+    return (lambda: main.find_missing_hosts(main_vms, ip_map), None), None
+
+
+def case_host_index(vms, zabbix_hosts):
+    host_index, reason = _import("host_index")
+    if host_index is None:
+        return None, reason
+    # Хостов Zabbix вдвое меньше, чем VM: построение индекса и поиск каждой VM по имени и IP
+    hosts = zabbix_hosts[:len(vms) // 2]
+
+    def run():
+        index = host_index.HostIndex.from_hosts(hosts)
+        return [vm for vm in vms if index.has_name(vm["host"]) or index.has_any_ip(index.host_ips(vm))]
+
+    return (run, None), None
+
+
+def case_compare_status(vms, zabbix_hosts):
+    compare_hosts_status, reason = _import("compare_hosts_status")
+    if compare_hosts_status is None:
+        return None, reason
+    return (lambda: compare_hosts_status.find_mismatched_hosts(vms, zabbix_hosts), None), None
+
+
+def case_add_hosts_to_group(vms, zabbix_hosts):
+    module, reason = _import("zabbix_add_hosts_to_group")
+    if module is None:
+        return None, reason
+    zapi = CountingZabbixAPI(zabbix_hosts, GROUP_ID)
+    return (lambda: module.add_hosts_to_group(zapi, vms, GROUP_ID), zapi), None
+
+
+def case_sync_group_membership(vms, zabbix_hosts):
+    module, reason = _import("zabbix_add_hosts_to_group")
+    if module is None:
+        return None, reason
+    zapi = CountingZabbixAPI(zabbix_hosts, GROUP_ID)
+    return (lambda: module.sync_group_membership(zapi, vms, GROUP_ID), zapi), None
+
+
+def _status_changes(vms, zabbix_hosts):
+    compare_hosts_status, reason = _import("compare_hosts_status")
+    module, reason2 = _import("zabbix_host_status_manager")
+    if compare_hosts_status is None or module is None:
+        return None, None, reason or reason2
+    mismatched = compare_hosts_status.find_mismatched_hosts(vms, zabbix_hosts)
+    return module, module.build_status_changes(mismatched), None
+
+
+def case_change_host_status(vms, zabbix_hosts):
+    module, statuses, reason = _status_changes(vms, zabbix_hosts)
+    if module is None:
+        return None, reason
+    zapi = CountingZabbixAPI(zabbix_hosts, GROUP_ID)
+
+    def run():
+        for host_name, status in statuses.items():
+            module.change_host_status(zapi, host_name, status)
+        return statuses
+
+    return (run, zapi), None
+
+
+def case_change_hosts_status_batch(vms, zabbix_hosts):
+    module, statuses, reason = _status_changes(vms, zabbix_hosts)
+    if module is None:
+        return None, reason
+    zapi = CountingZabbixAPI(zabbix_hosts, GROUP_ID)
+    return (lambda: module.change_hosts_status_batch(zapi, statuses), zapi), None
+
+
+CASES = {
+    "compare_hosts.find_missing_hosts": case_compare_missing,
+    "main.find_missing_hosts": case_main_missing,
+    "host_index.HostIndex": case_host_index,
+    "compare_hosts_status.find_mismatched_hosts": case_compare_status,
+    "zabbix_add_hosts_to_group.add_hosts_to_group": case_add_hosts_to_group,
+    "zabbix_add_hosts_to_group.sync_group_membership": case_sync_group_membership,
+    "zabbix_host_status_manager.change_host_status": case_change_host_status,
+    "zabbix_host_status_manager.change_hosts_status_batch": case_change_hosts_status_batch,
+}
+
+
+def _result_size(result):
+    if isinstance(result, dict):
+        if "results" in result:
+            return len(result["results"])
+        if "added" in result:
+            return len(result["added"])
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def run_case(name, factory, vms, zabbix_hosts, measure_memory=True):
+    prepared, reason = factory(vms, zabbix_hosts)
+    if prepared is None:
+        return {"function": name, "skipped": reason}
+
+    run, zapi = prepared
+    started = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - started
+    record = {
+        "function": name,
+        "seconds": round(seconds, 6),
+        "result_count": _result_size(result),
+        "api_calls": dict(zapi.calls) if zapi is not None else {},
+        "api_calls_total": zapi.total_calls() if zapi is not None else 0
+    }
+
+    if measure_memory:
+        # Отдельный прогон: tracemalloc заметно замедляет выполнение
+        run, _ = factory(vms, zabbix_hosts)[0]
+        tracemalloc.start()
+        run()
+        record["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return record
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк сравнения и исправления на синтетических данных.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000, 500000])
+    parser.add_argument("--functions", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--no-memory", action="store_true", help="Не измерять пиковую память.")
+    parser.add_argument("--log", action="store_true", help="Не подавлять логирование модулей.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Файл для результатов в JSON.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = []
+    if not args.log:
+        # Логирование по каждому хосту иначе доминирует во времени выполнения
+        logging.disable(logging.WARNING)
+
+    for size in args.sizes:
+        vms, zabbix_hosts = generate_inventory(size, args.seed)
+        for name in args.functions:
+            record = run_case(name, CASES[name], vms, zabbix_hosts, not args.no_memory)
+            record["size"] = size
+            results.append(record)
+            if "skipped" in record:
+                print(f"{size:>8} {name:<55} пропущено: {record['skipped']}")
+            else:
+                peak = record.get("peak_bytes")
+                peak_text = f"{peak / 1048576:8.1f} МБ" if peak is not None else ""
+                print(f"{size:>8} {name:<55} {record['seconds']:10.3f} с {peak_text} "
+                      f"вызовов API: {record['api_calls_total']}")
+
+    report = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"Результаты сохранены в файл: {args.output}")
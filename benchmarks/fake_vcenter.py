@@ -0,0 +1,196 @@
+"""
+Фейковый VCenter для нагрузочного тестирования без доступа к реальной среде.
+FakeVimStub подставляется вместо SOAP-адаптера pyVmomi, поэтому
+ServiceInstance, ContainerView, PropertyCollector и VirtualMachine — это
+настоящие объекты pyVmomi, и код экспорта работает без изменений.
+Эмулируются RetrieveContent, CreateContainerView, чтение свойств VM
+по одному (name, runtime, guest), RetrievePropertiesEx и
+ContinueRetrievePropertiesEx; инкрементальный экспорт (WaitForUpdatesEx)
+не поддерживается. Каждый вызов проходит через FaultInjector и учитывается
+в RequestStats (объём — размер SOAP-сериализации результата).
+"""
+import itertools
+import threading
+
+from pyVmomi import SoapAdapter, vim, vmodl
+
+from synthetic import FaultInjector, InjectedError, RequestStats
+
+
+class FakeVimStub:
+    """
+    Заменяет SoapStubAdapter: вызовы методов и чтение свойств управляемых
+    объектов обрабатываются в памяти по инвентарю vms (host, status, ip, ips).
+    :param measure_payload: Считать размер ответов (сериализация заметно замедляет).
+    """
+
+    def __init__(self, vms, faults=None, measure_payload=True):
+        self.faults = faults or FaultInjector()
+        self.stats = RequestStats()
+        self.measure_payload = measure_payload
+        self.cookie = 'vmware_soap_session="fake"'
+        self.session_active = True
+        self.vms = {f"vm-{i + 1}": vm for i, vm in enumerate(vms)}
+        self.views = {}
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=vim.Folder("group-d1", self),
+            viewManager=vim.view.ViewManager("ViewManager", self),
+            propertyCollector=vmodl.query.PropertyCollector("propertyCollector", self),
+            sessionManager=vim.SessionManager("SessionManager", self),
+            about=vim.AboutInfo(name="Fake VCenter", apiVersion="8.0.0.0")
+        )
+
+    def service_instance(self):
+        return vim.ServiceInstance("ServiceInstance", self)
+
+    # Интерфейс адаптера pyVmomi
+
+    def InvokeMethod(self, mo, info, args):
+        return self._dispatch(f"{type(mo).__name__}.{info.name}", mo, args)
+
+    def InvokeAccessor(self, mo, info):
+        return self._dispatch(f"{type(mo).__name__}.{info.name}", mo, ())
+
+    def SupportServerGUIDs(self):
+        return False
+
+    def _dispatch(self, method, mo, args):
+        handler = getattr(self, "_" + method.replace(".", "_"), None)
+        if handler is None:
+            raise NotImplementedError(f"Фейковый VCenter не поддерживает {method}")
+        try:
+            self.faults(method)
+            result = handler(mo, *args)
+        except InjectedError as e:
+            self.stats.record(method, error=True)
+            raise vmodl.fault.SystemError(msg=str(e), reason=str(e))
+        size = len(SoapAdapter.Serialize(result)) if self.measure_payload and result is not None else 0
+        self.stats.record(method, response_bytes=size)
+        return result
+
+    # ServiceInstance и сессия
+
+    def _vim_ServiceInstance_RetrieveContent(self, mo):
+        return self.content
+
+    def _vim_ServiceInstance_content(self, mo):
+        return self.content
+
+    def _vim_SessionManager_currentSession(self, mo):
+        if not self.session_active:
+            return None
+        return vim.UserSession(key="fake", userName="fake")
+
+    # ContainerView
+
+    def _vim_view_ViewManager_CreateContainerView(self, mo, container, types, recursive):
+        moid = f"session[fake]view-{next(self.counter)}"
+        with self.lock:
+            self.views[moid] = list(self.vms)
+        return vim.view.ContainerView(moid, self)
+
+    def _vim_view_ContainerView_view(self, mo):
+        return vim.VirtualMachine.Array([vim.VirtualMachine(moid, self) for moid in self.views[mo._moId]])
+
+    def _vim_view_ContainerView_Destroy(self, mo):
+        with self.lock:
+            self.views.pop(mo._moId, None)
+
+    # Свойства VM по одному (режим VCENTER_BULK_RETRIEVE = False)
+
+    def _vim_VirtualMachine_name(self, mo):
+        return self.vms[mo._moId]["host"]
+
+    def _vim_VirtualMachine_runtime(self, mo):
+        return vim.vm.RuntimeInfo(
+            powerState=self.vms[mo._moId]["status"], connectionState="connected",
+            faultToleranceState="notConfigured", toolsInstallerMounted=False, numMksConnections=0,
+            recordReplayState="inactive", onlineStandby=False, consolidationNeeded=False
+        )
+
+    def _vim_VirtualMachine_guest(self, mo):
+        vm = self.vms[mo._moId]
+        return vim.vm.GuestInfo(ipAddress=vm["ip"], net=self._guest_net(vm),
+                                guestState="running" if vm["ip"] else "notRunning")
+
+    # PropertyCollector
+
+    @staticmethod
+    def _guest_net(vm):
+        """
+        Адаптеры гостевой ОС: по одному на каждый IP VM.
+        """
+        ips = vm.get("ips") or ([vm["ip"]] if vm.get("ip") else [])
+        return vim.vm.GuestInfo.NicInfo.Array([
+            vim.vm.GuestInfo.NicInfo(deviceConfigId=4000 + n, connected=True, ipAddress=[ip])
+            for n, ip in enumerate(ips)
+        ])
+
+    def _property(self, vm, path):
+        if path == "name":
+            return vm["host"]
+        if path == "runtime.powerState":
+            return vim.VirtualMachine.PowerState(vm["status"])
+        if path == "guest.ipAddress":
+            return vm["ip"]
+        if path == "guest.net":
+            return self._guest_net(vm) or None
+        raise NotImplementedError(f"Фейковый VCenter не поддерживает свойство {path}")
+
+    def _object_content(self, moid, paths):
+        vm = self.vms[moid]
+        props = [(path, self._property(vm, path)) for path in paths]
+        return vmodl.query.PropertyCollector.ObjectContent(
+            obj=vim.VirtualMachine(moid, self),
+            # Как и VCenter, не возвращаем незаданные свойства
+            propSet=[
+                vmodl.DynamicProperty(name=path, val=value)
+                for path, value in props if value is not None
+            ]
+        )
+
+    def _page(self, moids, paths, page_size):
+        page, rest = moids[:page_size], moids[page_size:]
+        token = None
+        if rest:
+            token = f"token-{next(self.counter)}"
+            with self.lock:
+                self.tokens[token] = (rest, paths, page_size)
+        objects = [self._object_content(moid, paths) for moid in page]
+        return vmodl.query.PropertyCollector.RetrieveResult(objects=objects, token=token)
+
+    def _vmodl_query_PropertyCollector_RetrievePropertiesEx(self, mo, specSet, options):
+        spec = specSet[0]
+        view = spec.objectSet[0].obj
+        with self.lock:
+            moids = list(self.views[view._moId])
+        page_size = options.maxObjects or len(moids)
+        return self._page(moids, list(spec.propSet[0].pathSet), page_size)
+
+    def _vmodl_query_PropertyCollector_ContinueRetrievePropertiesEx(self, mo, token):
+        with self.lock:
+            if token not in self.tokens:
+                raise vmodl.fault.InvalidArgument(invalidProperty="token")
+            moids, paths, page_size = self.tokens.pop(token)
+        return self._page(moids, paths, page_size)
+
+
+class FakeVCenterSessions:
+    """
+    Замена export_vcenter.VCenterSessions: для каждого VCenter возвращает
+    ServiceInstance фейкового VCenter со своей частью инвентаря.
+    :param stubs: Словарь имя VCenter → FakeVimStub.
+    """
+
+    def __init__(self, stubs):
+        self.stubs = stubs
+
+    def get(self, vcenter):
+        return self.stubs[vcenter["host"]].service_instance()
+
+    def stats(self):
+        return {host: stub.stats.snapshot() for host, stub in self.stubs.items()}
@@ -0,0 +1,201 @@
+"""
+Локальный фейковый Zabbix JSON-RPC сервер для нагрузочного тестирования.
+Реализует host.get, host.create, host.update, host.massupdate, hostgroup.get,
+hostgroup.massadd, hostgroup.massremove и template.get поверх синтетического или
+загруженного из снимка набора хостов, а также user.login,
+user.checkAuthentication и apiinfo.version, которых достаточно для
+zabbix_client.connect_to_zabbix. Поддерживает внедрённые задержки и ошибки
+и считает запросы и объём данных по методам (GET /stats).
+
+Запуск: python benchmarks/fake_zabbix.py --size 100000 --latency 0.02 --error-rate 0.01
+Затем в config.py: ZABBIX_URL = "http://127.0.0.1:8080", ZABBIX_SESSION_CACHE = None
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import CountingZabbixAPI, FaultInjector, InjectedError, RequestStats, generate_inventory
+
+API_VERSION = "6.0.0"
+# Методы, не требующие авторизации
+ANONYMOUS_METHODS = ("apiinfo.version", "user.login", "user.checkAuthentication")
+# Ответы меньше этого размера не сжимаются
+GZIP_MIN_BYTES = 1024
+
+
+class FakeZabbixBackend:
+    """
+    Обработка JSON-RPC вызовов: авторизация, внедрение задержек и ошибок,
+    доступ к модели данных под блокировкой (задержка — вне её, чтобы
+    параллельные запросы действительно выполнялись параллельно).
+    """
+
+    def __init__(self, zabbix_hosts, faults=None, api_token=None, group_id="100"):
+        self.model = CountingZabbixAPI(zabbix_hosts, group_id)
+        self.faults = faults or FaultInjector()
+        self.stats = RequestStats()
+        self.api_token = api_token
+        self.sessions = set()
+        self.lock = threading.Lock()
+
+    def _authorized(self, auth):
+        return bool(auth) and (auth == self.api_token or auth in self.sessions)
+
+    def handle(self, method, params, auth):
+        """
+        :return: Результат вызова.
+        :raises InjectedError, PermissionError, NotImplementedError, KeyError
+        """
+        if method == "apiinfo.version":
+            return API_VERSION
+        if method == "user.checkAuthentication":
+            if not self._authorized(params.get("sessionid")):
+                raise PermissionError("Session terminated, re-login, please.")
+            return {"sessionid": params["sessionid"]}
+        if method not in ANONYMOUS_METHODS and not self._authorized(auth):
+            raise PermissionError("Not authorised.")
+
+        self.faults(method)
+
+        if method == "user.login":
+            sessionid = uuid.uuid4().hex
+            with self.lock:
+                self.sessions.add(sessionid)
+            return sessionid
+        with self.lock:
+            return self.model.call(method, params)
+
+    def expire_sessions(self):
+        """
+        Завершает все сессии (проверка повторного входа клиента).
+        """
+        with self.lock:
+            self.sessions.clear()
+
+
+def _error(code, message, data):
+    return {"code": code, "message": message, "data": data}
+
+
+class JsonRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    backend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        raw_size = len(body)
+        headers = {"Content-Type": "application/json"}
+        if raw_size >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return raw_size, len(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send(200, {"methods": self.backend.stats.snapshot(), "calls": dict(self.backend.model.calls)})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        try:
+            request = json.loads(body)
+            method = request["method"]
+        except (ValueError, KeyError) as e:
+            self._send(200, {"jsonrpc": "2.0", "error": _error(-32700, "Parse error.", str(e)), "id": None})
+            return
+
+        auth = request.get("auth")
+        header = self.headers.get("Authorization", "")
+        if header.startswith("Bearer "):
+            auth = header[len("Bearer "):]
+
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            response["result"] = self.backend.handle(method, request.get("params") or {}, auth)
+        except InjectedError as e:
+            response["error"] = _error(-32500, "Application error.", str(e))
+        except PermissionError as e:
+            response["error"] = _error(-32602, "Invalid params.", str(e))
+        except NotImplementedError:
+            response["error"] = _error(-32601, "Method not found.", f"Метод {method} не поддерживается")
+        except ValueError as e:
+            response["error"] = _error(-32602, "Invalid params.", str(e))
+        except (KeyError, TypeError) as e:
+            response["error"] = _error(-32602, "Invalid params.", f"Некорректные параметры: {e}")
+
+        raw_size, _ = self._send(200, response)
+        self.backend.stats.record(method, len(body), raw_size, error="error" in response)
+
+
+def make_server(backend, host="127.0.0.1", port=0):
+    handler = type("BoundJsonRpcHandler", (JsonRpcHandler,), {"backend": backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(backend, host="127.0.0.1", port=0):
+    """
+    Запускает сервер в фоновом потоке.
+    :param port: 0 — любой свободный порт.
+    :return: Кортеж (сервер, URL для ZabbixAPI).
+    """
+    server = make_server(backend, host, port)
+    thread = threading.Thread(target=server.serve_forever, name="fake-zabbix", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def load_hosts(args):
+    if args.dataset:
+        from snapshot import load_snapshot
+        return load_snapshot(args.dataset)
+    return generate_inventory(args.size, args.seed)[1]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Фейковый Zabbix JSON-RPC сервер для нагрузочных тестов.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--size", type=int, default=10000, help="Размер синтетического инвентаря.")
+    parser.add_argument("--dataset", help="Снимок хостов Zabbix (zabbix_hosts.json) вместо синтетики.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка каждого вызова, секунды.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунды.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля вызовов с ошибкой (0..1).")
+    parser.add_argument("--error-methods", nargs="+", help="Методы, к которым применяются ошибки.")
+    parser.add_argument("--api-token", help="Принимаемый API-токен.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    faults = FaultInjector(args.latency, args.jitter, args.error_rate, args.error_methods, args.seed)
+    backend = FakeZabbixBackend(load_hosts(args), faults, args.api_token)
+    server = make_server(backend, args.host, args.port)
+    print(f"Фейковый Zabbix API: http://{args.host}:{args.port} ({len(backend.model.hosts)} хостов)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(backend.stats.snapshot(), indent=4, ensure_ascii=False))
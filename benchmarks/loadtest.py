@@ -0,0 +1,152 @@
+"""
+Сквозной нагрузочный тест конвейера на фейковых бэкендах: фейковый
+Zabbix JSON-RPC сервер (fake_zabbix) и фейковые VCenter (fake_vcenter)
+вместо реальных. Выполняет этапы pipeline.py через обычные клиенты
+(pyzabbix по HTTP, pyVmomi) и выводит длительности этапов, число
+и объём запросов к каждому бэкенду на стороне сервера и клиента.
+
+Инвентарь делится между VCenter из VCENTERS (config.py); реальные
+подключения не выполняются. Инкрементальный экспорт VCenter не поддерживается.
+
+Запуск: python benchmarks/loadtest.py --size 100000 --zabbix-latency 0.02 --output loadtest.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_vcenter import FakeVCenterSessions, FakeVimStub
+from fake_zabbix import FakeZabbixBackend, start_server
+from synthetic import FaultInjector, generate_inventory
+
+import metrics
+import profiling
+import write_scheduler
+from pipeline import STAGES, PipelineContext, run_pipeline
+
+
+def build_vcenters(vcenters, vms, faults, measure_payload=True):
+    """
+    Раскладывает VM по фейковым VCenter по кругу.
+    :return: Словарь имя VCenter → FakeVimStub.
+    """
+    stubs = {}
+    for i, vcenter in enumerate(vcenters):
+        stubs[vcenter["host"]] = FakeVimStub(vms[i::len(vcenters)], faults, measure_payload)
+    return stubs
+
+
+def print_stats(title, stats):
+    print(title)
+    for method, item in sorted(stats.items()):
+        print(f"  {method:<60} вызовов {item['calls']:>7} ошибок {item['errors']:>5} "
+              f"запросы {item['request_bytes']:>12} Б ответы {item['response_bytes']:>12} Б")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест конвейера на фейковых бэкендах.")
+    parser.add_argument("--size", type=int, default=10000, help="Число VM в синтетическом инвентаре.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--zabbix-latency", type=float, default=0.0, help="Задержка вызова Zabbix API, секунды.")
+    parser.add_argument("--zabbix-jitter", type=float, default=0.0)
+    parser.add_argument("--zabbix-error-rate", type=float, default=0.0, help="Доля вызовов Zabbix API с ошибкой.")
+    parser.add_argument("--zabbix-error-methods", nargs="+", help="Методы Zabbix API, к которым применяются ошибки.")
+    parser.add_argument("--zabbix-error-message",
+                        help="Текст внедрённых ошибок (например, \"Database error: Deadlock found\" — временная).")
+    parser.add_argument("--write-rate", type=float, default=write_scheduler.ZABBIX_WRITE_RATE,
+                        help="Изменяющих вызовов Zabbix в секунду (0 — без ограничения).")
+    parser.add_argument("--write-concurrency", type=int, default=write_scheduler.ZABBIX_WRITE_MAX_CONCURRENCY,
+                        help="Максимум одновременных изменяющих вызовов.")
+    parser.add_argument("--vcenter-latency", type=float, default=0.0, help="Задержка вызова VCenter, секунды.")
+    parser.add_argument("--vcenter-jitter", type=float, default=0.0)
+    parser.add_argument("--vcenter-error-rate", type=float, default=0.0, help="Доля вызовов VCenter с ошибкой.")
+    parser.add_argument("--no-payload", action="store_true",
+                        help="Не считать объём ответов VCenter (сериализация замедляет фейковый VCenter).")
+    parser.add_argument("--log", action="store_true", help="Не подавлять логирование модулей.")
+    parser.add_argument("--output", help="Файл для результатов в JSON.")
+    parser.add_argument("--metrics", help="Файл для метрик запуска в формате Prometheus.")
+    parser.add_argument("--profile", metavar="DIR", help="Профилировать этапы, результаты — в каталог DIR.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.log:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    else:
+        logging.disable(logging.WARNING)
+
+    import export_vcenter
+    from zabbix_client import connect_to_zabbix
+
+    if export_vcenter.VCENTER_DELTA_EXPORT:
+        sys.exit("Нагрузочный тест не поддерживает VCENTER_DELTA_EXPORT = True.")
+
+    vms, zabbix_hosts = generate_inventory(args.size, args.seed)
+
+    backend = FakeZabbixBackend(zabbix_hosts, FaultInjector(
+        args.zabbix_latency, args.zabbix_jitter, args.zabbix_error_rate, args.zabbix_error_methods, args.seed,
+        args.zabbix_error_message
+    ))
+    server, url = start_server(backend)
+    stubs = build_vcenters(export_vcenter.VCENTERS, vms, FaultInjector(
+        args.vcenter_latency, args.vcenter_jitter, args.vcenter_error_rate, seed=args.seed
+    ), not args.no_payload)
+    sessions = FakeVCenterSessions(stubs)
+
+    zapi = connect_to_zabbix(url=url, user="loadtest", password="loadtest", api_token=None, session_cache=None)
+    ctx = PipelineContext(zapi=zapi, vcenter_sessions=sessions)
+    scheduler = write_scheduler.configure(rate=args.write_rate, max_concurrency=args.write_concurrency)
+
+    profiling.enable(args.profile)
+    started = time.perf_counter()
+    with profiling.session("loadtest"):
+        durations, ok = run_pipeline(args.stages, ctx=ctx)
+    seconds = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"Инвентарь: {len(vms)} VM, {len(zabbix_hosts)} хостов Zabbix, VCenter: {len(stubs)}")
+    print(f"Результат: {'успешно' if ok else 'ошибка'}, всего {seconds:.2f} с")
+    for stage, stage_seconds in durations.items():
+        print(f"  {stage:<20} {stage_seconds:10.3f} с")
+    writes = scheduler.snapshot()
+    print(f"Изменения Zabbix: выполнено {writes['completed']}, ошибок {writes['failed']}, "
+          f"повторов {writes['retries']}, предел параллельности {writes['concurrency']}, "
+          f"{writes['throughput']} вызовов/с")
+    print_stats("Zabbix (сервер):", backend.stats.snapshot())
+    for host, stats in sessions.stats().items():
+        print_stats(f"VCenter {host}:", stats)
+
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(metrics.registry.render())
+        print(f"Метрики сохранены в файл: {args.metrics}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "size": args.size,
+                "seed": args.seed,
+                "arguments": vars(args)
+            },
+            "ok": ok,
+            "seconds": round(seconds, 6),
+            "stages": {stage: round(stage_seconds, 6) for stage, stage_seconds in durations.items()},
+            "zabbix_server": backend.stats.snapshot(),
+            "zabbix_client": zapi.stats.snapshot(),
+            "zabbix_writes": writes,
+            "vcenters": sessions.stats()
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print(f"Результаты сохранены в файл: {args.output}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,264 @@
+"""
+Синтетические инвентари VCenter и Zabbix и счётчик вызовов API для бенчмарков.
+"""
+import random
+import threading
+import time
+
+
+def generate_inventory(size, seed=42):
+    """
+    Генерирует согласованные инвентари VCenter и Zabbix размера size.
+    VM: ~80% имён вида VW-XXX-suffix, ~5% _REP, ~3% temp-/Temp, остальные
+    произвольные; ~70% включены, ~10% без IP, ~2% с IP другой VM,
+    у ~5% второй сетевой адаптер.
+    Zabbix: хосты для ~80% VM (часть с другим статусом), немного хостов
+    без VM, у части хостов несколько интерфейсов; часть VM без хоста
+    представлена в Zabbix под другим именем по IP второго адаптера.
+    :return: Кортеж (vcenter_vms, zabbix_hosts) в формате снимков.
+    """
+    rnd = random.Random(seed)
+    vms = []
+    zabbix_hosts = []
+    ips = []
+
+    for i in range(size):
+        code = f"SWX{i:06d}"
+        kind = rnd.random()
+        if kind < 0.80:
+            name = f"VW-{code}-{rnd.choice(['a.miller', 'b.smith', 'svc', 'app', 'db'])}"
+        elif kind < 0.85:
+            name = f"{code}_REP"
+        elif kind < 0.865:
+            name = f"temp-{code}"
+        elif kind < 0.88:
+            name = f"Temp{code}"
+        else:
+            name = f"{code.lower()}.example.com"
+
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        roll = rnd.random()
+        if roll < 0.10:
+            vm_ip = None
+        elif roll < 0.12 and ips:
+            vm_ip = rnd.choice(ips)
+        else:
+            vm_ip = ip
+            ips.append(ip)
+
+        vm_ips = [vm_ip] if vm_ip else []
+        if i % 20 == 7:
+            vm_ips.append(f"10.{128 + ((i >> 16) & 127)}.{(i >> 8) & 255}.{i & 255}")
+
+        status = "poweredOn" if rnd.random() < 0.7 else "poweredOff"
+        vms.append({"host": name, "status": status, "ip": vm_ip, "ips": vm_ips})
+
+        if rnd.random() >= 0.8:
+            if len(vm_ips) > 1:
+                zabbix_hosts.append({"host": f"NIC{i:06d}", "status": "enabled", "ip": vm_ips[-1],
+                                     "ips": [vm_ips[-1]]})
+        else:
+            if rnd.random() < 0.9:
+                z_status = "enabled" if status == "poweredOn" else "disabled"
+            else:
+                z_status = "disabled" if status == "poweredOn" else "enabled"
+            host_ips = [vm_ip] if vm_ip else []
+            if rnd.random() < 0.05:
+                host_ips.append(f"192.168.{(i >> 8) & 255}.{i & 255}")
+            zabbix_hosts.append({
+                "host": code if name.startswith("VW-") else name,
+                "status": z_status,
+                "ip": host_ips[0] if host_ips else None,
+                "ips": host_ips
+            })
+
+    # Хосты Zabbix без VM
+    for i in range(size // 20):
+        zabbix_hosts.append({"host": f"ZBX{i:06d}", "status": "enabled", "ip": f"172.16.{(i >> 8) & 255}.{i & 255}",
+                             "ips": [f"172.16.{(i >> 8) & 255}.{i & 255}"]})
+
+    return vms, zabbix_hosts
+
+
+class InjectedError(Exception):
+    pass
+
+
+class FaultInjector:
+    """
+    Внедрение задержки и ошибок в фейковые бэкенды.
+    :param latency: Базовая задержка вызова, секунды.
+    :param jitter: Случайная добавка к задержке, от 0 до jitter секунд.
+    :param error_rate: Доля вызовов, завершающихся ошибкой (0..1).
+    :param methods: Методы, к которым применяются ошибки (None — ко всем).
+    :param message: Текст ошибки (например, "Database error: Deadlock found" —
+                    временная ошибка, которую планировщик изменений повторяет).
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, methods=None, seed=42, message=None):
+        self.latency = latency
+        self.message = message
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.methods = set(methods) if methods else None
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def __call__(self, method):
+        with self.lock:
+            delay = self.latency + (self.rnd.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate and self.rnd.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail and (self.methods is None or method in self.methods):
+            raise InjectedError(f"{self.message or 'Внедрённая ошибка'} в {method}")
+
+
+class RequestStats:
+    """
+    Потокобезопасный учёт запросов к фейковому бэкенду по методам:
+    количество, ошибки, байты запросов и ответов.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = {}
+
+    def record(self, method, request_bytes=0, response_bytes=0, error=False):
+        with self.lock:
+            stats = self.methods.setdefault(method, {
+                "calls": 0, "errors": 0, "request_bytes": 0, "response_bytes": 0
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["request_bytes"] += request_bytes
+            stats["response_bytes"] += response_bytes
+
+    def snapshot(self):
+        with self.lock:
+            return {method: dict(stats) for method, stats in self.methods.items()}
+
+    def total_calls(self):
+        with self.lock:
+            return sum(stats["calls"] for stats in self.methods.values())
+
+    def reset(self):
+        with self.lock:
+            self.methods = {}
+
+
+class _Method:
+    def __init__(self, api, name):
+        self.api = api
+        self.name = name
+
+    def __getattr__(self, method):
+        # Как в pyzabbix: позиционные аргументы передаются массивом параметров
+        return lambda *args, **kwargs: self.api.call(f"{self.name}.{method}", list(args) if args else kwargs)
+
+
+class CountingZabbixAPI:
+    """
+    Минимальная in-memory замена ZabbixAPI для бенчмарков: поддерживает
+    host.get, host.create, host.update, host.massupdate, hostgroup.get,
+    hostgroup.massadd, hostgroup.massremove и template.get и считает вызовы
+    по методам.
+    Используется и как модель данных фейкового JSON-RPC сервера.
+    """
+
+    def __init__(self, zabbix_hosts, group_id="100", group_share=0.5, seed=42):
+        rnd = random.Random(seed)
+        self.group_id = group_id
+        self.calls = {}
+        self.hosts = {}
+        for i, host in enumerate(zabbix_hosts):
+            groups = {"1"}
+            if rnd.random() < group_share:
+                groups.add(group_id)
+            self.hosts[host["host"]] = {
+                "hostid": str(10000 + i),
+                "host": host["host"],
+                "name": host["host"],
+                "status": "0" if host["status"] == "enabled" else "1",
+                "groups": groups,
+                "ips": host.get("ips") or ([host["ip"]] if host.get("ip") else [])
+            }
+        self.by_id = {host["hostid"]: host for host in self.hosts.values()}
+        self.next_id = 10000 + len(self.hosts)
+
+    def __getattr__(self, name):
+        return _Method(self, name)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def _render(self, host, params):
+        output = params.get("output", ["hostid"])
+        result = {key: host[key] for key in output if key in host}
+        if "selectGroups" in params:
+            result["groups"] = [{"groupid": group} for group in sorted(host["groups"])]
+        if "selectInterfaces" in params:
+            result["interfaces"] = [{"ip": ip} for ip in host["ips"]]
+        return result
+
+    def call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "host.get":
+            names = params.get("filter", {}).get("host")
+            if names is None:
+                hosts = self.hosts.values()
+            else:
+                names = [names] if isinstance(names, str) else names
+                hosts = [self.hosts[name] for name in names if name in self.hosts]
+            if params.get("groupids"):
+                wanted = set(params["groupids"])
+                hosts = [host for host in hosts if host["groups"] & wanted]
+            if params.get("hostids"):
+                hosts = [self.by_id[hostid] for hostid in params["hostids"] if hostid in self.by_id]
+            return [self._render(host, params) for host in hosts]
+        if method == "host.create":
+            # Как в Zabbix: массив создаётся целиком или не создаётся вовсе
+            params = params if isinstance(params, list) else [params]
+            names = [host["host"] for host in params]
+            for name in names:
+                if name in self.hosts or names.count(name) > 1:
+                    raise ValueError(f'Host with the same name "{name}" already exists.')
+            hostids = []
+            for host in params:
+                hostid = str(self.next_id)
+                self.next_id += 1
+                self.hosts[host["host"]] = self.by_id[hostid] = {
+                    "hostid": hostid,
+                    "host": host["host"],
+                    "name": host.get("name", host["host"]),
+                    "status": str(host.get("status", 0)),
+                    "groups": {group["groupid"] for group in host["groups"]},
+                    "ips": [interface["ip"] for interface in host.get("interfaces", []) if interface.get("ip")]
+                }
+                hostids.append(hostid)
+            return {"hostids": hostids}
+        if method == "template.get":
+            names = params.get("filter", {}).get("host") or []
+            return [{"templateid": str(20000 + i), "host": name} for i, name in enumerate(names)]
+        if method == "host.update":
+            host = self.by_id[params["hostid"]]
+            if "status" in params:
+                host["status"] = str(params["status"])
+            if "groups" in params:
+                host["groups"] = {group["groupid"] for group in params["groups"]}
+            return {"hostids": [params["hostid"]]}
+        if method == "host.massupdate":
+            for ref in params["hosts"]:
+                self.by_id[ref["hostid"]]["status"] = str(params["status"])
+            return {"hostids": [ref["hostid"] for ref in params["hosts"]]}
+        if method == "hostgroup.get":
+            return [{"groupid": self.group_id, "name": "vcenter_hosts"}]
+        if method == "hostgroup.massadd":
+            for ref in params["hosts"]:
+                self.by_id[ref["hostid"]]["groups"].update(group["groupid"] for group in params["groups"])
+            return {"groupids": [group["groupid"] for group in params["groups"]]}
+        if method == "hostgroup.massremove":
+            for hostid in params["hostids"]:
+                self.by_id[hostid]["groups"].difference_update(params["groupids"])
+            return {"groupids": params["groupids"]}
+        raise NotImplementedError(method)
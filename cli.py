@@ -0,0 +1,79 @@
+"""
+Единая точка входа для отдельных этапов синхронизации:
+
+    python cli.py export-vcenter
+    python cli.py export-zabbix
+    python cli.py compare
+    python cli.py compare-status
+    python cli.py sync-status
+    python cli.py sync-groups
+    python cli.py create-hosts
+    python cli.py plan [--dry-run] [--state FILE] [--actions status group]
+
+Модуль этапа (а вместе с ним pyVmomi, pyzabbix, requests и config.py)
+импортируется только после выбора подкоманды, поэтому офлайн-сравнения
+снимков запускаются без загрузки клиентов бэкендов.
+Время запуска измеряется скриптом benchmarks/bench_startup.py.
+"""
+import argparse
+import importlib
+import sys
+
+# Подкоманда → (модуль этапа, имя файла лога, описание)
+COMMANDS = {
+    "export-vcenter": ("export_vcenter", "vcenter_vm_export", "Выгрузить VM из VCenter в vcenter_vms.json."),
+    "export-zabbix": ("export_zabbix", "zabbix_export_hosts", "Выгрузить хосты Zabbix в zabbix_hosts.json."),
+    "compare": ("compare_hosts", "zabbix_missing_hosts", "Найти VM, отсутствующие в Zabbix (missing_hosts.json)."),
+    "compare-status": ("compare_hosts_status", "zabbix_vm_sync",
+                       "Найти хосты с несовпадающим статусом (mismatched_hosts.json)."),
+    "sync-status": ("zabbix_host_status_manager", "status_manager",
+                    "Изменить статусы хостов Zabbix по mismatched_hosts.json."),
+    "sync-groups": ("zabbix_add_hosts_to_group", "add_hosts_to_group",
+                    "Добавить включённые VM в группу 'vcenter_hosts'."),
+    "create-hosts": ("zabbix_create_hosts", "create_hosts", "Создать в Zabbix хосты из missing_hosts.json."),
+    "plan": ("planner", "planner", "Построить и выполнить план исправлений (только изменения)."),
+}
+
+# Подкоманды со своими аргументами: они передаются в main(argv) модуля
+FORWARD_ARGS = ("plan",)
+
+
+def load(command):
+    """
+    Импортирует модуль этапа и возвращает его функцию main.
+    """
+    module_name = COMMANDS[command][0]
+    return importlib.import_module(module_name).main
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Синхронизация VCenter и Zabbix: отдельные этапы.")
+    parser.add_argument("--profile", metavar="DIR", help="Профилировать этап, результаты — в каталог DIR.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, (_, _, help_text) in COMMANDS.items():
+        # --help таких подкоманд выводит парсер аргументов самого модуля
+        commands.add_parser(command, help=help_text, description=help_text, add_help=command not in FORWARD_ARGS)
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in FORWARD_ARGS:
+        parser.error(f"неизвестные аргументы: {' '.join(extra)}")
+    args.args = extra
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Логирование настраивается до импорта модуля этапа
+    from log_setup import setup_logging
+    setup_logging(COMMANDS[args.command][1])
+    if args.profile:
+        import profiling
+        profiling.enable(args.profile)
+    if args.command in FORWARD_ARGS:
+        load(args.command)(args.args)
+    else:
+        load(args.command)()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
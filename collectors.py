@@ -0,0 +1,44 @@
+import logging
+import threading
+import time
+
+import profiling
+
+
+def run_collectors(collectors):
+    """
+    Запускает сборщики параллельно, каждый в своём потоке.
+    :param collectors: Словарь {имя: (функция, таймаут в секундах)}.
+    :return: Словарь {имя: результат}; для упавшего или не уложившегося
+             в таймаут сборщика результат равен None.
+    Ошибка или зависание одного сборщика не мешает остальным.
+    Потоки — daemon, поэтому зависший бэкенд не задерживает выход из программы.
+    """
+    results = {}
+    timings = {}
+
+    def worker(name, func):
+        started = time.monotonic()
+        try:
+            results[name] = func()
+        except Exception as e:
+            logging.error(f"Сборщик '{name}' завершился с ошибкой: {e}")
+        finally:
+            timings[name] = time.monotonic() - started
+
+    started = time.monotonic()
+    threads = {}
+    for name, (func, _) in collectors.items():
+        thread = threading.Thread(target=profiling.profiled(worker), args=(name, func), name=name, daemon=True)
+        thread.start()
+        threads[name] = thread
+
+    for name, thread in threads.items():
+        timeout = collectors[name][1]
+        thread.join(max(0.0, started + timeout - time.monotonic()))
+        if thread.is_alive():
+            logging.error(f"Сборщик '{name}' не уложился в таймаут {timeout} с")
+        else:
+            logging.info(f"Сборщик '{name}' завершён за {timings[name]:.2f} с")
+
+    return {name: results.get(name) if not threads[name].is_alive() else None for name in collectors}
@@ -1,30 +1,20 @@
 import json
-import re
-import os
 import logging
 
-# Настройка логирования
-log_dir = "/var/log/zabbix"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "zabbix_scripts_zabbix_missing_hosts.log")
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+import metrics
+import profiling
+from host_index import HostIndex
+from host_rules import get_default_rules
+from log_setup import EventSummary, setup_logging
+from snapshot import iter_snapshot, load_snapshot
 
 
 def load_from_file(filename):
     """
-    Загружает данные из файла в формате JSON.
+    Загружает данные из файла в формате JSON или NDJSON (в т.ч. сжатого gzip).
     """
     try:
-        with open(filename, "r") as f:
-            data = json.load(f)
+        data = load_snapshot(filename)
         logging.info(f"Файл успешно загружен: {filename}")
         return data
     except Exception as e:
@@ -32,60 +22,55 @@ def load_from_file(filename):
         raise
 
 
-def normalize_hostname(vcenter_name):
-    """
-    Нормализует имя хоста из VCenter для сравнения с именами в Zabbix.
-    Например, преобразует 'VW-SWX002-a.miller' в 'SWX002'.
-    """
-    match = re.search(r"VW-(\w+)-", vcenter_name)
-    if match:
-        normalized = match.group(1)
-        logging.debug(f"Нормализовано имя '{vcenter_name}' → '{normalized}'")
-        return normalized
-    logging.debug(f"Имя без нормализации: {vcenter_name}")
-    return vcenter_name
-
-
-def find_missing_hosts(vcenter_vms, zabbix_hosts_dict):
+def find_missing_hosts(vcenter_vms, zabbix_hosts_dict, rules=None):
     """
     Сравнивает данные из VCenter и Zabbix и возвращает список хостов, которых нет в Zabbix.
-    Исключает poweredOff и фильтруемые по имени.
+    Исключает poweredOff и фильтруемые по имени. VM считается найденной,
+    если в Zabbix есть хост с её нормализованным именем или любым из её IP
+    (поле "ips", для старых снимков — "ip") в диапазонах HOST_IP_INCLUDE/HOST_IP_EXCLUDE.
+    zabbix_hosts_dict — словарь host → [ip] или готовый HostIndex.
+    rules — HostRules с шаблонами исключения и нормализации (по умолчанию из config.py).
     """
     missing_hosts = []
+    rules = rules or get_default_rules()
+    # Сводка вместо строки лога на каждую VM (подробно — на уровне DEBUG)
+    summary = EventSummary("Сравнение с Zabbix")
 
-    exclude_patterns = [
-        r"_REP$", r"^temp-", r"^Temp"
-    ]
-
-    all_zabbix_ips = {ip for ip_list in zabbix_hosts_dict.values() for ip in ip_list}
-    known_hosts = set(zabbix_hosts_dict.keys())
+    if isinstance(zabbix_hosts_dict, HostIndex):
+        index = zabbix_hosts_dict
+    else:
+        index = HostIndex.from_ip_map(zabbix_hosts_dict)
 
     for vm in vcenter_vms:
         vm_name = vm.get("host")
         vm_ip = vm.get("ip")
+        vm_ips = HostIndex.host_ips(vm)
         vm_status = vm.get("status")
 
         if not vm_name or not vm_status:
-            logging.warning(f"Пропущена VM из-за неполных данных: {vm}")
+            summary.add("пропущены VM с неполными данными", vm, logging.WARNING)
             continue
 
         if vm_status == "poweredOff":
-            logging.info(f"Пропущен выключенный хост: {vm_name}")
+            summary.add("пропущены выключенные хосты", vm_name)
             continue
 
-        if any(re.search(pattern, vm_name) for pattern in exclude_patterns):
-            logging.info(f"Хост исключён по шаблону: {vm_name}")
+        if rules.is_excluded(vm_name):
+            summary.add("исключены по шаблону", vm_name)
             continue
 
-        normalized_name = normalize_hostname(vm_name)
+        normalized_name = rules.normalize(vm_name)
 
-        if normalized_name not in known_hosts and (not vm_ip or vm_ip not in all_zabbix_ips):
+        if not index.has_normalized(normalized_name) and not index.has_any_ip(vm_ips):
             missing_hosts.append({
                 "host": vm_name,
-                "ip": vm_ip
+                "ip": vm_ip,
+                "ips": vm_ips
             })
-            logging.info(f"Найден отсутствующий хост: {vm_name} ({vm_ip})")
+            summary.add("найдены отсутствующие хосты", f"{vm_name} ({vm_ip})")
 
+    summary.log()
+    metrics.gauge("missing_hosts", len(missing_hosts))
     logging.info(f"Всего отсутствующих хостов: {len(missing_hosts)}")
     return missing_hosts
 
@@ -103,23 +88,37 @@ def save_to_file(data, filename):
         raise
 
 
-if __name__ == "__main__":
-    try:
-        vcenter_vms = load_from_file("vcenter_vms.json")
-        zabbix_hosts_list = load_from_file("zabbix_hosts.json")
+def build_zabbix_ip_map(zabbix_hosts_list):
+    """
+    Преобразует список Zabbix-хостов в словарь: host → [ip] (все IP интерфейсов).
+    """
+    return {
+        host["host"]: HostIndex.host_ips(host)
+        for host in zabbix_hosts_list if "host" in host
+    }
+
 
-        # Преобразуем список Zabbix-хостов в словарь: host → [ip]
-        zabbix_hosts = {
-            host["host"]: [host["ip"]] if host.get("ip") else []
-            for host in zabbix_hosts_list if "host" in host
-        }
+def main():
+    """
+    Находит VM, отсутствующие в Zabbix, и сохраняет их в missing_hosts.json.
+    """
+    try:
+        with metrics.job("compare"), profiling.job("compare"):
+            # Индекс строится и VM сравниваются потоково, без загрузки снимков целиком
+            zabbix_hosts = HostIndex.from_hosts(iter_snapshot("zabbix_hosts.json"))
+            logging.info(f"Файл успешно загружен: zabbix_hosts.json ({len(zabbix_hosts)} хостов)")
 
-        missing_hosts = find_missing_hosts(vcenter_vms, zabbix_hosts)
+            missing_hosts = find_missing_hosts(iter_snapshot("vcenter_vms.json"), zabbix_hosts)
 
-        print("Хосты, которых нет в Zabbix:")
-        print(json.dumps(missing_hosts, indent=4, ensure_ascii=False))
+            print("Хосты, которых нет в Zabbix:")
+            print(json.dumps(missing_hosts, indent=4, ensure_ascii=False))
 
-        save_to_file(missing_hosts, "missing_hosts.json")
+            save_to_file(missing_hosts, "missing_hosts.json")
 
     except Exception as e:
         logging.critical(f"Скрипт завершился с ошибкой: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("zabbix_missing_hosts")
+    main()
@@ -1,25 +1,17 @@
 import json
-import re
 import logging
-import os
 
-# Создание директории для логов в локальной папке
-log_dir = "/var/log/zabbix"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "zabbix_scripts_zabbix_vm_sync.log")
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
+import metrics
+import profiling
+from host_index import HostIndex
+from host_rules import normalize_hostname
+from log_setup import setup_logging
+from snapshot import iter_snapshot, load_snapshot
 
 
 def load_from_file(filename):
     try:
-        with open(filename, "r") as f:
-            data = json.load(f)
+        data = load_snapshot(filename)
         logging.info(f"Файл успешно загружен: {filename}")
         return data
     except Exception as e:
@@ -27,19 +19,12 @@ def load_from_file(filename):
         raise
 
 
-def normalize_hostname(vcenter_name):
-    match = re.search(r"VW-(\w+)-", vcenter_name)
-    if match:
-        normalized = match.group(1)
-        logging.debug(f"Нормализовано имя '{vcenter_name}' → '{normalized}'")
-        return normalized
-    logging.debug(f"Имя без нормализации: {vcenter_name}")
-    return vcenter_name
-
-
 def find_mismatched_hosts(vcenter_vms, zabbix_hosts):
     mismatched_hosts = []
-    zabbix_index = {host["host"]: host for host in zabbix_hosts}
+    if isinstance(zabbix_hosts, HostIndex):
+        zabbix_index = zabbix_hosts
+    else:
+        zabbix_index = HostIndex.from_hosts(zabbix_hosts)
 
     for vm in vcenter_vms:
         vm_name = vm.get("host")
@@ -52,8 +37,10 @@ def find_mismatched_hosts(vcenter_vms, zabbix_hosts):
 
         normalized_name = normalize_hostname(vm_name)
 
-        if normalized_name in zabbix_index:
-            zabbix_host = zabbix_index[normalized_name]
+        matches = zabbix_index.lookup_normalized(normalized_name)
+        if matches:
+            # При дублировании имён учитывается последний хост, как и раньше
+            zabbix_host = matches[-1]
             z_status = zabbix_host.get("status")
 
             if (vm_status == "poweredOff" and z_status == "enabled") or \
@@ -65,6 +52,7 @@ def find_mismatched_hosts(vcenter_vms, zabbix_hosts):
                     "vmware_status": vm_status,
                     "zabbix_status": z_status
                 })
+    metrics.gauge("mismatched_hosts", len(mismatched_hosts))
     logging.info(f"Обнаружено {len(mismatched_hosts)} хостов с несоответствием статусов.")
     return mismatched_hosts
 
@@ -79,17 +67,28 @@ def save_to_file(data, filename):
         raise
 
 
-if __name__ == "__main__":
+def main():
+    """
+    Находит хосты с несовпадающим статусом и сохраняет их в mismatched_hosts.json.
+    """
     try:
-        vcenter_vms = load_from_file("vcenter_vms.json")
-        zabbix_hosts = load_from_file("zabbix_hosts.json")
+        with metrics.job("compare-status"), profiling.job("compare-status"):
+            # Индекс строится и VM сравниваются потоково, без загрузки снимков целиком
+            zabbix_hosts = HostIndex.from_hosts(iter_snapshot("zabbix_hosts.json"))
+            logging.info(f"Файл успешно загружен: zabbix_hosts.json ({len(zabbix_hosts)} хостов)")
+            vcenter_vms = iter_snapshot("vcenter_vms.json")
 
-        mismatched_hosts = find_mismatched_hosts(vcenter_vms, zabbix_hosts)
+            mismatched_hosts = find_mismatched_hosts(vcenter_vms, zabbix_hosts)
 
-        print("Хосты с несоответствием статусов между VCenter и Zabbix:")
-        print(json.dumps(mismatched_hosts, indent=4, ensure_ascii=False))
+            print("Хосты с несоответствием статусов между VCenter и Zabbix:")
+            print(json.dumps(mismatched_hosts, indent=4, ensure_ascii=False))
 
-        save_to_file(mismatched_hosts, "mismatched_hosts.json")
+            save_to_file(mismatched_hosts, "mismatched_hosts.json")
 
     except Exception as e:
         logging.error(f"Произошла критическая ошибка выполнения: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("zabbix_vm_sync")
+    main()
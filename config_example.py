@@ -6,4 +6,147 @@ VCENTER_PASSWORD = "password"
 # Настройки для подключения к Zabbix
 ZABBIX_URL = "http://zabbix.example.com/zabbix"
 ZABBIX_USER = "Admin"
-ZABBIX_PASSWORD = "zabbix"
\ No newline at end of file
+ZABBIX_PASSWORD = "zabbix"
+
+# Постраничное получение свойств VM через PropertyCollector
+VCENTER_BULK_RETRIEVE = True
+VCENTER_PAGE_SIZE = 1000
+
+# Инкрементальный экспорт VM (WaitForUpdatesEx). Сессия VCenter сохраняется
+# между запусками, поэтому интервал запуска должен быть меньше таймаута сессии.
+VCENTER_DELTA_EXPORT = False
+VCENTER_DELTA_STATE_FILE = "vcenter_delta_state.json"
+
+# Размер пакета для массовых операций Zabbix API (host.massupdate и т.п.)
+ZABBIX_BATCH_SIZE = 500
+
+# Удалять из группы vcenter_hosts хосты, VM которых больше нет в VCenter
+ZABBIX_GROUP_REMOVE_STALE = False
+# Удаление пропускается целиком, если удалить пришлось бы больше этой доли
+# хостов группы (защита от пустого или неполного vcenter_vms.json)
+ZABBIX_GROUP_REMOVE_MAX_RATIO = 0.5
+
+# Таймауты параллельного сбора данных в main.py (секунды)
+VCENTER_TIMEOUT = 1800
+ZABBIX_TIMEOUT = 600
+
+# Правила имён хостов: шаблоны исключения VM и правила нормализации
+# (шаблон, замена) — применяется первое совпавшее правило.
+HOST_EXCLUDE_PATTERNS = [r"_REP$", r"^temp-", r"^Temp"]
+HOST_NORMALIZE_RULES = [(r"VW-(\w+)-", r"\1")]
+HOST_RULES_CACHE_SIZE = 262144
+
+# Сопоставление VM и хостов Zabbix по IP: учитываются все адреса адаптеров VM
+# (guest.net) и все интерфейсы хоста. Диапазоны CIDR: пустой HOST_IP_INCLUDE —
+# все адреса; адреса из HOST_IP_EXCLUDE не сопоставляются.
+HOST_IP_INCLUDE = []  # например, ["10.0.0.0/8", "192.168.0.0/16"]
+HOST_IP_EXCLUDE = ["127.0.0.0/8", "169.254.0.0/16", "::1/128", "fe80::/10"]
+
+# Формат снимков vcenter_vms.json/zabbix_hosts.json: "json" или "ndjson"
+# (одна запись на строку, потоковая запись и чтение). При SNAPSHOT_COMPRESS
+# снимок сжимается gzip (к имени добавляется .gz); при чтении всё определяется автоматически.
+SNAPSHOT_FORMAT = "json"
+SNAPSHOT_COMPRESS = False
+
+# Хранилище снимков и истории запусков в SQLite (None — отключено)
+INVENTORY_DB = None
+INVENTORY_RETENTION_RUNS = 500
+INVENTORY_RETENTION_DAYS = 90
+# Устаревшие запуски удаляются при экспорте не чаще раза в INVENTORY_PRUNE_INTERVAL
+# часов (None — только командой prune); VACUUM — только если свободных страниц
+# больше INVENTORY_VACUUM_FREELIST_RATIO
+INVENTORY_PRUNE_INTERVAL = 24
+INVENTORY_VACUUM = True
+INVENTORY_VACUUM_FREELIST_RATIO = 0.25
+
+# Постраничная параллельная выгрузка хостов из Zabbix и серверные фильтры
+ZABBIX_EXPORT_PAGE_SIZE = 1000
+ZABBIX_EXPORT_WORKERS = 4
+ZABBIX_EXPORT_GROUPS = []  # например, ["vcenter_hosts"]
+ZABBIX_EXPORT_TAGS = []  # например, [{"tag": "source", "value": "vcenter", "operator": 1}]
+
+# Общий клиент Zabbix API: API-токен (если задан, логин/пароль не нужны),
+# кэш сессии между запусками и пул HTTP-соединений
+ZABBIX_API_TOKEN = None
+ZABBIX_SESSION_CACHE = "~/.zabbix_scripts_session"
+ZABBIX_HTTP_POOL_SIZE = 16
+ZABBIX_HTTP_TIMEOUT = 60
+
+# Несколько VCenter: выгружаются параллельно, у каждой VM сохраняется источник.
+# Если список задан, VCENTER_HOST/VCENTER_USER/VCENTER_PASSWORD не используются.
+# VCENTERS = [
+#     {"host": "vcenter1.example.com", "user": "username", "password": "password"},
+#     {"host": "vcenter2.example.com", "user": "username", "password": "password"},
+# ]
+# VM с одинаковым именем в разных VCenter: "keep", "first" или "prefer_powered_on"
+VCENTER_DUPLICATE_POLICY = "prefer_powered_on"
+
+# Демон синхронизации (sync_daemon.py) и общий файл блокировки запусков
+DAEMON_INTERVAL = 300
+DAEMON_JITTER = 30
+DAEMON_MAX_BACKOFF = 3600
+DAEMON_SUMMARY_FILE = "/var/log/zabbix/zabbix_scripts_sync_summary.jsonl"
+PIPELINE_LOCK_FILE = "/tmp/zabbix_scripts_sync.lock"
+
+# Метрики: файлы для textfile collector node_exporter (zabbix_scripts_<этап>.prom)
+# и/или отправка trapper-элементов в Zabbix (ключи zabbix_scripts.<метрика>[<метки>])
+METRICS_TEXTFILE_DIR = None  # например, "/var/lib/node_exporter/textfile_collector"
+METRICS_ZABBIX_SERVER = None  # например, "zabbix.example.com"
+METRICS_ZABBIX_PORT = 10051
+METRICS_ZABBIX_HOST = "zabbix_scripts"
+
+# Профилирование (по умолчанию выключено): cProfile по этапам, трассировка
+# вызовов VCenter/Zabbix и сводка горячих точек в подкаталогах PROFILE_DIR.
+# pipeline.py и sync_daemon.py включают его также флагом --profile DIR.
+PROFILE_DIR = None  # например, "/tmp/zabbix_scripts_profiles"
+PROFILE_TOP = 25
+PROFILE_TRACE_LIMIT = 100000
+
+# Логирование: файлы zabbix_scripts_<скрипт>.log в LOG_DIR, запись в фоновом потоке.
+# События по отдельным хостам сводятся в счётчики с примерами (LOG_SAMPLE_SIZE),
+# полностью они пишутся только при LOG_LEVEL = "DEBUG".
+LOG_DIR = "/var/log/zabbix"
+LOG_LEVEL = "INFO"
+LOG_SAMPLE_SIZE = 5
+
+# План исправлений (planner.py, python cli.py plan --dry-run): изменения вычисляются
+# по снимкам и последнему применённому состоянию, к Zabbix уходят только они.
+# В pipeline.py и sync_daemon.py включается REMEDIATION_PLANNER = True
+# (удаление устаревших хостов из группы в этом режиме не выполняется).
+REMEDIATION_PLANNER = False
+REMEDIATION_STATE_FILE = "remediation_state.json"
+# hostid и членство в группе из состояния сверяются с Zabbix заново раз в
+# REMEDIATION_STATE_TTL секунд (хост могли удалить из группы или пересоздать)
+REMEDIATION_STATE_TTL = 86400
+# Журнал пакетов изменения статусов и групп (только дозапись): после сбоя или
+# потери сессии следующий запуск с теми же входными данными продолжает
+# с последнего выполненного пакета. После успешного запуска журнал сжимается.
+# У каждого действия свой файл (remediation_journal.status.jsonl и т.д.).
+REMEDIATION_JOURNAL = "remediation_journal.jsonl"  # None — не вести журнал
+# Прерванный запуск старше REMEDIATION_JOURNAL_MAX_AGE секунд не продолжается,
+# а планируется заново (hostid в журнале могли устареть)
+REMEDIATION_JOURNAL_MAX_AGE = 21600
+
+# Создание отсутствующих хостов (python cli.py create-hosts или этап create-hosts
+# конвейера, который выполняется только если указан явно в --stages/DAEMON_STAGES).
+# Хост создаётся с нормализованным именем и агентским интерфейсом по IP VM.
+ZABBIX_CREATE_GROUPS = ["vcenter_hosts"]
+ZABBIX_CREATE_TEMPLATES = []  # например, ["Linux by Zabbix agent"]
+ZABBIX_CREATE_STATUS = 0  # 0 - enabled, 1 - disabled
+ZABBIX_CREATE_AGENT_PORT = "10050"
+ZABBIX_CREATE_BATCH_SIZE = 100
+
+# Общий планировщик изменяющих вызовов Zabbix API (статусы, группы, создание хостов):
+# не более ZABBIX_WRITE_RATE вызовов в секунду (с запасом ZABBIX_WRITE_BURST),
+# число одновременных вызовов подбирается от MIN до MAX по задержке (выше
+# ZABBIX_WRITE_TARGET_LATENCY секунд — перегрузка) и ошибкам. Временные ошибки
+# (сеть, HTTP 5xx, блокировки БД) повторяются до ZABBIX_WRITE_RETRIES раз
+# со случайной экспоненциальной задержкой.
+ZABBIX_WRITE_RATE = 10.0
+ZABBIX_WRITE_BURST = 5
+ZABBIX_WRITE_MIN_CONCURRENCY = 1
+ZABBIX_WRITE_MAX_CONCURRENCY = 8
+ZABBIX_WRITE_TARGET_LATENCY = 2.0
+ZABBIX_WRITE_RETRIES = 3
+ZABBIX_WRITE_BACKOFF = 0.5
+ZABBIX_WRITE_BACKOFF_MAX = 30.0
@@ -1,98 +1,410 @@
 import atexit
-import json
 import ssl
 import logging
-import os
-from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
+from pyVim.connect import SmartConnect, SmartStubAdapter, Disconnect
+from pyVmomi import vim, vmodl
+
+import metrics
+import profiling
+from collectors import run_collectors
+from inventory_store import record_snapshot
+from log_setup import EventSummary, setup_logging
+from snapshot import SnapshotWriter, iter_snapshot, save_snapshot
 
 # Импорт настроек из config.py
-from config import VCENTER_HOST, VCENTER_USER, VCENTER_PASSWORD
+import config
 
-# Настройка логирования
-log_dir = "/var/log/zabbix"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "zabbix_scripts_vcenter_vm_export.log")
+# Список VCenter: [{"host", "user", "password"}]; по умолчанию — один VCENTER_HOST
+VCENTERS = getattr(config, "VCENTERS", None) or [{
+    "host": config.VCENTER_HOST,
+    "user": config.VCENTER_USER,
+    "password": config.VCENTER_PASSWORD
+}]
+# Таймаут выгрузки одного VCenter при параллельном сборе (секунды)
+VCENTER_TIMEOUT = getattr(config, "VCENTER_TIMEOUT", 1800)
+# Обработка VM с одинаковым именем в разных VCenter:
+# "keep" — оставить все, "first" — первую по порядку VCENTERS,
+# "prefer_powered_on" — включённую (иначе первую)
+VCENTER_DUPLICATE_POLICY = getattr(config, "VCENTER_DUPLICATE_POLICY", "prefer_powered_on")
+DUPLICATE_POLICIES = ("keep", "first", "prefer_powered_on")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+# Необязательные настройки с значениями по умолчанию
+VCENTER_BULK_RETRIEVE = getattr(config, "VCENTER_BULK_RETRIEVE", True)
+VCENTER_PAGE_SIZE = getattr(config, "VCENTER_PAGE_SIZE", 1000)
+VCENTER_DELTA_EXPORT = getattr(config, "VCENTER_DELTA_EXPORT", False)
+VCENTER_DELTA_STATE_FILE = getattr(config, "VCENTER_DELTA_STATE_FILE", "vcenter_delta_state.json")
 
+# Свойства VM, которые запрашиваются у PropertyCollector
+# (guest.net — адреса всех сетевых адаптеров гостевой ОС)
+VM_PROPERTIES = ["name", "runtime.powerState", "guest.ipAddress", "guest.net"]
 
-def get_vms_from_vcenter():
-    """
-    Получает список виртуальных машин и их параметров из VCenter.
-    Экспортирует данные в формате: host, status (poweredOn/poweredOff), ip.
-    """
+
+def _ssl_context():
     context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
     context.check_hostname = False
     context.verify_mode = ssl.CERT_NONE
+    return context
 
-    try:
+
+def connect_to_vcenter(disconnect_on_exit=True, vcenter=None):
+    """
+    Подключается к VCenter и возвращает ServiceInstance.
+    Отключение регистрируется через atexit, если disconnect_on_exit=True.
+    :param vcenter: Параметры VCenter из VCENTERS (по умолчанию первый).
+    """
+    vcenter = vcenter or VCENTERS[0]
+    with profiling.traced("vcenter", "SmartConnect"):
         si = SmartConnect(
-            host=VCENTER_HOST,
-            user=VCENTER_USER,
-            pwd=VCENTER_PASSWORD,
-            sslContext=context
+            host=vcenter["host"],
+            user=vcenter["user"],
+            pwd=vcenter["password"],
+            sslContext=_ssl_context()
         )
+    if disconnect_on_exit:
         atexit.register(Disconnect, si)
-        logging.info(f"Успешное подключение к VCenter: {VCENTER_HOST}")
+    logging.info(f"Успешное подключение к VCenter: {vcenter['host']}")
+    return si
+
+
+class VCenterSessions:
+    """
+    Кэш открытых сессий VCenter для долгоживущих процессов.
+    Сессия переиспользуется, пока жива, и открывается заново, если истекла.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get(self, vcenter):
+        si = self.sessions.get(vcenter["host"])
+        if si is not None:
+            try:
+                if si.content.sessionManager.currentSession is not None:
+                    return si
+            except Exception as e:
+                logging.warning(f"Сессия VCenter {vcenter['host']} недоступна: {e}")
+            logging.info(f"Повторное подключение к VCenter: {vcenter['host']}")
+        si = connect_to_vcenter(vcenter=vcenter)
+        self.sessions[vcenter["host"]] = si
+        return si
+
+
+def resume_vcenter_session(session_cookie, vcenter=None):
+    """
+    Восстанавливает ранее открытую сессию VCenter по cookie.
+    Возвращает ServiceInstance или None, если сессия уже истекла.
+    """
+    vcenter = vcenter or VCENTERS[0]
+    stub = SmartStubAdapter(host=vcenter["host"], sslContext=_ssl_context())
+    stub.cookie = session_cookie
+    si = vim.ServiceInstance("ServiceInstance", stub)
+    try:
+        if si.content.sessionManager.currentSession is None:
+            return None
+    except vim.fault.NotAuthenticated:
+        return None
+    logging.info(f"Восстановлена сессия VCenter: {vcenter['host']}")
+    return si
+
+
+def build_vm_filter_spec(view, properties=None):
+    """
+    Строит FilterSpec для PropertyCollector: обход ContainerView
+    через TraversalSpec и выборка только нужных свойств VirtualMachine.
+    """
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+        name="traverseEntities",
+        path="view",
+        skip=False,
+        type=vim.view.ContainerView
+    )
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(
+        obj=view,
+        skip=True,
+        selectSet=[traversal_spec]
+    )
+    prop_spec = vmodl.query.PropertyCollector.PropertySpec(
+        type=vim.VirtualMachine,
+        pathSet=properties or VM_PROPERTIES,
+        all=False
+    )
+    return vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[obj_spec],
+        propSet=[prop_spec]
+    )
+
+
+def iter_vm_properties(si, properties=None, page_size=VCENTER_PAGE_SIZE):
+    """
+    Постранично получает свойства всех VM одним проходом
+    RetrievePropertiesEx/ContinueRetrievePropertiesEx.
+    Возвращает генератор пар (moref VM, словарь свойств).
+    """
+    content = si.RetrieveContent()
+    view = content.viewManager.CreateContainerView(
+        content.rootFolder, [vim.VirtualMachine], True
+    )
+    collector = content.propertyCollector
+    try:
+        filter_spec = build_vm_filter_spec(view, properties)
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+
+        with metrics.timed("vcenter_api_request_seconds", method="RetrievePropertiesEx"), \
+                profiling.traced("vcenter", "RetrievePropertiesEx"):
+            result = collector.RetrievePropertiesEx([filter_spec], options)
+        pages = 0
+        while result:
+            pages += 1
+            for obj in result.objects:
+                yield obj.obj, {prop.name: prop.val for prop in obj.propSet}
+            if not result.token:
+                break
+            with metrics.timed("vcenter_api_request_seconds", method="ContinueRetrievePropertiesEx"), \
+                    profiling.traced("vcenter", "ContinueRetrievePropertiesEx"):
+                result = collector.ContinueRetrievePropertiesEx(result.token)
+        logging.debug(f"PropertyCollector: получено страниц: {pages}")
+    finally:
+        view.Destroy()
+
+
+def nic_ips(nics):
+    """
+    Все IP сетевых адаптеров гостевой ОС (guest.net) без повторов.
+    Принимает список GuestNicInfo или уже извлечённых адресов (снимок vcenter_delta).
+    """
+    ips = []
+    for nic in nics or []:
+        addresses = [nic] if isinstance(nic, str) else (getattr(nic, "ipAddress", None) or [])
+        for ip in addresses:
+            if ip and ip not in ips:
+                ips.append(ip)
+    return ips
+
+
+def guest_ips(primary_ip, nics):
+    """
+    IP VM для экспорта: основной адрес (guest.ipAddress) первым, затем адреса всех адаптеров.
+    :return: Кортеж (основной IP или None, список всех IP).
+    """
+    ips = nic_ips(nics)
+    if primary_ip:
+        ips = [primary_ip] + [ip for ip in ips if ip != primary_ip]
+    return (ips[0] if ips else None), ips
+
+
+def vm_record(props):
+    """
+    Преобразует свойства VM из PropertyCollector в запись экспорта.
+    """
+    ip, ips = guest_ips(props.get("guest.ipAddress"), props.get("guest.net"))
+    return {
+        "host": props.get("name"),
+        "status": props.get("runtime.powerState"),
+        "ip": ip,
+        "ips": ips
+    }
+
+
+def get_vms_from_vcenter(bulk=VCENTER_BULK_RETRIEVE, page_size=VCENTER_PAGE_SIZE, vcenter=None):
+    """
+    Получает список виртуальных машин и их параметров из VCenter.
+    Экспортирует данные в формате: host, status (poweredOn/poweredOff), ip, ips.
+    При bulk=True свойства всех VM запрашиваются постранично через
+    PropertyCollector, иначе — по одной VM (медленно, один SOAP-запрос на свойство).
+    """
+    try:
+        si = connect_to_vcenter(vcenter=vcenter)
     except Exception as e:
         logging.error(f"Не удалось подключиться к VCenter: {e}")
         return []
 
-    vms = []
     try:
-        content = si.RetrieveContent()
-        container = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.VirtualMachine], True
-        )
+        vms = list(iter_vms(si, bulk=bulk, page_size=page_size))
+        logging.info(f"Успешно получено {len(vms)} виртуальных машин.")
+        return vms
+    except Exception as e:
+        logging.error(f"Ошибка при извлечении данных о VM: {e}")
+        return []
+
+
+def iter_vms(si, bulk=VCENTER_BULK_RETRIEVE, page_size=VCENTER_PAGE_SIZE):
+    """
+    Генератор записей VM (host, status, ip, ips) по мере их получения из VCenter.
+    """
+    # Строка лога на каждую VM формируется только на уровне DEBUG
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    if bulk:
+        for _, props in iter_vm_properties(si, page_size=page_size):
+            vm = vm_record(props)
+            if debug:
+                logging.debug(f"VM: {vm['host']}, status: {vm['status']}, ip: {vm['ip']}")
+            yield vm
+        return
 
+    content = si.RetrieveContent()
+    container = content.viewManager.CreateContainerView(
+        content.rootFolder, [vim.VirtualMachine], True
+    )
+
+    errors = EventSummary("Выгрузка VM")
+    try:
         for vm in container.view:
             try:
                 vm_name = vm.name
                 vm_power_state = vm.runtime.powerState
-                vm_ip = vm.guest.ipAddress if vm.guest and vm.guest.ipAddress else None
-
-                vms.append({
-                    "host": vm_name,
-                    "status": vm_power_state,
-                    "ip": vm_ip
-                })
+                guest = vm.guest
+                vm_ip, vm_ips = guest_ips(guest.ipAddress, guest.net) if guest else (None, [])
+            except Exception as vm_err:
+                errors.add("ошибки при обработке VM", vm_err, logging.WARNING)
+                continue
 
+            if debug:
                 logging.debug(f"VM: {vm_name}, status: {vm_power_state}, ip: {vm_ip}")
-            except Exception as vm_err:
-                logging.warning(f"Ошибка при обработке VM: {vm_err}")
+            yield {
+                "host": vm_name,
+                "status": vm_power_state,
+                "ip": vm_ip,
+                "ips": vm_ips
+            }
+    finally:
+        errors.log()
 
-        logging.info(f"Успешно получено {len(vms)} виртуальных машин.")
-        return vms
 
-    except Exception as e:
-        logging.error(f"Ошибка при извлечении данных о VM: {e}")
-        return []
+def export_vms_to_snapshot(filename, bulk=VCENTER_BULK_RETRIEVE, page_size=VCENTER_PAGE_SIZE):
+    """
+    Потоково записывает VM в снимок по мере их получения из VCenter,
+    не накапливая весь инвентарь в памяти (в формате ndjson).
+    При ошибке прежний снимок не перезаписывается.
+    """
+    si = connect_to_vcenter()
+    with SnapshotWriter(filename) as writer:
+        for vm in iter_vms(si, bulk=bulk, page_size=page_size):
+            writer.write(vm)
+    metrics.gauge("inventory_size", writer.count, source="vcenter", server=VCENTERS[0]["host"])
+    logging.info(f"Успешно получено {writer.count} виртуальных машин.")
+    logging.info(f"Данные успешно сохранены в файл: {writer.path}")
+
+
+def fetch_vcenter_vms(vcenter, bulk=VCENTER_BULK_RETRIEVE, page_size=VCENTER_PAGE_SIZE, sessions=None):
+    """
+    Выгружает VM одного VCenter и помечает каждую запись источником ("vcenter").
+    В отличие от get_vms_from_vcenter, ошибки не подавляются.
+    :param sessions: VCenterSessions для переиспользования подключений.
+    """
+    if VCENTER_DELTA_EXPORT:
+        from vcenter_delta import get_vms_from_vcenter_delta
+        state_file = VCENTER_DELTA_STATE_FILE
+        if len(VCENTERS) > 1:
+            state_file = f"{state_file}.{vcenter['host']}"
+        vms = get_vms_from_vcenter_delta(state_file, vcenter=vcenter)
+    else:
+        si = sessions.get(vcenter) if sessions is not None else connect_to_vcenter(vcenter=vcenter)
+        vms = list(iter_vms(si, bulk=bulk, page_size=page_size))
+    for vm in vms:
+        vm["vcenter"] = vcenter["host"]
+    metrics.gauge("inventory_size", len(vms), source="vcenter", server=vcenter["host"])
+    logging.info(f"VCenter {vcenter['host']}: получено {len(vms)} виртуальных машин.")
+    return vms
+
+
+def merge_inventories(inventories, policy=VCENTER_DUPLICATE_POLICY):
+    """
+    Объединяет инвентари нескольких VCenter (в порядке VCENTERS).
+    VM с одинаковым именем обрабатываются согласно policy; каждое
+    дублирование записывается в лог.
+    :return: Объединённый список VM.
+    :raises ValueError: Если policy не из DUPLICATE_POLICIES.
+    """
+    if policy not in DUPLICATE_POLICIES:
+        logging.error(
+            f"Неизвестное значение VCENTER_DUPLICATE_POLICY: {policy!r} "
+            f"(допустимо: {', '.join(DUPLICATE_POLICIES)})."
+        )
+        raise ValueError(f"Неизвестная политика дубликатов VM: {policy!r}")
+
+    merged = []
+    by_name = {}
+    for vms in inventories:
+        for vm in vms:
+            existing = by_name.get(vm["host"])
+            if existing is None:
+                by_name[vm["host"]] = len(merged)
+                merged.append(vm)
+                continue
+
+            kept = merged[existing]
+            logging.warning(
+                f"VM '{vm['host']}' есть в нескольких VCenter: "
+                f"{kept.get('vcenter')} ({kept.get('status')}) и {vm.get('vcenter')} ({vm.get('status')})"
+            )
+            if policy == "keep":
+                merged.append(vm)
+            elif policy == "prefer_powered_on" and kept.get("status") != "poweredOn" \
+                    and vm.get("status") == "poweredOn":
+                merged[existing] = vm
+    return merged
+
+
+def get_vms_from_vcenters(vcenters=None, timeout=VCENTER_TIMEOUT, sessions=None):
+    """
+    Параллельно выгружает VM из всех VCenter (каждый в своём потоке)
+    и объединяет результат. Медленный или недоступный VCenter не задерживает
+    и не ломает остальные: его VM просто не попадают в результат.
+    :param sessions: VCenterSessions для переиспользования подключений.
+    :return: Кортеж (объединённый список VM, список недоступных VCenter).
+    """
+    vcenters = vcenters or VCENTERS
+    results = run_collectors({
+        vcenter["host"]: (lambda vcenter=vcenter: fetch_vcenter_vms(vcenter, sessions=sessions), timeout)
+        for vcenter in vcenters
+    })
+    failed = [vcenter["host"] for vcenter in vcenters if results[vcenter["host"]] is None]
+    metrics.gauge("vcenter_unreachable", len(failed))
+    if failed:
+        logging.error(f"Не удалось получить VM из VCenter: {', '.join(failed)}")
+
+    vms = merge_inventories(
+        [results[vcenter["host"]] for vcenter in vcenters if results[vcenter["host"]] is not None]
+    )
+    logging.info(f"Всего получено {len(vms)} виртуальных машин из {len(vcenters) - len(failed)} VCenter.")
+    return vms, failed
 
 
 def save_to_file(data, filename):
     """
-    Сохраняет данные в файл в формате JSON.
+    Сохраняет данные в файл снимка (JSON или NDJSON, см. SNAPSHOT_FORMAT).
     """
     try:
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        logging.info(f"Данные успешно сохранены в файл: {filename}")
+        save_snapshot(data, filename)
     except Exception as e:
         logging.error(f"Ошибка при сохранении данных в файл: {e}")
         raise
 
 
-if __name__ == "__main__":
+def main():
+    """
+    Выгружает VM из VCenter в vcenter_vms.json.
+    """
     try:
-        vcenter_vms = get_vms_from_vcenter()
-        save_to_file(vcenter_vms, "vcenter_vms.json")
+        with metrics.job("export-vcenter"), profiling.job("export-vcenter"):
+            if len(VCENTERS) > 1:
+                vcenter_vms, failed = get_vms_from_vcenters()
+                if failed:
+                    # Неполный снимок привёл бы к удалению из группы хостов
+                    # недоступных VCenter: прежний снимок не перезаписывается
+                    raise RuntimeError(f"Снимок не обновлён, недоступны VCenter: {', '.join(failed)}")
+                save_to_file(vcenter_vms, "vcenter_vms.json")
+            elif VCENTER_DELTA_EXPORT:
+                from vcenter_delta import get_vms_from_vcenter_delta
+                vcenter_vms = get_vms_from_vcenter_delta(VCENTER_DELTA_STATE_FILE)
+                save_to_file(vcenter_vms, "vcenter_vms.json")
+            else:
+                export_vms_to_snapshot("vcenter_vms.json")
+            record_snapshot("vcenter", iter_snapshot("vcenter_vms.json"))
     except Exception as e:
         logging.critical(f"Критическая ошибка выполнения: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("vcenter_vm_export")
+    main()
@@ -1,49 +1,94 @@
-import json
 import logging
-import os
-from pyzabbix import ZabbixAPI
-from config import ZABBIX_URL, ZABBIX_USER, ZABBIX_PASSWORD
-
-# Настройка логирования
-log_dir = "/var/log/zabbix"
-os.makedirs(log_dir, exist_ok=True)
-log_file = os.path.join(log_dir, "zabbix_scripts_zabbix_export_hosts.log")
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
-
-
-def get_hosts_from_zabbix():
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import profiling
+from inventory_store import record_snapshot
+from log_setup import setup_logging
+from snapshot import save_snapshot
+import config
+
+# Постраничная выгрузка: размер страницы (хостов на один host.get) и число потоков
+ZABBIX_EXPORT_PAGE_SIZE = getattr(config, "ZABBIX_EXPORT_PAGE_SIZE", 1000)
+ZABBIX_EXPORT_WORKERS = getattr(config, "ZABBIX_EXPORT_WORKERS", 4)
+# Серверные фильтры: имена групп и теги (формат параметра tags в host.get)
+ZABBIX_EXPORT_GROUPS = getattr(config, "ZABBIX_EXPORT_GROUPS", [])
+ZABBIX_EXPORT_TAGS = getattr(config, "ZABBIX_EXPORT_TAGS", [])
+
+
+def host_record(host):
     """
-    Получает список хостов из Zabbix.
-    Экспортирует данные в формате: hostname, status (enabled/disabled), ip.
+    Преобразует хост из ответа host.get в запись экспорта.
     """
-    try:
-        zapi = ZabbixAPI(ZABBIX_URL)
-        zapi.login(ZABBIX_USER, ZABBIX_PASSWORD)
-        logging.info("Успешное подключение к Zabbix API.")
+    interfaces = host.get("interfaces", [])
+    ip_addresses = [interface["ip"] for interface in interfaces if "ip" in interface]
+    return {
+        "host": host["name"],
+        "status": "enabled" if host["status"] == "0" else "disabled",
+        "ip": ip_addresses[0] if ip_addresses else None,
+        "ips": ip_addresses
+    }
+
+
+def build_host_filters(zapi, groups=None, tags=None):
+    """
+    Строит серверные фильтры host.get по именам групп и тегам,
+    чтобы выгружать только хосты, участвующие в сверке.
+    """
+    groups = ZABBIX_EXPORT_GROUPS if groups is None else groups
+    tags = ZABBIX_EXPORT_TAGS if tags is None else tags
+    filters = {}
+    if groups:
+        found = zapi.hostgroup.get(filter={"name": list(groups)}, output=["groupid", "name"])
+        missing = set(groups) - {group["name"] for group in found}
+        if missing:
+            raise ValueError(f"Группы не найдены в Zabbix: {', '.join(sorted(missing))}")
+        filters["groupids"] = [group["groupid"] for group in found]
+    if tags:
+        filters["tags"] = tags
+    return filters
+
+
+def iter_hosts_from_zabbix(zapi, page_size=ZABBIX_EXPORT_PAGE_SIZE, workers=ZABBIX_EXPORT_WORKERS,
+                           groups=None, tags=None):
+    """
+    Постранично выгружает хосты из Zabbix.
+    Сначала одним лёгким запросом получаются только hostid (с серверными фильтрами),
+    затем хосты с интерфейсами запрашиваются страницами по диапазонам hostid
+    в пуле из workers потоков. Страницы запрашиваются параллельно, но записи
+    отдаются в порядке hostid: снимок одинаков от запуска к запуску
+    (сравнение статусов при повторах имени учитывает порядок записей).
+    """
+    filters = build_host_filters(zapi, groups, tags)
+    hostids = [host["hostid"] for host in zapi.host.get(output=["hostid"], sortfield="hostid", **filters)]
+    pages = [hostids[i:i + page_size] for i in range(0, len(hostids), page_size)]
+    logging.info(f"Хостов к выгрузке: {len(hostids)}, страниц: {len(pages)}")
+
+    def fetch(page):
+        return zapi.host.get(hostids=page, output=["name", "status"], selectInterfaces=["ip"], sortfield="hostid")
 
-        hosts = zapi.host.get(output=["name", "status"], selectInterfaces=["ip"])
-        zabbix_hosts = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(profiling.profiled(fetch), page) for page in pages]
+        for future in futures:
+            for host in future.result():
+                yield host_record(host)
 
-        for host in hosts:
-            hostname = host["name"]
-            host_status = "enabled" if host["status"] == "0" else "disabled"
-            interfaces = host.get("interfaces", [])
-            ip_addresses = [interface["ip"] for interface in interfaces if "ip" in interface]
 
-            zabbix_hosts.append({
-                "host": hostname,
-                "status": host_status,
-                "ip": ip_addresses[0] if ip_addresses else None
-            })
+def get_hosts_from_zabbix(zapi=None):
+    """
+    Получает список хостов из Zabbix.
+    Экспортирует данные в формате: hostname, status (enabled/disabled), ip, ips.
+    :param zapi: Уже открытая сессия Zabbix API; если не указана, выполняется вход.
+    """
+    try:
+        if zapi is None:
+            # Клиент Zabbix (requests, pyzabbix) импортируется только при подключении
+            from zabbix_client import connect_to_zabbix
+            zapi = connect_to_zabbix()
+
+        zabbix_hosts = list(iter_hosts_from_zabbix(zapi))
 
+        metrics.gauge("inventory_size", len(zabbix_hosts), source="zabbix", server=config.ZABBIX_URL)
         logging.info(f"Получено {len(zabbix_hosts)} хостов из Zabbix.")
         return zabbix_hosts
 
@@ -54,20 +99,28 @@ def get_hosts_from_zabbix():
 
 def save_to_file(data, filename):
     """
-    Сохраняет данные в файл в формате JSON.
+    Сохраняет данные в файл снимка (JSON или NDJSON, см. SNAPSHOT_FORMAT).
     """
     try:
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        logging.info(f"Данные успешно сохранены в файл: {filename}")
+        save_snapshot(data, filename)
     except Exception as e:
         logging.error(f"Ошибка при сохранении в файл {filename}: {e}")
         raise
 
 
-if __name__ == "__main__":
+def main():
+    """
+    Выгружает хосты Zabbix в zabbix_hosts.json.
+    """
     try:
-        zabbix_hosts = get_hosts_from_zabbix()
-        save_to_file(zabbix_hosts, "zabbix_hosts.json")
+        with metrics.job("export-zabbix"), profiling.job("export-zabbix"):
+            zabbix_hosts = get_hosts_from_zabbix()
+            save_to_file(zabbix_hosts, "zabbix_hosts.json")
+            record_snapshot("zabbix", zabbix_hosts)
     except Exception as e:
         logging.critical(f"Скрипт завершился с ошибкой: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("zabbix_export_hosts")
+    main()
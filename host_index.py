@@ -0,0 +1,110 @@
+from ip_index import IpIndex, default_filter, pack_ip
+
+
+class HostIndex:
+    """
+    Индекс хостов Zabbix для сравнения с VCenter.
+    Хосты индексируются по исходному имени, нормализованному имени и каждому
+    IP-адресу интерфейсов. Все отображения «один ко многим»: у хоста может быть
+    несколько интерфейсов, а один IP или имя — у нескольких хостов.
+    Имена Zabbix хранятся как есть; функция normalize (например, str.lower
+    для сравнения без учёта регистра) применяется и к именам хостов, и к
+    искомому имени. Без неё нормализованный поиск совпадает с поиском по имени
+    и второй словарь не строится.
+    Поиск по имени — O(1); IP хранятся упакованными в IpIndex (поиск O(log N)),
+    адреса вне диапазонов HOST_IP_INCLUDE/HOST_IP_EXCLUDE не индексируются.
+    """
+
+    def __init__(self, normalize=None, ip_filter=None):
+        self.normalize = normalize
+        self.ip_filter = ip_filter or default_filter()
+        self.by_name = {}
+        self.by_normalized = {} if normalize else self.by_name
+        self.by_ip = IpIndex()
+
+    @staticmethod
+    def host_ips(host):
+        """
+        Возвращает все IP хоста: поле "ips" (список) или "ip" (строка или список).
+        """
+        ips = host.get("ips")
+        if ips is None:
+            ips = host.get("ip")
+        if not ips:
+            return []
+        if isinstance(ips, str):
+            return [ips]
+        # Обычно пустых адресов нет: список возвращается без копирования
+        return ips if all(ips) else [ip for ip in ips if ip]
+
+    def add(self, host):
+        """
+        Добавляет хост (словарь с ключом "host" и необязательными "ip"/"ips").
+        """
+        name = host.get("host")
+        if name:
+            self.by_name.setdefault(name, []).append(host)
+            if self.normalize:
+                self.by_normalized.setdefault(self.normalize(name), []).append(host)
+        self.by_ip.add_many(self.ip_filter.pack(self.host_ips(host)), host)
+
+    @classmethod
+    def from_hosts(cls, hosts, normalize=None, ip_filter=None):
+        """
+        Строит индекс по списку хостов в формате zabbix_hosts.json.
+        """
+        index = cls(normalize, ip_filter)
+        for host in hosts:
+            index.add(host)
+        return index
+
+    @classmethod
+    def from_ip_map(cls, ip_map, normalize=None, ip_filter=None):
+        """
+        Строит индекс по словарю host → [ip].
+        """
+        index = cls(normalize, ip_filter)
+        for name, ips in ip_map.items():
+            index.add({"host": name, "ips": list(ips)})
+        return index
+
+    def lookup_name(self, name):
+        return self.by_name.get(name, [])
+
+    def lookup_normalized(self, name):
+        """
+        Хосты, нормализованное имя которых совпадает с нормализованным name.
+        """
+        return self.by_normalized.get(self.normalize(name) if self.normalize else name, [])
+
+    def lookup_ip(self, ip):
+        return self.by_ip.lookup(pack_ip(ip))
+
+    def lookup_network(self, cidr):
+        return self.by_ip.lookup_network(cidr)
+
+    def has_name(self, name):
+        return name in self.by_name
+
+    def has_normalized(self, name):
+        return (self.normalize(name) if self.normalize else name) in self.by_normalized
+
+    def has_ip(self, ip):
+        # В индекс попадают только адреса, разрешённые фильтром, поэтому
+        # отфильтрованный адрес в нём не найдётся и без проверки allows
+        return self.by_ip.contains(pack_ip(ip))
+
+    def has_any_ip(self, ips):
+        """
+        Есть ли в индексе хотя бы один из IP (строка или список, как в host_ips).
+        """
+        if isinstance(ips, str):
+            ips = [ips]
+        contains = self.by_ip.contains
+        for ip in ips or ():
+            if contains(pack_ip(ip)):
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.by_name)
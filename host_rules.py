@@ -0,0 +1,106 @@
+import re
+from functools import lru_cache
+
+# Настройки правил необязательны: офлайн-сравнение работает и без config.py
+try:
+    import config
+except ImportError:
+    config = None
+
+# Шаблоны имён VM, исключаемых из сравнения
+DEFAULT_EXCLUDE_PATTERNS = [r"_REP$", r"^temp-", r"^Temp"]
+
+# Правила нормализации (шаблон, замена) — применяется первое совпавшее.
+# Например, 'VW-SWX002-a.miller' → 'SWX002'.
+DEFAULT_NORMALIZE_RULES = [(r"VW-(\w+)-", r"\1")]
+
+HOST_EXCLUDE_PATTERNS = getattr(config, "HOST_EXCLUDE_PATTERNS", DEFAULT_EXCLUDE_PATTERNS)
+HOST_NORMALIZE_RULES = getattr(config, "HOST_NORMALIZE_RULES", DEFAULT_NORMALIZE_RULES)
+HOST_RULES_CACHE_SIZE = getattr(config, "HOST_RULES_CACHE_SIZE", 262144)
+
+# Замена, состоящая из одной ссылки на группу (\1, \g<1>, \g<name>)
+_GROUP_REF = re.compile(r"^\\(?:(\d+)|g<(\w+)>)$")
+
+
+def _compile_replacement(replacement):
+    """
+    Ссылку на одну группу превращает в номер/имя группы: match.group()
+    намного быстрее, чем разбор шаблона в match.expand() на каждый вызов.
+    """
+    ref = _GROUP_REF.match(replacement)
+    if ref is None:
+        return replacement, False
+    group = ref.group(1) or ref.group(2)
+    return (int(group) if group.isdigit() else group), True
+
+
+class HostRules:
+    """
+    Правила нормализации и исключения имён хостов.
+    Шаблоны исключения компилируются один раз в одно объединённое регулярное
+    выражение, правила нормализации — в упорядоченный список. Результаты
+    кэшируются в ограниченном LRU-кэше, так как одни и те же имена
+    повторяются между этапами.
+    """
+
+    def __init__(self, exclude_patterns=None, normalize_rules=None, cache_size=HOST_RULES_CACHE_SIZE):
+        exclude_patterns = HOST_EXCLUDE_PATTERNS if exclude_patterns is None else exclude_patterns
+        normalize_rules = HOST_NORMALIZE_RULES if normalize_rules is None else normalize_rules
+
+        self.exclude_regex = None
+        if exclude_patterns:
+            self.exclude_regex = re.compile("|".join(f"(?:{pattern})" for pattern in exclude_patterns))
+        self.normalize_rules = [
+            (re.compile(pattern),) + _compile_replacement(replacement)
+            for pattern, replacement in normalize_rules
+        ]
+
+        if cache_size:
+            self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+            self.is_excluded = lru_cache(maxsize=cache_size)(self._is_excluded)
+        else:
+            self.normalize = self._normalize
+            self.is_excluded = self._is_excluded
+
+    def _normalize(self, vcenter_name):
+        """
+        Нормализует имя хоста из VCenter для сравнения с именами в Zabbix.
+        Если ни одно правило не подошло, возвращает исходное имя.
+        """
+        for regex, replacement, is_group in self.normalize_rules:
+            match = regex.search(vcenter_name)
+            if match:
+                return match.group(replacement) if is_group else match.expand(replacement)
+        return vcenter_name
+
+    def _is_excluded(self, vcenter_name):
+        """
+        Проверяет, подпадает ли имя VM под один из шаблонов исключения.
+        """
+        return self.exclude_regex is not None and self.exclude_regex.search(vcenter_name) is not None
+
+    def cache_info(self):
+        if not hasattr(self.normalize, "cache_info"):
+            return None
+        return {"normalize": self.normalize.cache_info(), "is_excluded": self.is_excluded.cache_info()}
+
+
+_default_rules = None
+
+
+def get_default_rules():
+    """
+    Возвращает общий экземпляр HostRules, построенный по настройкам config.py.
+    """
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = HostRules()
+    return _default_rules
+
+
+def normalize_hostname(vcenter_name):
+    return get_default_rules().normalize(vcenter_name)
+
+
+def is_excluded(vcenter_name):
+    return get_default_rules().is_excluded(vcenter_name)
@@ -0,0 +1,419 @@
+import argparse
+import json
+import logging
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from host_index import HostIndex
+from host_rules import get_default_rules
+from ip_index import default_filter
+
+# Настройки хранилища необязательны: офлайн-сравнение работает и без config.py
+try:
+    import config
+except ImportError:
+    config = None
+
+# Путь к базе SQLite; None — хранилище отключено
+INVENTORY_DB = getattr(config, "INVENTORY_DB", None)
+# Сколько последних запусков каждого источника хранить (None — без ограничения)
+INVENTORY_RETENTION_RUNS = getattr(config, "INVENTORY_RETENTION_RUNS", 500)
+# Сколько дней хранить историю запусков (None — без ограничения)
+INVENTORY_RETENTION_DAYS = getattr(config, "INVENTORY_RETENTION_DAYS", 90)
+# Как часто (часы) удалять устаревшие запуски при сохранении снимка;
+# None — только командой prune
+INVENTORY_PRUNE_INTERVAL = getattr(config, "INVENTORY_PRUNE_INTERVAL", 24)
+# Выполнять VACUUM после удаления старых запусков, если доля свободных
+# страниц базы больше INVENTORY_VACUUM_FREELIST_RATIO
+INVENTORY_VACUUM = getattr(config, "INVENTORY_VACUUM", True)
+INVENTORY_VACUUM_FREELIST_RATIO = getattr(config, "INVENTORY_VACUUM_FREELIST_RATIO", 0.25)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    host_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_source ON runs (source, run_id);
+
+CREATE TABLE IF NOT EXISTS vcenter_vms (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    status TEXT,
+    ip TEXT,
+    excluded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS vcenter_vms_host ON vcenter_vms (host, run_id);
+CREATE INDEX IF NOT EXISTS vcenter_vms_normalized ON vcenter_vms (run_id, normalized);
+CREATE INDEX IF NOT EXISTS vcenter_vms_ip ON vcenter_vms (run_id, ip);
+
+CREATE TABLE IF NOT EXISTS vcenter_ips (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    ip TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vcenter_ips_host ON vcenter_ips (run_id, host);
+
+CREATE TABLE IF NOT EXISTS zabbix_hosts (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS zabbix_hosts_host ON zabbix_hosts (run_id, host);
+
+CREATE TABLE IF NOT EXISTS zabbix_ips (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    host TEXT NOT NULL,
+    ip TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS zabbix_ips_ip ON zabbix_ips (run_id, ip);
+
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Хосты VCenter, отсутствующие в Zabbix (логика compare_hosts.find_missing_hosts).
+# VM сопоставляется по любому своему IP (vcenter_ips), для запусков, сохранённых
+# до появления vcenter_ips, — по основному IP.
+MISSING_HOSTS_SQL = """
+SELECT v.host, v.ip
+FROM vcenter_vms v
+WHERE v.run_id = :vcenter_run
+  AND v.status IS NOT NULL AND v.status != 'poweredOff'
+  AND v.excluded = 0
+  AND NOT EXISTS (
+      SELECT 1 FROM zabbix_hosts z WHERE z.run_id = :zabbix_run AND z.host = v.normalized
+  )
+  AND NOT EXISTS (
+      SELECT 1 FROM zabbix_ips zi WHERE zi.run_id = :zabbix_run AND zi.ip = v.ip
+  )
+  AND NOT EXISTS (
+      SELECT 1 FROM vcenter_ips vi
+      JOIN zabbix_ips zi ON zi.run_id = :zabbix_run AND zi.ip = vi.ip
+      WHERE vi.run_id = :vcenter_run AND vi.host = v.host
+  )
+ORDER BY v.rowid
+"""
+
+# Хосты с несоответствием статусов (логика compare_hosts_status.find_mismatched_hosts).
+# При дублировании имён в Zabbix учитывается последний хост.
+MISMATCHED_HOSTS_SQL = """
+SELECT v.normalized, v.ip, v.status, z.status
+FROM vcenter_vms v
+JOIN zabbix_hosts z ON z.rowid = (
+    SELECT MAX(z2.rowid) FROM zabbix_hosts z2
+    WHERE z2.run_id = :zabbix_run AND z2.host = v.normalized
+)
+WHERE v.run_id = :vcenter_run
+  AND ((v.status = 'poweredOff' AND z.status = 'enabled')
+    OR (v.status = 'poweredOn' AND z.status = 'disabled'))
+ORDER BY v.rowid
+"""
+
+
+class InventoryStore:
+    """
+    Локальное хранилище снимков VCenter и Zabbix в SQLite с историей запусков.
+    Каждый импорт снимка — отдельный запуск; сравнение выполняется
+    индексированными запросами по последним (или указанным) запускам.
+    """
+
+    def __init__(self, path=INVENTORY_DB, rules=None):
+        if not path:
+            raise ValueError("Не задан путь к базе INVENTORY_DB.")
+        self.path = path
+        self.rules = rules or get_default_rules()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _start_run(self, source):
+        cursor = self.conn.execute(
+            "INSERT INTO runs (source, started_at) VALUES (?, ?)",
+            (source, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        )
+        return cursor.lastrowid
+
+    def import_vcenter(self, vms):
+        """
+        Сохраняет снимок VM как новый запуск. vms — любой итерируемый объект
+        (например, iter_snapshot), в память целиком не загружается.
+        Все IP VM из диапазонов HOST_IP_INCLUDE/HOST_IP_EXCLUDE сохраняются в vcenter_ips.
+        """
+        ip_filter = default_filter()
+        ip_rows = []
+
+        def rows(run_id):
+            for vm in vms:
+                if not vm.get("host"):
+                    continue
+                ip_rows.extend((run_id, vm["host"], ip) for ip in ip_filter.select(HostIndex.host_ips(vm)))
+                yield (run_id, vm["host"], self.rules.normalize(vm["host"]), vm.get("status"),
+                       vm.get("ip") or None, int(self.rules.is_excluded(vm["host"])))
+
+        with self.conn:
+            run_id = self._start_run("vcenter")
+            count = self.conn.executemany(
+                "INSERT INTO vcenter_vms (run_id, host, normalized, status, ip, excluded) VALUES (?, ?, ?, ?, ?, ?)",
+                rows(run_id)
+            ).rowcount
+            self.conn.executemany("INSERT INTO vcenter_ips (run_id, host, ip) VALUES (?, ?, ?)", ip_rows)
+            self.conn.execute("UPDATE runs SET host_count = ? WHERE run_id = ?", (count, run_id))
+        logging.info(f"Снимок VCenter сохранён в {self.path}: запуск {run_id}, {count} VM")
+        return run_id
+
+    def import_zabbix(self, hosts):
+        """
+        Сохраняет снимок хостов Zabbix как новый запуск (все IP интерфейсов
+        из диапазонов HOST_IP_INCLUDE/HOST_IP_EXCLUDE).
+        """
+        ip_filter = default_filter()
+        with self.conn:
+            run_id = self._start_run("zabbix")
+            count = 0
+            ip_rows = []
+            for host in hosts:
+                if not host.get("host"):
+                    continue
+                self.conn.execute(
+                    "INSERT INTO zabbix_hosts (run_id, host, status) VALUES (?, ?, ?)",
+                    (run_id, host["host"], host.get("status"))
+                )
+                ip_rows.extend((run_id, host["host"], ip) for ip in ip_filter.select(HostIndex.host_ips(host)))
+                count += 1
+            self.conn.executemany("INSERT INTO zabbix_ips (run_id, host, ip) VALUES (?, ?, ?)", ip_rows)
+            self.conn.execute("UPDATE runs SET host_count = ? WHERE run_id = ?", (count, run_id))
+        logging.info(f"Снимок Zabbix сохранён в {self.path}: запуск {run_id}, {count} хостов")
+        return run_id
+
+    def latest_run(self, source):
+        row = self.conn.execute(
+            "SELECT MAX(run_id) FROM runs WHERE source = ?", (source,)
+        ).fetchone()
+        return row[0]
+
+    def _run_params(self, vcenter_run, zabbix_run):
+        vcenter_run = vcenter_run or self.latest_run("vcenter")
+        zabbix_run = zabbix_run or self.latest_run("zabbix")
+        if vcenter_run is None or zabbix_run is None:
+            raise ValueError("В хранилище нет снимков VCenter и/или Zabbix.")
+        return {"vcenter_run": vcenter_run, "zabbix_run": zabbix_run}
+
+    def find_missing_hosts(self, vcenter_run=None, zabbix_run=None):
+        """
+        Хосты VCenter, которых нет в Zabbix, в формате missing_hosts.json
+        (как у compare_hosts.find_missing_hosts: host, ip и список ips).
+        В ips — адреса VM из диапазонов HOST_IP_INCLUDE/HOST_IP_EXCLUDE,
+        для запусков, сохранённых до появления vcenter_ips, — основной IP.
+        """
+        params = self._run_params(vcenter_run, zabbix_run)
+        rows = self.conn.execute(MISSING_HOSTS_SQL, params).fetchall()
+        names = {host for host, _ in rows}
+        vm_ips = {}
+        for host, ip in self.conn.execute(
+                "SELECT host, ip FROM vcenter_ips WHERE run_id = ? ORDER BY rowid", (params["vcenter_run"],)):
+            if host in names:
+                vm_ips.setdefault(host, []).append(ip)
+        missing_hosts = [
+            {"host": host, "ip": ip, "ips": vm_ips.get(host, [ip] if ip else [])}
+            for host, ip in rows
+        ]
+        logging.info(f"Всего отсутствующих хостов: {len(missing_hosts)}")
+        return missing_hosts
+
+    def find_mismatched_hosts(self, vcenter_run=None, zabbix_run=None):
+        """
+        Хосты с несоответствием статусов в формате mismatched_hosts.json.
+        """
+        params = self._run_params(vcenter_run, zabbix_run)
+        mismatched_hosts = [
+            {
+                "host": normalized,
+                "ip": ip if ip else "нет IP",
+                "vmware_status": vm_status,
+                "zabbix_status": z_status
+            }
+            for normalized, ip, vm_status, z_status in self.conn.execute(MISMATCHED_HOSTS_SQL, params)
+        ]
+        logging.info(f"Обнаружено {len(mismatched_hosts)} хостов с несоответствием статусов.")
+        return mismatched_hosts
+
+    def vm_history(self, host):
+        """
+        История VM по запускам: [{"run_id", "started_at", "status", "ip"}].
+        Позволяет ответить, когда VM была выключена или пропала.
+        """
+        rows = self.conn.execute(
+            """
+            SELECT r.run_id, r.started_at, v.status, v.ip
+            FROM runs r
+            LEFT JOIN vcenter_vms v ON v.run_id = r.run_id AND v.host = ?
+            WHERE r.source = 'vcenter'
+            ORDER BY r.run_id
+            """,
+            (host,)
+        )
+        return [
+            {"run_id": run_id, "started_at": started_at, "status": status, "ip": ip}
+            for run_id, started_at, status, ip in rows
+        ]
+
+    def prune(self, keep_runs=INVENTORY_RETENTION_RUNS, keep_days=INVENTORY_RETENTION_DAYS,
+              vacuum=INVENTORY_VACUUM):
+        """
+        Удаляет запуски сверх лимита keep_runs (для каждого источника)
+        и старше keep_days дней, затем при необходимости выполняет VACUUM.
+        Возвращает количество удалённых запусков.
+        """
+        removed = 0
+        with self.conn:
+            if keep_runs:
+                for source in ("vcenter", "zabbix"):
+                    removed += self.conn.execute(
+                        """
+                        DELETE FROM runs WHERE source = ? AND run_id NOT IN (
+                            SELECT run_id FROM runs WHERE source = ? ORDER BY run_id DESC LIMIT ?
+                        )
+                        """,
+                        (source, source, keep_runs)
+                    ).rowcount
+            if keep_days:
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_days)).isoformat(timespec="seconds")
+                # Последний запуск каждого источника сохраняется всегда
+                removed += self.conn.execute(
+                    """
+                    DELETE FROM runs WHERE started_at < ? AND run_id NOT IN (
+                        SELECT MAX(run_id) FROM runs GROUP BY source
+                    )
+                    """,
+                    (cutoff,)
+                ).rowcount
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('pruned_at', ?)",
+                (datetime.now(timezone.utc).isoformat(timespec="seconds"),)
+            )
+
+        if removed and vacuum:
+            self.vacuum()
+        logging.info(f"Удалено старых запусков: {removed}")
+        return removed
+
+    def prune_due(self, interval=INVENTORY_PRUNE_INTERVAL):
+        """
+        Пора ли удалять устаревшие запуски: с прошлого prune прошло
+        больше interval часов (None — никогда, только командой prune).
+        """
+        if not interval:
+            return False
+        row = self.conn.execute("SELECT value FROM store_meta WHERE key = 'pruned_at'").fetchone()
+        if row is None:
+            return True
+        return datetime.fromisoformat(row[0]) < datetime.now(timezone.utc) - timedelta(hours=interval)
+
+    def vacuum(self, min_ratio=INVENTORY_VACUUM_FREELIST_RATIO, force=False):
+        """
+        Выполняет VACUUM (полную перезапись базы), только если доля свободных
+        страниц больше min_ratio или force.
+        :return: True, если VACUUM выполнен.
+        """
+        free = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        if not force and (not total or free / total <= min_ratio):
+            logging.info(f"VACUUM не требуется: свободных страниц {free} из {total}")
+            return False
+        self.conn.execute("VACUUM")
+        logging.info(f"VACUUM выполнен: освобождено страниц {free} из {total}")
+        return True
+
+
+def record_snapshot(source, records, path=INVENTORY_DB):
+    """
+    Сохраняет снимок в хранилище, если оно включено (INVENTORY_DB),
+    и раз в INVENTORY_PRUNE_INTERVAL часов удаляет устаревшие запуски.
+    Ошибки хранилища не прерывают экспорт.
+    """
+    if not path:
+        return None
+    try:
+        with InventoryStore(path) as store:
+            if source == "vcenter":
+                run_id = store.import_vcenter(records)
+            else:
+                run_id = store.import_zabbix(records)
+            if store.prune_due():
+                store.prune()
+            return run_id
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении снимка {source} в {path}: {e}")
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Хранилище снимков VCenter и Zabbix в SQLite.")
+    parser.add_argument("--db", default=INVENTORY_DB, help="Путь к базе SQLite (по умолчанию INVENTORY_DB).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Импортировать снимки из файлов.")
+    import_parser.add_argument("--vcenter", default="vcenter_vms.json")
+    import_parser.add_argument("--zabbix", default="zabbix_hosts.json")
+
+    commands.add_parser("missing", help="Хосты VCenter, которых нет в Zabbix (missing_hosts.json).")
+    commands.add_parser("mismatched", help="Хосты с несоответствием статусов (mismatched_hosts.json).")
+
+    history_parser = commands.add_parser("history", help="История VM по запускам.")
+    history_parser.add_argument("host")
+
+    prune_parser = commands.add_parser("prune", help="Удалить устаревшие запуски и при необходимости выполнить VACUUM.")
+    prune_parser.add_argument("--vacuum", action="store_true",
+                              help="Выполнить VACUUM независимо от доли свободных страниц.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from log_setup import setup_logging
+    from snapshot import iter_snapshot
+
+    setup_logging("inventory_store")
+
+    args = parse_args()
+    try:
+        with InventoryStore(args.db) as store:
+            if args.command == "import":
+                store.import_vcenter(iter_snapshot(args.vcenter))
+                store.import_zabbix(iter_snapshot(args.zabbix))
+                if store.prune_due():
+                    store.prune()
+            elif args.command == "missing":
+                result = store.find_missing_hosts()
+                print(json.dumps(result, indent=4, ensure_ascii=False))
+                with open("missing_hosts.json", "w") as f:
+                    json.dump(result, f, indent=4, ensure_ascii=False)
+            elif args.command == "mismatched":
+                result = store.find_mismatched_hosts()
+                print(json.dumps(result, indent=4, ensure_ascii=False))
+                with open("mismatched_hosts.json", "w") as f:
+                    json.dump(result, f, indent=4, ensure_ascii=False)
+            elif args.command == "history":
+                print(json.dumps(store.vm_history(args.host), indent=4, ensure_ascii=False))
+            elif args.command == "prune":
+                store.prune(vacuum=INVENTORY_VACUUM and not args.vacuum)
+                if args.vacuum:
+                    store.vacuum(force=True)
+    except Exception as e:
+        logging.critical(f"Скрипт завершился с ошибкой: {e}")
@@ -0,0 +1,184 @@
+import ipaddress
+import socket
+from bisect import bisect_left, bisect_right
+
+# Настройки необязательны: без config.py действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
+
+# Диапазоны IP (CIDR), которые участвуют в сопоставлении VM и хостов Zabbix.
+# Пустой HOST_IP_INCLUDE — все адреса; HOST_IP_EXCLUDE применяется после него.
+HOST_IP_INCLUDE = getattr(config, "HOST_IP_INCLUDE", [])
+HOST_IP_EXCLUDE = getattr(config, "HOST_IP_EXCLUDE", ["127.0.0.0/8", "169.254.0.0/16", "::1/128", "fe80::/10"])
+
+# Адреса IPv6 упаковываются после всего пространства IPv4,
+# чтобы оба семейства помещались в один отсортированный массив
+IPV6_OFFSET = 1 << 32
+
+
+def pack_ip(ip):
+    """
+    Упаковывает IPv4/IPv6-адрес в целое число (IPv4 — младше IPV6_OFFSET).
+    :return: Число или None, если строка не является IP-адресом.
+    """
+    if not ip or not isinstance(ip, str):
+        return None
+    try:
+        if ":" in ip:
+            # Идентификатор зоны (fe80::1%eth0) не входит в адрес
+            packed = socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0])
+            return IPV6_OFFSET + int.from_bytes(packed, "big")
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, ValueError):
+        return None
+
+
+def pack_network(cidr):
+    """
+    Упаковывает сеть CIDR в диапазон целых чисел.
+    :return: Кортеж (первый адрес, последний адрес) включительно.
+    :raises ValueError: Если строка не является сетью CIDR.
+    """
+    network = ipaddress.ip_network(cidr, strict=False)
+    offset = IPV6_OFFSET if network.version == 6 else 0
+    return offset + int(network.network_address), offset + int(network.broadcast_address)
+
+
+class IpRanges:
+    """
+    Набор диапазонов CIDR: пересекающиеся и смежные диапазоны сливаются,
+    начала и концы хранятся в отсортированных массивах.
+    Проверка принадлежности адреса — O(log N) через bisect.
+    """
+
+    def __init__(self, cidrs=()):
+        ranges = sorted(pack_network(cidr) for cidr in cidrs)
+        self.starts = []
+        self.ends = []
+        for start, end in ranges:
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def contains(self, packed):
+        position = bisect_right(self.starts, packed) - 1
+        return position >= 0 and packed <= self.ends[position]
+
+    def __bool__(self):
+        return bool(self.starts)
+
+
+class IpFilter:
+    """
+    Отбор адресов для сопоставления по диапазонам include/exclude
+    (по умолчанию HOST_IP_INCLUDE и HOST_IP_EXCLUDE из config.py).
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = IpRanges(HOST_IP_INCLUDE if include is None else include)
+        self.exclude = IpRanges(HOST_IP_EXCLUDE if exclude is None else exclude)
+
+    def allows(self, packed):
+        if packed is None:
+            return False
+        if self.include and not self.include.contains(packed):
+            return False
+        return not self.exclude.contains(packed)
+
+    def pack(self, ips):
+        """
+        Упаковывает подходящие адреса из списка, некорректные и отфильтрованные пропускает.
+        """
+        allows = self.allows
+        return [packed for packed in map(pack_ip, ips) if allows(packed)]
+
+    def select(self, ips):
+        """
+        Возвращает подходящие адреса из списка в исходном виде и порядке.
+        """
+        return [ip for ip in ips if self.allows(pack_ip(ip))]
+
+
+_default_filter = None
+
+
+def default_filter():
+    """
+    Фильтр по настройкам config.py (создаётся один раз).
+    """
+    global _default_filter
+    if _default_filter is None:
+        _default_filter = IpFilter()
+    return _default_filter
+
+
+class IpIndex:
+    """
+    Индекс «IP → значения» на отсортированных массивах упакованных адресов.
+    Добавление копит пары, первый поиск сортирует их один раз (O(N log N));
+    поиск адреса и сети CIDR — O(log N) через bisect, без словаря строк
+    на каждый адрес.
+    """
+
+    def __init__(self):
+        # Новые пары хранятся в двух списках, а не кортежами: меньше объектов
+        # для сборщика мусора при построении индекса на сотни тысяч адресов
+        self.pending_keys = []
+        self.pending_values = []
+        self.keys = []
+        self.values = []
+
+    def add(self, packed, value):
+        self.pending_keys.append(packed)
+        self.pending_values.append(value)
+
+    def add_many(self, packed_ips, value):
+        for packed in packed_ips:
+            self.pending_keys.append(packed)
+            self.pending_values.append(value)
+
+    def _freeze(self):
+        if not self.pending_keys:
+            return
+        keys = self.keys + self.pending_keys
+        values = self.values + self.pending_values
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.values = [values[i] for i in order]
+        self.pending_keys = []
+        self.pending_values = []
+
+    def _range(self, first, last):
+        self._freeze()
+        return bisect_left(self.keys, first), bisect_right(self.keys, last)
+
+    def lookup(self, packed):
+        """
+        Все значения для упакованного адреса.
+        """
+        if packed is None:
+            return []
+        start, end = self._range(packed, packed)
+        return self.values[start:end]
+
+    def contains(self, packed):
+        if packed is None:
+            return False
+        if self.pending_keys:
+            self._freeze()
+        position = bisect_left(self.keys, packed)
+        return position < len(self.keys) and self.keys[position] == packed
+
+    def lookup_network(self, cidr):
+        """
+        Все значения для адресов внутри сети CIDR.
+        """
+        start, end = self._range(*pack_network(cidr))
+        return self.values[start:end]
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending_keys)
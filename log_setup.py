@@ -0,0 +1,131 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# Настройки необязательны: без config.py действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
+
+# Каталог логов; каждая точка входа пишет свой файл zabbix_scripts_<имя>.log
+LOG_DIR = getattr(config, "LOG_DIR", "/var/log/zabbix")
+# Уровень логирования; при DEBUG в лог пишется каждое событие по каждому хосту
+LOG_LEVEL = getattr(config, "LOG_LEVEL", "INFO")
+# Сколько примеров хостов приводить в сводных сообщениях
+LOG_SAMPLE_SIZE = getattr(config, "LOG_SAMPLE_SIZE", 5)
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Фоновый поток записи логов (None — логирование не настроено)
+_listener = None
+
+
+def setup_logging(name, level=LOG_LEVEL):
+    """
+    Настраивает логирование точки входа: файл <LOG_DIR>/zabbix_scripts_<name>.log
+    и консоль. Записи передаются через очередь фоновому потоку (QueueListener),
+    поэтому рабочий код не ждёт записи в файл и на консоль.
+    Повторный вызов ничего не меняет: действует настройка внешней точки входа.
+    Если каталог логов недоступен, логирование идёт только в консоль.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    file_error = None
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        handlers.insert(0, logging.FileHandler(os.path.join(LOG_DIR, f"zabbix_scripts_{name}.log")))
+    except OSError as e:
+        file_error = e
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    if file_error:
+        logging.warning(f"Не удалось открыть файл лога в {LOG_DIR}: {file_error}. Логирование только в консоль.")
+
+
+def shutdown_logging():
+    """
+    Дописывает оставшиеся в очереди записи и останавливает фоновый поток.
+    """
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def sample(items, limit=LOG_SAMPLE_SIZE):
+    """
+    Краткий список для сообщения: первые limit элементов и число остальных.
+    """
+    items = list(items)
+    text = ", ".join(str(item) for item in items[:limit])
+    if len(items) > limit:
+        text += f" и ещё {len(items) - limit}"
+    return text
+
+
+class EventSummary:
+    """
+    Сводка однотипных событий по хостам вместо строки лога на каждый хост:
+    считает события по видам и хранит несколько примеров. Сами события
+    пишутся в лог по одному только на уровне DEBUG.
+    """
+
+    def __init__(self, title, samples=LOG_SAMPLE_SIZE):
+        self.title = title
+        self.samples = samples
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.examples = {}
+        self.levels = {}
+        self.debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    def add(self, event, example, level=logging.INFO):
+        """
+        :param event: Вид события (например, "пропущены выключенные VM").
+        :param example: Хост или иное описание случая для примеров.
+        :param level: Уровень, с которым событие попадёт в сводку.
+        """
+        with self.lock:
+            count = self.counts.get(event, 0) + 1
+            self.counts[event] = count
+            self.levels[event] = max(level, self.levels.get(event, level))
+            if count <= self.samples:
+                self.examples.setdefault(event, []).append(example)
+        if self.debug:
+            logging.debug(f"{self.title}: {event}: {example}")
+
+    def count(self, event):
+        return self.counts.get(event, 0)
+
+    def log(self):
+        """
+        Пишет по одной строке на вид события: число и примеры.
+        """
+        with self.lock:
+            rows = [(event, count, list(self.examples[event]), self.levels[event])
+                    for event, count in self.counts.items()]
+        for event, count, examples, level in rows:
+            more = f" и ещё {count - len(examples)}" if count > len(examples) else ""
+            logging.log(level, f"{self.title}: {event} — {count} (например: {', '.join(map(str, examples))}{more})")
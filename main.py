@@ -1,50 +1,38 @@
-import atexit
 import json
-from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
-import ssl
-from pyzabbix import ZabbixAPI
+import sys
 from collections import defaultdict
 
 # Импортируем настройки из файла config.py
-from config import VCENTER_HOST, VCENTER_USER, VCENTER_PASSWORD, ZABBIX_URL, ZABBIX_USER, ZABBIX_PASSWORD
+import config
+import metrics
+import profiling
+from collectors import run_collectors
+from export_vcenter import VCENTERS, connect_to_vcenter, guest_ips, iter_vm_properties
+from host_index import HostIndex
+from log_setup import setup_logging
+from zabbix_client import connect_to_zabbix
+
+# Таймауты сборщиков (секунды)
+VCENTER_TIMEOUT = getattr(config, "VCENTER_TIMEOUT", 1800)
+ZABBIX_TIMEOUT = getattr(config, "ZABBIX_TIMEOUT", 600)
 
 
 def get_vms_from_vcenter():
     """
     Получает список виртуальных машин и их IP-адресов из VCenter.
+    Свойства всех VM запрашиваются постранично через PropertyCollector.
     """
-    # Создаем контекст SSL для игнорирования ошибок сертификатов
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-    context.check_hostname = False
-    context.verify_mode = ssl.CERT_NONE
-
     try:
         # Подключаемся к VCenter
-        si = SmartConnect(
-            host=VCENTER_HOST,
-            user=VCENTER_USER,
-            pwd=VCENTER_PASSWORD,
-            sslContext=context
-        )
-        atexit.register(Disconnect, si)
+        si = connect_to_vcenter()
     except Exception as e:
         print(f"Не удалось подключиться к VCenter. Ошибка: {e}")
         return []
 
-    # Получаем корневой объект
-    content = si.RetrieveContent()
-    container = content.viewManager.CreateContainerView(
-        content.rootFolder, [vim.VirtualMachine], True
-    )
-
     vms = []
-    for vm in container.view:
-        vm_name = vm.name
-        vm_ip = None
-        if vm.guest and vm.guest.ipAddress:
-            vm_ip = vm.guest.ipAddress
-        vms.append({"name": vm_name, "ip": vm_ip})
+    for _, props in iter_vm_properties(si, properties=["name", "guest.ipAddress", "guest.net"]):
+        ip, ips = guest_ips(props.get("guest.ipAddress"), props.get("guest.net"))
+        vms.append({"name": props.get("name"), "ip": ip, "ips": ips})
 
     return vms
 
@@ -53,8 +41,7 @@ def get_hosts_from_zabbix():
     """
     Получает список хостов из Zabbix.
     """
-    zapi = ZabbixAPI(ZABBIX_URL)
-    zapi.login(ZABBIX_USER, ZABBIX_PASSWORD)
+    zapi = connect_to_zabbix()
 
     # Получаем список хостов и их интерфейсов
     hosts = zapi.host.get(output=["host"], selectInterfaces=["ip"])
@@ -74,15 +61,17 @@ def find_missing_hosts(vcenter_vms, zabbix_hosts):
     Сравнивает данные из VCenter и Zabbix и возвращает список хостов, которых нет в Zabbix.
     """
     missing_hosts = []
+    index = HostIndex.from_ip_map(zabbix_hosts)
 
     for vm in vcenter_vms:
         vm_name = vm["name"]
-        vm_ip = vm["ip"]
+        vm_ips = vm.get("ips") or vm["ip"]
 
-        # Проверяем, есть ли хост с таким именем или IP в Zabbix
-        if vm_name not in zabbix_hosts and (not vm_ip or vm_ip not in [ip for ips in zabbix_hosts.values() for ip in ips]):
+        # Проверяем, есть ли хост с таким именем или любым из IP VM в Zabbix
+        if not index.has_name(vm_name) and not index.has_any_ip(vm_ips):
             missing_hosts.append(vm)
 
+    metrics.gauge("missing_hosts", len(missing_hosts))
     return missing_hosts
 
 
@@ -96,21 +85,37 @@ def save_to_file(data, filename):
 
 
 if __name__ == "__main__":
-    # Получаем данные из VCenter
-    vcenter_vms = get_vms_from_vcenter()
-    save_to_file(vcenter_vms, "vcenter_vms.json")
-
-    # Получаем данные из Zabbix
-    zabbix_hosts = get_hosts_from_zabbix()
-    save_to_file(zabbix_hosts, "zabbix_hosts.json")
-
-    # Находим хосты, которых нет в Zabbix
-    missing_hosts = find_missing_hosts(vcenter_vms, zabbix_hosts)
-
-    # Выводим результат
-    print("Хосты, которых нет в Zabbix:")
-    for host in missing_hosts:
-        print(f"Имя: {host['name']}, IP: {host['ip']}")
-
-    # Сохраняем результат сравнения в файл
-    save_to_file(missing_hosts, "missing_hosts.json")
\ No newline at end of file
+    setup_logging("main")
+    with profiling.job("main"):
+        # Получаем данные из VCenter и Zabbix параллельно
+        snapshots = run_collectors({
+            "vcenter": (get_vms_from_vcenter, VCENTER_TIMEOUT),
+            "zabbix": (get_hosts_from_zabbix, ZABBIX_TIMEOUT)
+        })
+        vcenter_vms = snapshots["vcenter"]
+        zabbix_hosts = snapshots["zabbix"]
+
+        if vcenter_vms is not None:
+            metrics.gauge("inventory_size", len(vcenter_vms), source="vcenter", server=VCENTERS[0]["host"])
+            save_to_file(vcenter_vms, "vcenter_vms.json")
+        if zabbix_hosts is not None:
+            metrics.gauge("inventory_size", len(zabbix_hosts), source="zabbix", server=config.ZABBIX_URL)
+            save_to_file(zabbix_hosts, "zabbix_hosts.json")
+
+        # Сравнение возможно только при наличии обоих снимков
+        if vcenter_vms is None or zabbix_hosts is None:
+            print("Сравнение пропущено: не удалось получить данные из всех источников.")
+            metrics.flush("main", ok=False)
+            sys.exit(1)
+
+        # Находим хосты, которых нет в Zabbix
+        missing_hosts = find_missing_hosts(vcenter_vms, zabbix_hosts)
+
+        # Выводим результат
+        print("Хосты, которых нет в Zabbix:")
+        for host in missing_hosts:
+            print(f"Имя: {host['name']}, IP: {host['ip']}")
+
+        # Сохраняем результат сравнения в файл
+        save_to_file(missing_hosts, "missing_hosts.json")
+    metrics.flush("main")
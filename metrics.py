@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Настройки необязательны: без config.py метрики только копятся в памяти
+try:
+    import config
+except ImportError:
+    config = None
+
+# Каталог textfile collector node_exporter (None — не записывать);
+# каждая точка входа пишет свой файл zabbix_scripts_<job>.prom
+METRICS_TEXTFILE_DIR = getattr(config, "METRICS_TEXTFILE_DIR", None)
+# Отправка метрик в Zabbix как trapper-элементов (протокол zabbix_sender)
+METRICS_ZABBIX_SERVER = getattr(config, "METRICS_ZABBIX_SERVER", None)
+METRICS_ZABBIX_PORT = getattr(config, "METRICS_ZABBIX_PORT", 10051)
+# Имя узла в Zabbix, на котором созданы trapper-элементы
+METRICS_ZABBIX_HOST = getattr(config, "METRICS_ZABBIX_HOST", "zabbix_scripts")
+
+PREFIX = "zabbix_scripts_"
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Описание метрик: имя → (тип, описание, границы гистограммы)
+METRICS = {
+    "stage_duration_seconds": ("histogram", "Длительность этапа синхронизации", STAGE_BUCKETS),
+    "stage_failures_total": ("counter", "Число этапов, завершившихся ошибкой", None),
+    "zabbix_api_request_seconds": ("histogram", "Задержка вызова Zabbix API по методам", REQUEST_BUCKETS),
+    "zabbix_api_errors_total": ("counter", "Ошибки вызовов Zabbix API по методам", None),
+    "vcenter_api_request_seconds": ("histogram", "Задержка вызова VCenter API по методам", REQUEST_BUCKETS),
+    "inventory_size": ("gauge", "Размер инвентаря по источникам", None),
+    "vcenter_unreachable": ("gauge", "Число VCenter, не ответивших при последней выгрузке", None),
+    "missing_hosts": ("gauge", "VM, отсутствующие в Zabbix", None),
+    "mismatched_hosts": ("gauge", "Хосты с несовпадающим статусом", None),
+    "remediation_total": ("counter", "Результаты исправлений по действиям", None),
+    "zabbix_write_total": ("counter", "Изменяющие вызовы Zabbix API по методам и результатам", None),
+    "zabbix_write_retries_total": ("counter", "Повторы изменяющих вызовов после временных ошибок", None),
+    "zabbix_write_wait_seconds": ("histogram", "Ожидание изменяющего вызова в очереди", REQUEST_BUCKETS),
+    "zabbix_write_queue_depth": ("gauge", "Изменяющие вызовы, ожидающие выполнения", None),
+    "zabbix_write_in_flight": ("gauge", "Изменяющие вызовы, выполняемые сейчас", None),
+    "zabbix_write_concurrency": ("gauge", "Текущий предел одновременных изменяющих вызовов (AIMD)", None),
+    "zabbix_write_throughput": ("gauge", "Изменяющих вызовов в секунду за последнюю минуту", None),
+    "last_run_success": ("gauge", "1, если последний запуск завершился успешно", None),
+    "last_run_timestamp_seconds": ("gauge", "Время завершения последнего запуска (Unix)", None),
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Потокобезопасный реестр метрик без внешних зависимостей:
+    счётчики, значения и гистограммы с метками, вывод в формате
+    Prometheus textfile и отправка в Zabbix.
+    """
+
+    def __init__(self, definitions=METRICS):
+        self.definitions = definitions
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, name, labels):
+        if name not in self.definitions:
+            raise KeyError(f"Неизвестная метрика: {name}")
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        buckets = self.definitions[name][2]
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0, "last": 0.0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["last"] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                key: dict(value, buckets=list(value["buckets"])) if isinstance(value, dict) else value
+                for key, value in self.values.items()
+            }
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        """
+        Текст в формате Prometheus exposition (textfile collector).
+        """
+        values = self.snapshot()
+        lines = []
+        for name, (kind, help_text, buckets) in self.definitions.items():
+            series = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+            if not series:
+                continue
+            full_name = PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in series:
+                if kind != "histogram":
+                    lines.append(f"{full_name}{_labels_text(labels)} {_number(value)}")
+                    continue
+                # Счётчики корзин в формате Prometheus накопительные
+                for bound, count in zip(list(buckets) + [float("inf")], value["buckets"] + [value["count"]]):
+                    lines.append(f"{full_name}_bucket{_labels_text(labels, [('le', _number(bound))])} {count}")
+                lines.append(f"{full_name}_sum{_labels_text(labels)} {_number(value['sum'])}")
+                lines.append(f"{full_name}_count{_labels_text(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def trapper_items(self):
+        """
+        Значения для trapper-элементов Zabbix: ключ zabbix_scripts.<метрика>[<метки>].
+        Для гистограмм передаётся последнее наблюдение (например, длительность
+        последнего выполнения этапа).
+        """
+        items = []
+        for (name, labels), value in sorted(self.snapshot().items()):
+            key = "zabbix_scripts." + name
+            if labels:
+                key += "[" + ",".join(str(label_value) for _, label_value in labels) + "]"
+            items.append((key, value["last"] if isinstance(value, dict) else value))
+        return items
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def gauge(name, value, **labels):
+    registry.gauge(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    """
+    Записывает длительность блока в гистограмму name.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - started, **labels)
+
+
+@contextmanager
+def job(stage):
+    """
+    Запуск отдельного скрипта как этапа: длительность, признак ошибки
+    и выгрузка метрик (flush) по завершении.
+    """
+    started = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        observe("stage_duration_seconds", time.monotonic() - started, stage=stage)
+        if not ok:
+            inc("stage_failures_total", stage=stage)
+        flush(stage, ok)
+
+
+def write_textfile(job, directory=METRICS_TEXTFILE_DIR, target=registry):
+    """
+    Атомарно записывает метрики в <directory>/zabbix_scripts_<job>.prom,
+    чтобы node_exporter никогда не прочитал файл наполовину.
+    """
+    import tempfile
+    path = os.path.join(directory, f"zabbix_scripts_{job}.prom")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".zabbix_scripts_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(target.render())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def send_to_zabbix(items, server=METRICS_ZABBIX_SERVER, port=METRICS_ZABBIX_PORT,
+                   host=METRICS_ZABBIX_HOST, timeout=10):
+    """
+    Отправляет значения в Zabbix по протоколу zabbix_sender.
+    :param items: Список пар (ключ trapper-элемента, значение).
+    :return: Ответ сервера (строка info, например "processed: 5; failed: 0; ...").
+    """
+    import socket
+    import struct
+    clock = int(time.time())
+    payload = json.dumps({
+        "request": "sender data",
+        "data": [{"host": host, "key": key, "value": str(value), "clock": clock} for key, value in items]
+    }).encode()
+    packet = b"ZBXD\x01" + struct.pack("<II", len(payload), 0) + payload
+
+    with socket.create_connection((server, port), timeout=timeout) as sock:
+        sock.sendall(packet)
+        header = b""
+        while len(header) < 13:
+            chunk = sock.recv(13 - len(header))
+            if not chunk:
+                break
+            header += chunk
+        if len(header) < 13 or not header.startswith(b"ZBXD"):
+            raise ValueError("Некорректный ответ Zabbix trapper")
+        length = struct.unpack("<I", header[5:9])[0]
+        body = b""
+        while len(body) < length:
+            chunk = sock.recv(length - len(body))
+            if not chunk:
+                break
+            body += chunk
+    response = json.loads(body)
+    if response.get("response") != "success":
+        raise ValueError(f"Zabbix отклонил данные: {response}")
+    return response.get("info", "")
+
+
+def flush(job, ok=True):
+    """
+    Завершение запуска: отмечает результат и время, записывает textfile
+    и отправляет значения в Zabbix, если это включено в настройках.
+    Ошибки экспорта метрик не прерывают работу скрипта.
+    """
+    gauge("last_run_success", 1 if ok else 0, script=job)
+    gauge("last_run_timestamp_seconds", int(time.time()), script=job)
+
+    if METRICS_TEXTFILE_DIR:
+        try:
+            path = write_textfile(job)
+            logging.info(f"Метрики записаны в файл: {path}")
+        except Exception as e:
+            logging.error(f"Ошибка при записи метрик в каталог {METRICS_TEXTFILE_DIR}: {e}")
+
+    if METRICS_ZABBIX_SERVER:
+        try:
+            info = send_to_zabbix(registry.trapper_items())
+            logging.info(f"Метрики отправлены в Zabbix ({METRICS_ZABBIX_SERVER}): {info}")
+        except Exception as e:
+            logging.error(f"Ошибка при отправке метрик в Zabbix {METRICS_ZABBIX_SERVER}: {e}")
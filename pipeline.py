@@ -0,0 +1,284 @@
+import argparse
+import fcntl
+import logging
+import os
+import sys
+import time
+
+import metrics
+import profiling
+from log_setup import setup_logging
+from snapshot import load_snapshot, save_snapshot
+
+# Настройки необязательны для офлайн-этапов сравнения
+try:
+    import config
+except ImportError:
+    config = None
+
+# Этапы в порядке выполнения
+STAGES = ["export-vcenter", "export-zabbix", "compare", "compare-status", "sync-status", "sync-groups",
+          "create-hosts"]
+# Этапы по умолчанию: создание хостов выполняется, только если оно выбрано явно
+DEFAULT_STAGES = [stage for stage in STAGES if stage != "create-hosts"]
+
+# Файл блокировки, общий для конвейера и демона
+PIPELINE_LOCK_FILE = getattr(config, "PIPELINE_LOCK_FILE", "/tmp/zabbix_scripts_sync.lock")
+
+# Этапы sync-status и sync-groups выполняют только изменения из плана (planner.py)
+REMEDIATION_PLANNER = getattr(config, "REMEDIATION_PLANNER", False)
+
+# Файлы, которыми этапы обменивались бы при раздельном запуске скриптов
+STAGE_FILES = {
+    "vcenter_vms": "vcenter_vms.json",
+    "zabbix_hosts": "zabbix_hosts.json",
+    "missing_hosts": "missing_hosts.json",
+    "mismatched_hosts": "mismatched_hosts.json"
+}
+# Ключи, которые сохраняются с учётом SNAPSHOT_FORMAT/SNAPSHOT_COMPRESS
+SNAPSHOT_KEYS = {"vcenter_vms", "zabbix_hosts"}
+
+
+class PipelineContext:
+    """
+    Общее состояние конвейера: данные в памяти и одна сессия Zabbix API.
+    Если данные нужного этапа не были получены в этом запуске,
+    они загружаются из соответствующего JSON-файла.
+    Подключения можно передать готовыми (например, к фейковым бэкендам
+    для нагрузочного тестирования), иначе они создаются при первом обращении.
+    """
+
+    def __init__(self, write_files=False, zapi=None, vcenter_sessions=None):
+        self.write_files = write_files
+        self.data = {}
+        self._zapi = zapi
+        self._vcenter_sessions = vcenter_sessions
+
+    @property
+    def zapi(self):
+        if self._zapi is None:
+            from zabbix_client import connect_to_zabbix
+            self._zapi = connect_to_zabbix()
+        return self._zapi
+
+    @property
+    def vcenter_sessions(self):
+        if self._vcenter_sessions is None:
+            from export_vcenter import VCenterSessions
+            self._vcenter_sessions = VCenterSessions()
+        return self._vcenter_sessions
+
+    def api_calls(self):
+        """
+        Число вызовов Zabbix API, сделанных через общую сессию.
+        """
+        return self._zapi.stats.total_calls() if self._zapi is not None else 0
+
+    def get(self, key):
+        if key not in self.data:
+            filename = STAGE_FILES[key]
+            self.data[key] = load_snapshot(filename)
+            logging.info(f"Файл успешно загружен: {filename}")
+        return self.data[key]
+
+    def put(self, key, value):
+        self.data[key] = value
+        if self.write_files:
+            if key in SNAPSHOT_KEYS:
+                # Снимки — в настроенном формате, как у export_vcenter/export_zabbix
+                save_snapshot(value, STAGE_FILES[key])
+            else:
+                # Результаты сравнения — обычным JSON, как у compare_hosts*
+                save_snapshot(value, STAGE_FILES[key], fmt="json", compress=False)
+
+
+def stage_export_vcenter(ctx):
+    from export_vcenter import (
+        VCENTER_DELTA_EXPORT, VCENTER_DELTA_STATE_FILE, VCENTERS, get_vms_from_vcenters
+    )
+    from inventory_store import record_snapshot
+    if len(VCENTERS) == 1 and VCENTER_DELTA_EXPORT:
+        from vcenter_delta import get_vms_from_vcenter_delta
+        ctx.put("vcenter_vms", get_vms_from_vcenter_delta(VCENTER_DELTA_STATE_FILE))
+        record_snapshot("vcenter", ctx.data["vcenter_vms"])
+        return
+
+    vms, failed = get_vms_from_vcenters(sessions=ctx.vcenter_sessions)
+    if len(failed) == len(VCENTERS):
+        raise RuntimeError("Ни один VCenter не ответил.")
+    ctx.data["vcenter_failed"] = failed
+    ctx.put("vcenter_vms", vms)
+    if not failed:
+        # Неполный снимок в истории выглядел бы как исчезновение VM недоступных VCenter
+        record_snapshot("vcenter", vms)
+
+
+def stage_export_zabbix(ctx):
+    from export_zabbix import get_hosts_from_zabbix
+    from inventory_store import record_snapshot
+    ctx.data["zabbix_exported_at"] = time.time()
+    ctx.put("zabbix_hosts", get_hosts_from_zabbix(ctx.zapi))
+    record_snapshot("zabbix", ctx.data["zabbix_hosts"])
+
+
+def stage_compare(ctx):
+    from compare_hosts import build_zabbix_ip_map, find_missing_hosts
+    zabbix_hosts = build_zabbix_ip_map(ctx.get("zabbix_hosts"))
+    ctx.put("missing_hosts", find_missing_hosts(ctx.get("vcenter_vms"), zabbix_hosts))
+
+
+def stage_compare_status(ctx):
+    from compare_hosts_status import find_mismatched_hosts
+    ctx.put("mismatched_hosts", find_mismatched_hosts(ctx.get("vcenter_vms"), ctx.get("zabbix_hosts")))
+
+
+def run_planned(ctx, action):
+    """
+    Выполняет действие плана исправлений. План строится один раз на запуск;
+    если в плане нет изменений, Zabbix API не вызывается.
+    """
+    from planner import build_plan, execute_plan, load_state, prune_state, save_state, snapshot_time
+    if "plan" not in ctx.data:
+        exported_at = ctx.data.get("zabbix_exported_at")
+        if exported_at is None:
+            exported_at = snapshot_time(STAGE_FILES["zabbix_hosts"])
+        ctx.data["plan_state"] = load_state()
+        ctx.data["plan"] = build_plan(ctx.get("vcenter_vms"), ctx.get("zabbix_hosts"), ctx.data["plan_state"], exported_at)
+    plan, state = ctx.data["plan"], ctx.data["plan_state"]
+    if not plan[action]:
+        logging.info(f"План: изменений '{action}' нет")
+        return
+    report = execute_plan(ctx.zapi, plan, state, actions=(action,))
+    ctx.data[f"{action}_report"] = report[action]
+    prune_state(state, ctx.get("vcenter_vms"))
+    save_state(state)
+
+
+def stage_sync_status(ctx):
+    if REMEDIATION_PLANNER:
+        run_planned(ctx, "status")
+        return
+    from remediation_journal import open_journal
+    from zabbix_host_status_manager import build_status_changes, change_hosts_status_batch
+    statuses = build_status_changes(ctx.get("mismatched_hosts"))
+    ctx.data["status_report"] = change_hosts_status_batch(ctx.zapi, statuses, journal=open_journal())
+
+
+def stage_sync_groups(ctx):
+    if REMEDIATION_PLANNER:
+        run_planned(ctx, "group")
+        return
+    from remediation_journal import open_journal
+    from zabbix_add_hosts_to_group import GROUP_NAME, get_hostgroup_id, sync_group_membership
+    group_id = get_hostgroup_id(ctx.zapi, GROUP_NAME)
+    if not group_id:
+        raise ValueError(f"Группа '{GROUP_NAME}' не существует.")
+    kwargs = {}
+    if ctx.data.get("vcenter_failed"):
+        # Инвентарь неполный: не удаляем из группы хосты недоступных VCenter
+        kwargs["remove_stale"] = False
+    ctx.data["group_report"] = sync_group_membership(ctx.zapi, ctx.get("vcenter_vms"), group_id,
+                                                     journal=open_journal(), **kwargs)
+
+
+def stage_create_hosts(ctx):
+    if REMEDIATION_PLANNER:
+        run_planned(ctx, "create")
+        return
+    from zabbix_create_hosts import create_missing_hosts
+    ctx.data["create_report"] = create_missing_hosts(ctx.zapi, ctx.get("missing_hosts"), ctx.get("zabbix_hosts"))
+
+
+STAGE_HANDLERS = {
+    "export-vcenter": stage_export_vcenter,
+    "export-zabbix": stage_export_zabbix,
+    "compare": stage_compare,
+    "compare-status": stage_compare_status,
+    "sync-status": stage_sync_status,
+    "sync-groups": stage_sync_groups,
+    "create-hosts": stage_create_hosts
+}
+
+
+def run_pipeline(stages=None, write_files=False, ctx=None):
+    """
+    Выполняет выбранные этапы в одном процессе, передавая данные в памяти.
+    При ошибке этапа конвейер останавливается: следующие этапы зависят от предыдущих.
+    :param stages: Список этапов (по умолчанию DEFAULT_STAGES), выполняются в порядке STAGES.
+    :param write_files: Записывать промежуточные JSON-файлы для отладки.
+    :return: Кортеж (длительности этапов {этап: секунды}, признак успеха).
+    """
+    selected = [stage for stage in STAGES if stage in (stages or DEFAULT_STAGES)]
+    ctx = ctx or PipelineContext(write_files=write_files)
+    durations = {}
+    ok = True
+
+    for stage in selected:
+        started = time.monotonic()
+        try:
+            logging.info(f"Этап '{stage}' запущен")
+            with profiling.stage(stage):
+                STAGE_HANDLERS[stage](ctx)
+        except Exception as e:
+            logging.error(f"Этап '{stage}' завершился с ошибкой: {e}")
+            metrics.inc("stage_failures_total", stage=stage)
+            ok = False
+        finally:
+            durations[stage] = time.monotonic() - started
+            metrics.observe("stage_duration_seconds", durations[stage], stage=stage)
+        if not ok:
+            break
+
+    summary = ", ".join(f"{stage}: {seconds:.2f} с" for stage, seconds in durations.items())
+    logging.info(f"Длительность этапов: {summary}")
+    return durations, ok
+
+
+def acquire_lock(path):
+    """
+    Берёт эксклюзивную блокировку файла, чтобы запуски синхронизации
+    (из cron, вручную или демоном) не пересекались.
+    Возвращает открытый файл (блокировка держится, пока он открыт) или None.
+    """
+    # Без усечения при открытии: иначе конкурирующий процесс стёр бы PID владельца
+    lock_file = open(path, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Синхронизация VCenter и Zabbix в одном процессе.")
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=DEFAULT_STAGES,
+        help="Этапы для выполнения (по умолчанию все, кроме create-hosts)."
+    )
+    parser.add_argument(
+        "--write-files", action="store_true",
+        help="Записывать промежуточные JSON-файлы для отладки."
+    )
+    parser.add_argument(
+        "--profile", metavar="DIR", default=profiling.PROFILE_DIR,
+        help="Профилировать этапы и вызовы бэкендов, результаты — в каталог DIR."
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    setup_logging("pipeline")
+    args = parse_args()
+    lock = acquire_lock(PIPELINE_LOCK_FILE)
+    if lock is None:
+        logging.error(f"Синхронизация уже выполняется (блокировка {PIPELINE_LOCK_FILE}).")
+        sys.exit(1)
+    profiling.enable(args.profile)
+    with profiling.session("pipeline"):
+        _, ok = run_pipeline(args.stages, write_files=args.write_files)
+    metrics.flush("pipeline", ok)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,373 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import metrics
+import profiling
+from compare_hosts import find_missing_hosts
+from compare_hosts_status import find_mismatched_hosts
+from host_index import HostIndex
+from host_rules import normalize_hostname
+from log_setup import sample, setup_logging
+from snapshot import find_snapshot, load_snapshot
+from zabbix_add_hosts_to_group import GROUP_NAME, get_hostgroup_id
+from zabbix_create_hosts import ZABBIX_CREATE_GROUPS, ZABBIX_CREATE_STATUS, create_missing_hosts
+from zabbix_host_status_manager import ZABBIX_BATCH_SIZE, determine_status
+from write_scheduler import chunked, get_scheduler
+
+# Настройки необязательны для построения плана без выполнения
+try:
+    import config
+except ImportError:
+    config = None
+
+# Последнее применённое состояние: hostid, установленные статусы и членство в группе
+REMEDIATION_STATE_FILE = getattr(config, "REMEDIATION_STATE_FILE", "remediation_state.json")
+# Сколько секунд доверять hostid и членству в группе из состояния; после этого
+# они сверяются с Zabbix заново (хост могли удалить из группы или пересоздать).
+# None — не сверять
+REMEDIATION_STATE_TTL = getattr(config, "REMEDIATION_STATE_TTL", 24 * 3600)
+
+ACTIONS = ("status", "group", "create")
+# Создание хостов выполняется, только если оно выбрано явно
+DEFAULT_ACTIONS = ("status", "group")
+
+
+def empty_state():
+    return {"group_id": None, "hosts": {}}
+
+
+def load_state(filename=REMEDIATION_STATE_FILE):
+    """
+    Загружает последнее применённое состояние.
+    Если файла нет или он повреждён, возвращается пустое состояние:
+    все изменения будут сверены с Zabbix заново.
+    """
+    try:
+        with open(filename, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return empty_state()
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось прочитать состояние {filename}: {e}. Состояние будет построено заново.")
+        return empty_state()
+    state.setdefault("group_id", None)
+    state.setdefault("hosts", {})
+    return state
+
+
+def save_state(state, filename=REMEDIATION_STATE_FILE):
+    """
+    Атомарно сохраняет состояние (через временный файл и os.replace).
+    """
+    tmp_path = f"{filename}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, filename)
+    except Exception as e:
+        logging.error(f"Ошибка при сохранении состояния {filename}: {e}")
+        raise
+    logging.info(f"Состояние исправлений сохранено: {filename} ({len(state['hosts'])} хостов)")
+
+
+def prune_state(state, vcenter_vms):
+    """
+    Удаляет из состояния хосты, VM которых больше нет в VCenter.
+    """
+    names = {normalize_hostname(vm["host"]) for vm in vcenter_vms if vm.get("host")}
+    state["hosts"] = {name: entry for name, entry in state["hosts"].items() if name in names}
+
+
+def is_fresh(entry, ttl=REMEDIATION_STATE_TTL, now=None):
+    """
+    Проверялись ли hostid и членство в группе хоста в Zabbix не раньше ttl секунд назад.
+    """
+    if not ttl:
+        return True
+    return entry.get("checked_at", 0) > (now or time.time()) - ttl
+
+
+def snapshot_time(filename):
+    """
+    Время выгрузки снимка (время изменения файла) или None, если снимка нет.
+    """
+    path = find_snapshot(filename)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def build_plan(vcenter_vms, zabbix_hosts, state, exported_at=None, ttl=REMEDIATION_STATE_TTL):
+    """
+    Строит план исправлений без обращения к Zabbix API.
+    Статус хоста, применённый после выгрузки Zabbix (applied_at > exported_at),
+    считается актуальнее выгруженного. Членство в группе известно только
+    из состояния, поэтому в план попадают все включённые VM, членство которых
+    не подтверждено за последние ttl секунд, а при выполнении лишние
+    отсеиваются одним host.get.
+    :param exported_at: Время выгрузки zabbix_hosts (Unix); None — выгрузка свежая.
+    :return: Словарь {"status": [...], "group": [...], "create": [...]}.
+    """
+    vcenter_vms = list(vcenter_vms)
+    zabbix_hosts = list(zabbix_hosts)
+    hosts_state = state["hosts"]
+
+    known_hosts = []
+    for host in zabbix_hosts:
+        entry = hosts_state.get(host.get("host"))
+        if exported_at is not None and entry and "status" in entry and entry.get("applied_at", 0) > exported_at:
+            host = dict(host, status="enabled" if entry["status"] == 0 else "disabled")
+        known_hosts.append(host)
+
+    status = []
+    for host in find_mismatched_hosts(vcenter_vms, known_hosts):
+        new_status = determine_status(host["vmware_status"])
+        if new_status is not None:
+            status.append(dict(host, new_status=new_status))
+
+    in_zabbix = {host["host"] for host in zabbix_hosts if "host" in host}
+    wanted = {normalize_hostname(vm["host"]) for vm in vcenter_vms if vm.get("host") and vm.get("status") != "poweredOff"}
+    now = time.time()
+    group = [
+        {"host": name} for name in sorted(wanted & in_zabbix)
+        if not (hosts_state.get(name, {}).get("in_group") and is_fresh(hosts_state[name], ttl, now))
+    ]
+
+    create = find_missing_hosts(vcenter_vms, HostIndex.from_hosts(zabbix_hosts))
+    return {"status": status, "group": group, "create": create}
+
+
+def format_plan(plan):
+    """
+    Текст плана для вывода при --dry-run.
+    """
+    lines = [
+        f"План: статусов {len(plan['status'])}, в группу {len(plan['group'])}, "
+        f"создать {len(plan['create'])}"
+    ]
+    for item in plan["status"]:
+        new_status = "enabled" if item["new_status"] == 0 else "disabled"
+        lines.append(f"  ~ статус {item['host']}: {item['zabbix_status']} -> {new_status}")
+    for item in plan["group"]:
+        lines.append(f"  + группа '{GROUP_NAME}': {item['host']}")
+    for item in plan["create"]:
+        lines.append(f"  + создать {item['host']} ({item['ip']})")
+    return lines
+
+
+def is_empty(plan, actions=DEFAULT_ACTIONS):
+    return not any(plan[action] for action in actions)
+
+
+def _resolve(zapi, names, hosts_state, ttl=REMEDIATION_STATE_TTL):
+    """
+    Запрашивает hostid, статус и группы только для хостов, чьи hostid
+    не известны из состояния или проверялись раньше ttl секунд назад.
+    Устаревшие hostid и членство в группе заменяются ответом Zabbix.
+    :return: Кортеж ({имя: хост из host.get}, число вызовов API).
+    """
+    now = time.time()
+    unresolved = sorted(
+        name for name in names
+        if not hosts_state.get(name, {}).get("hostid") or not is_fresh(hosts_state[name], ttl, now)
+    )
+    if not unresolved:
+        return {}, 0
+    for name in unresolved:
+        if name in hosts_state:
+            hosts_state[name].pop("hostid", None)
+            hosts_state[name].pop("in_group", None)
+    current = {}
+    for host in zapi.host.get(filter={"host": unresolved}, output=["hostid", "host", "status"],
+                              selectGroups=["groupid"]):
+        current[host["host"]] = host
+        hosts_state.setdefault(host["host"], {}).update(hostid=host["hostid"], checked_at=now)
+    return current, 1
+
+
+def _execute_status(zapi, items, hosts_state, current, batch_size):
+    results = {}
+    api_calls = 0
+    by_status = {}
+    for item in items:
+        name = item["host"]
+        entry = hosts_state.get(name)
+        if not entry or not entry.get("hostid"):
+            results[name] = "not_found"
+            continue
+        host = current.get(name)
+        if host is not None and int(host["status"]) == item["new_status"]:
+            entry.update(status=item["new_status"], applied_at=time.time())
+            results[name] = "skipped"
+            continue
+        by_status.setdefault(item["new_status"], []).append(name)
+
+    scheduler = get_scheduler()
+    futures = [
+        (status, batch, scheduler.submit("host.massupdate", zapi.host.massupdate,
+                                         hosts=[{"hostid": hosts_state[name]["hostid"]} for name in batch],
+                                         status=status))
+        for status, names in by_status.items()
+        for batch in chunked(names, batch_size)
+    ]
+    for status, batch, future in futures:
+        new_status = "enabled" if status == 0 else "disabled"
+        api_calls += 1
+        try:
+            future.result()
+            outcome = "updated"
+            logging.info(f"Статус {len(batch)} хостов изменен на {new_status}: {sample(batch)}")
+        except Exception as e:
+            outcome = "failed"
+            logging.error(f"Ошибка при изменении статуса {len(batch)} хостов ({sample(batch)}): {e}")
+        for name in batch:
+            results[name] = outcome
+            if outcome == "updated":
+                hosts_state[name].update(status=status, applied_at=time.time())
+            else:
+                # hostid мог устареть: в следующий раз он будет запрошен заново
+                hosts_state[name].pop("hostid", None)
+    return {"results": results, "api_calls": api_calls}
+
+
+def _execute_group(zapi, items, state, current, batch_size):
+    hosts_state = state["hosts"]
+    report = {"added": [], "removed": [], "not_found": [], "failed": [], "skipped": [], "api_calls": 0}
+    to_add = []
+    group_id = state.get("group_id")
+    if items and not group_id:
+        group_id = get_hostgroup_id(zapi, GROUP_NAME)
+        report["api_calls"] += 1
+        if not group_id:
+            raise ValueError(f"Группа '{GROUP_NAME}' не существует.")
+        state["group_id"] = group_id
+
+    for item in items:
+        name = item["host"]
+        entry = hosts_state.get(name)
+        if not entry or not entry.get("hostid"):
+            report["not_found"].append(name)
+            continue
+        host = current.get(name)
+        if host is not None and group_id in {group["groupid"] for group in host.get("groups", [])}:
+            entry["in_group"] = True
+            report["skipped"].append(name)
+            continue
+        to_add.append(name)
+
+    scheduler = get_scheduler()
+    futures = [
+        (batch, scheduler.submit("hostgroup.massadd", zapi.hostgroup.massadd, groups=[{"groupid": group_id}],
+                                 hosts=[{"hostid": hosts_state[name]["hostid"]} for name in batch]))
+        for batch in chunked(to_add, batch_size)
+    ]
+    for batch, future in futures:
+        report["api_calls"] += 1
+        try:
+            future.result()
+            logging.info(f"Группа '{GROUP_NAME}' добавлена к {len(batch)} хостам: {sample(batch)}")
+            report["added"].extend(batch)
+            for name in batch:
+                hosts_state[name]["in_group"] = True
+        except Exception as e:
+            logging.error(f"Ошибка при добавлении {len(batch)} хостов ({sample(batch)}) в группу: {e}")
+            report["failed"].extend(batch)
+            # Устаревшими могли оказаться hostid или ID группы — запросим заново
+            state["group_id"] = None
+            for name in batch:
+                hosts_state[name].pop("hostid", None)
+    return report
+
+
+def _record_created(report, hosts_state):
+    applied_at = time.time()
+    for name, hostid in report["created"].items():
+        hosts_state[name] = {
+            "hostid": hostid,
+            "status": ZABBIX_CREATE_STATUS,
+            "applied_at": applied_at,
+            "checked_at": applied_at,
+            "in_group": GROUP_NAME in ZABBIX_CREATE_GROUPS
+        }
+
+
+def execute_plan(zapi, plan, state, actions=DEFAULT_ACTIONS, batch_size=ZABBIX_BATCH_SIZE):
+    """
+    Выполняет только изменения из плана. hostid берутся из состояния;
+    для неизвестных выполняется один host.get, который заодно отсеивает
+    уже применённые изменения. Состояние обновляется по результатам.
+    Созданные хосты сразу попадают в состояние.
+    :return: Словарь {"status": отчёт как у change_hosts_status_batch,
+             "group": отчёт как у sync_group_membership,
+             "create": отчёт как у create_missing_hosts} для выбранных действий.
+    """
+    hosts_state = state["hosts"]
+    names = {item["host"] for action in actions if action != "create" for item in plan[action]}
+    current, api_calls = _resolve(zapi, names, hosts_state)
+
+    report = {}
+    if "status" in actions:
+        report["status"] = _execute_status(zapi, plan["status"], hosts_state, current, batch_size)
+        report["status"]["api_calls"] += api_calls
+        api_calls = 0
+        outcomes = list(report["status"]["results"].values())
+        for outcome in set(outcomes):
+            metrics.inc("remediation_total", outcomes.count(outcome), action="status", outcome=outcome)
+    if "group" in actions:
+        report["group"] = _execute_group(zapi, plan["group"], state, current, batch_size)
+        report["group"]["api_calls"] += api_calls
+        for outcome in ("added", "not_found", "failed"):
+            metrics.inc("remediation_total", len(report["group"][outcome]), action="group", outcome=outcome)
+    if "create" in actions and plan["create"]:
+        # Дубликаты по выгрузке уже отсеяны при построении плана
+        report["create"] = create_missing_hosts(zapi, plan["create"])
+        _record_created(report["create"], hosts_state)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="План исправлений по снимкам и последнему применённому состоянию.")
+    parser.add_argument("--dry-run", action="store_true", help="Только вывести план, не обращаясь к Zabbix.")
+    parser.add_argument("--state", default=REMEDIATION_STATE_FILE, help="Файл последнего применённого состояния.")
+    parser.add_argument("--actions", nargs="+", choices=ACTIONS, default=list(DEFAULT_ACTIONS),
+                        help="Выполняемые действия (по умолчанию status и group; create — явно).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Строит план по vcenter_vms.json, zabbix_hosts.json и состоянию,
+    выводит его и выполняет (без --dry-run).
+    """
+    args = parse_args(argv)
+    try:
+        with metrics.job("plan"), profiling.job("plan"):
+            vcenter_vms = load_snapshot("vcenter_vms.json")
+            zabbix_hosts = load_snapshot("zabbix_hosts.json")
+            state = load_state(args.state)
+
+            plan = build_plan(vcenter_vms, zabbix_hosts, state, snapshot_time("zabbix_hosts.json"))
+            print("\n".join(format_plan(plan)))
+            if args.dry_run:
+                return
+
+            if is_empty(plan, args.actions):
+                logging.info("Изменений нет, обращения к Zabbix API не требуются.")
+            else:
+                from zabbix_client import connect_to_zabbix
+                report = execute_plan(connect_to_zabbix(), plan, state, args.actions)
+                calls = sum(item["api_calls"] for item in report.values())
+                logging.info(f"План выполнен, вызовов API: {calls}")
+            if plan["create"] and "create" not in args.actions:
+                logging.info(f"Хостов к созданию: {len(plan['create'])} ({sample(item['host'] for item in plan['create'])})")
+            prune_state(state, vcenter_vms)
+            save_state(state, args.state)
+
+    except Exception as e:
+        logging.error(f"Произошла ошибка: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("planner")
+    main()
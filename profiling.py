@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Настройки необязательны: без config.py профилирование выключено
+try:
+    import config
+except ImportError:
+    config = None
+
+# Каталог для профилей (None — профилирование выключено); каждый запуск
+# пишет в свой подкаталог <этап или скрипт>-<время>-<pid>
+PROFILE_DIR = getattr(config, "PROFILE_DIR", None)
+# Сколько функций показывать в сводке горячих точек
+PROFILE_TOP = getattr(config, "PROFILE_TOP", 25)
+# Максимум вызовов бэкендов в трассировке одного запуска
+PROFILE_TRACE_LIMIT = getattr(config, "PROFILE_TRACE_LIMIT", 100000)
+
+# Категории для разбора собственного времени функций (tottime):
+# категория → подстроки пути модуля или имени встроенной функции
+CATEGORIES = [
+    ("json", ("json", "_json")),
+    ("vcenter (pyVmomi)", ("pyVmomi", "pyVim")),
+    ("zabbix/http", ("pyzabbix", "requests", "urllib3", "http/client", "socket", "ssl")),
+    ("regex", ("re/__init__", "/re.py", "re.Pattern", "_sre", "sre_")),
+    ("sqlite", ("sqlite3",)),
+    ("gzip/io", ("gzip", "zlib", "_io")),
+]
+
+
+class Profiler:
+    """
+    Профилирование запуска: cProfile по этапам (файл .pstats на этап),
+    трассировка каждого вызова VCenter и Zabbix (время начала, длительность,
+    ошибка, поток) и текстовая сводка горячих точек.
+    cProfile видит только поток, запустивший этап, поэтому функции рабочих
+    потоков оборачиваются в profiled(): их профили добавляются к профилю
+    этапа (ожидание потоков в основном потоке тоже остаётся в профиле).
+    """
+
+    def __init__(self, directory, job):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.directory = os.path.join(directory, f"{job}-{stamp}-{os.getpid()}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.job = job
+        self.lock = threading.Lock()
+        self.trace = []
+        self.dropped = 0
+        self.stages = {}
+        self.thread_profiles = []
+        self.active = False
+
+    @contextmanager
+    def stage(self, name):
+        # cProfile не поддерживает вложенное профилирование: внутренний этап
+        # учитывается в профиле внешнего
+        if self.active:
+            yield
+            return
+        # cProfile и pstats импортируются только при включённом профилировании,
+        # чтобы не замедлять запуск скриптов
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.active = True
+        started = time.monotonic()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.active = False
+            stats = pstats.Stats(profile)
+            with self.lock:
+                for thread_profile in self.thread_profiles:
+                    stats.add(thread_profile)
+                self.thread_profiles = []
+            path = os.path.join(self.directory, f"{name}.pstats")
+            stats.dump_stats(path)
+            self.stages[name] = (path, time.monotonic() - started)
+
+    def run_in_thread(self, func, args, kwargs):
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: профиль этапа (sys.monitoring) уже видит все потоки
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self.lock:
+                self.thread_profiles.append(profile)
+
+    def record_call(self, backend, method, started, seconds, error=False):
+        with self.lock:
+            if len(self.trace) >= PROFILE_TRACE_LIMIT:
+                self.dropped += 1
+                return
+            self.trace.append({
+                "time": round(started, 6),
+                "backend": backend,
+                "method": method,
+                "seconds": round(seconds, 6),
+                "error": error,
+                "thread": threading.current_thread().name
+            })
+
+    def _write_trace(self):
+        path = os.path.join(self.directory, "trace.jsonl")
+        with open(path, "w") as f:
+            for call in self.trace:
+                f.write(json.dumps(call, ensure_ascii=False) + "\n")
+        return path
+
+    def _trace_summary(self):
+        by_method = {}
+        for call in self.trace:
+            by_method.setdefault((call["backend"], call["method"]), []).append(call["seconds"])
+        lines = ["Вызовы бэкендов (по суммарному времени):"]
+        rows = sorted(by_method.items(), key=lambda item: sum(item[1]), reverse=True)
+        for (backend, method), durations in rows:
+            durations.sort()
+            p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+            lines.append(
+                f"  {backend:<8} {method:<40} вызовов {len(durations):>6} всего {sum(durations):9.3f} с "
+                f"медиана {durations[len(durations) // 2] * 1000:8.1f} мс p95 {p95 * 1000:8.1f} мс "
+                f"максимум {durations[-1] * 1000:8.1f} мс"
+            )
+        if self.dropped:
+            lines.append(f"  (не записано вызовов сверх PROFILE_TRACE_LIMIT: {self.dropped})")
+        return lines
+
+    @staticmethod
+    def _categories(stats):
+        totals = {name: 0.0 for name, _ in CATEGORIES}
+        for (filename, _, function), (_, _, tottime, _, _) in stats.stats.items():
+            location = f"{filename}:{function}"
+            for name, markers in CATEGORIES:
+                if any(marker in location for marker in markers):
+                    totals[name] += tottime
+                    break
+        return totals
+
+    def _stage_summary(self, name, path, seconds):
+        import io
+        import pstats
+        stats = pstats.Stats(path)
+        lines = [f"Этап '{name}': {seconds:.3f} с"]
+        for category, total in self._categories(stats).items():
+            if total:
+                lines.append(f"  {category:<20} {total:9.3f} с ({total / seconds * 100 if seconds else 0:5.1f}%)")
+        for sort_key, title in (("tottime", "собственное время"), ("cumulative", "с учётом вложенных")):
+            output = io.StringIO()
+            pstats.Stats(path, stream=output).sort_stats(sort_key).print_stats(PROFILE_TOP)
+            lines.append(f"  Топ {PROFILE_TOP} функций ({title}):")
+            # Пропускаем заголовок pstats до таблицы
+            table = output.getvalue().split("\n")
+            start = next((i for i, line in enumerate(table) if line.strip().startswith("ncalls")), 0)
+            lines.extend("    " + line for line in table[start:] if line.strip())
+        return lines
+
+    def finish(self):
+        """
+        Записывает трассировку и сводку горячих точек. Возвращает путь к сводке.
+        """
+        self._write_trace()
+        lines = [f"Профиль запуска '{self.job}'", ""]
+        for name, (path, seconds) in self.stages.items():
+            lines.extend(self._stage_summary(name, path, seconds))
+            lines.append("")
+        lines.extend(self._trace_summary())
+        path = os.path.join(self.directory, "summary.txt")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+
+# Профилировщик текущего запуска (None — профилирование не ведётся)
+current = None
+
+
+def enable(directory):
+    """
+    Включает профилирование для этого процесса (например, по флагу --profile).
+    """
+    global PROFILE_DIR
+    PROFILE_DIR = directory
+
+
+@contextmanager
+def session(job):
+    """
+    Запуск точки входа: если задан PROFILE_DIR, создаёт профилировщик,
+    а по завершении записывает трассировку и сводку.
+    """
+    global current
+    if not PROFILE_DIR or current is not None:
+        yield
+        return
+    current = Profiler(PROFILE_DIR, job)
+    try:
+        yield
+    finally:
+        profiler, current = current, None
+        try:
+            path = profiler.finish()
+            logging.info(f"Профиль запуска сохранён: {path}")
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении профиля в {profiler.directory}: {e}")
+
+
+@contextmanager
+def stage(name):
+    """
+    Профилирует блок кода как отдельный этап (если профилирование включено).
+    """
+    if current is None:
+        yield
+        return
+    with current.stage(name):
+        yield
+
+
+@contextmanager
+def job(name):
+    """
+    Отдельный скрипт целиком: сессия профилирования из одного этапа.
+    """
+    with session(name), stage(name):
+        yield
+
+
+def profiled(func):
+    """
+    Оборачивает функцию, выполняемую в рабочем потоке, чтобы её профиль
+    попал в профиль текущего этапа.
+    """
+    def wrapper(*args, **kwargs):
+        profiler = current
+        if profiler is None or not profiler.active:
+            return func(*args, **kwargs)
+        return profiler.run_in_thread(func, args, kwargs)
+    return wrapper
+
+
+def record_call(backend, method, started, seconds, error=False):
+    """
+    Добавляет вызов бэкенда в трассировку.
+    :param started: Время начала (Unix, time.time()).
+    """
+    if current is not None:
+        current.record_call(backend, method, started, seconds, error)
+
+
+@contextmanager
+def traced(backend, method):
+    """
+    Трассирует блок кода как один вызов бэкенда.
+    """
+    if current is None:
+        yield
+        return
+    started = time.time()
+    error = True
+    try:
+        yield
+        error = False
+    finally:
+        current.record_call(backend, method, started, time.time() - started, error)
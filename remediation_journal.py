@@ -0,0 +1,285 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+
+# Настройки необязательны: без config.py действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
+
+# Журнал исправлений (JSON Lines, только дозапись); у каждого действия свой файл:
+# remediation_journal.status.jsonl, remediation_journal.group.jsonl. None — журнал не ведётся
+REMEDIATION_JOURNAL = getattr(config, "REMEDIATION_JOURNAL", "remediation_journal.jsonl")
+# Прерванный запуск старше стольких секунд не продолжается: его hostid
+# и выполненные пакеты могли устареть, план строится заново (None — без ограничения)
+REMEDIATION_JOURNAL_MAX_AGE = getattr(config, "REMEDIATION_JOURNAL_MAX_AGE", 6 * 3600)
+
+
+def fingerprint(action, payload):
+    """
+    Отпечаток входных данных действия: прерванный запуск продолжается,
+    только если входные данные не изменились.
+    """
+    text = json.dumps([action, payload], sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class JournalRun:
+    """
+    Запуск действия в журнале: запланированные пакеты (chunk) с hostid
+    и отметки о выполненных. Для продолженного запуска (resumed) пакеты
+    берутся из журнала, и хосты в Zabbix повторно не запрашиваются.
+    """
+
+    def __init__(self, journal, run_id, action, meta=None, chunks=None, done=None, resumed=False):
+        self.journal = journal
+        self.run_id = run_id
+        self.action = action
+        self.meta = meta or {}
+        self.chunks = chunks or []
+        self.done = done or set()
+        self.resumed = resumed
+
+    def plan(self, chunks, meta=None):
+        """
+        Записывает план запуска: сведения для отчёта (meta) и пакеты.
+        Каждому пакету присваивается идентификатор <run_id>:<номер>.
+        Пустой план в журнал не записывается: запуск без изменений
+        не создаёт файл и не вызывает fsync.
+        :param chunks: Список словарей {"op": метод API, "hosts": {имя: hostid}, ...}.
+        """
+        self.meta = meta or {}
+        self.chunks = [dict(chunk, chunk=f"{self.run_id}:{n}") for n, chunk in enumerate(chunks)]
+        if not self.chunks:
+            return self.chunks
+        self.journal.append({"type": "run", "run": self.run_id, "action": self.action,
+                             "meta": self.meta, "time": time.time()})
+        for chunk in self.chunks:
+            self.journal.append(dict(chunk, type="planned", run=self.run_id))
+        # План записан целиком: только такой запуск можно продолжить
+        self.journal.append({"type": "ready", "run": self.run_id})
+        self.journal.sync()
+        return self.chunks
+
+    def pending(self):
+        return [chunk for chunk in self.chunks if chunk["chunk"] not in self.done]
+
+    def record(self, chunk, ok, error=None):
+        """
+        Отмечает результат пакета (контрольная точка): выполненный пакет
+        не будет отправлен повторно при продолжении запуска.
+        """
+        record = {"type": "done" if ok else "failed", "run": self.run_id, "chunk": chunk["chunk"]}
+        if error is not None:
+            record["error"] = str(error)
+        self.journal.append(record)
+        self.journal.sync()
+        if ok:
+            self.done.add(chunk["chunk"])
+
+    def complete(self):
+        """
+        Завершает запуск: если все пакеты выполнены, его записи удаляются
+        из журнала при сжатии. Иначе запуск остаётся для продолжения.
+        :return: True, если запуск завершён полностью.
+        """
+        if self.pending():
+            logging.warning(f"Журнал исправлений: '{self.action}' — не выполнено пакетов: {len(self.pending())}; "
+                            f"следующий запуск продолжит с контрольной точки")
+            self.journal.close()
+            self.journal.release()
+            return False
+        if self.chunks:
+            self.journal.append({"type": "complete", "run": self.run_id})
+            self.journal.compact()
+        self.journal.release()
+        return True
+
+
+class RemediationJournal:
+    """
+    Журнал исправлений только на дозапись (JSON Lines, одна запись на строку):
+    запуски действий, их пакеты с hostid и отметки о выполнении.
+    После сбоя или потери сессии следующий запуск с теми же входными данными
+    продолжает с последней контрольной точки. Завершённые и устаревшие запуски
+    удаляются сжатием (перезапись через временный файл и os.replace).
+    У каждого действия свой файл (<имя>.<действие><расширение>), и на время
+    запуска он блокируется (fcntl.flock): сжатие журнала одним процессом
+    не теряет записи другого.
+    """
+
+    def __init__(self, path=REMEDIATION_JOURNAL, max_age=REMEDIATION_JOURNAL_MAX_AGE):
+        self.base_path = path
+        self.path = None
+        self.max_age = max_age
+        self.file = None
+        self.lock_file = None
+
+    def action_path(self, action):
+        root, ext = os.path.splitext(self.base_path)
+        return f"{root}.{action}{ext}"
+
+    def _lock(self):
+        """
+        Блокирует журнал действия на время запуска.
+        :return: False, если журнал занят другим процессом.
+        """
+        self.lock_file = open(f"{self.path}.lock", "a+")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def release(self):
+        """
+        Снимает блокировку журнала действия (после завершения запуска).
+        """
+        self.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def _load(self):
+        """
+        :return: Словарь run_id → {"action", "meta", "time", "chunks", "ready", "done", "complete"}
+                 в порядке записи.
+        """
+        runs = {}
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return runs
+        for number, line in enumerate(lines, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Последняя строка могла не дописаться при сбое
+                logging.warning(f"Журнал исправлений {self.path}: пропущена повреждённая строка {number}")
+                continue
+            kind = record.pop("type", None)
+            run_id = record.pop("run", None)
+            if kind == "run":
+                runs[run_id] = {"action": record["action"], "meta": record.get("meta", {}),
+                                "time": record.get("time", 0), "chunks": [], "ready": False,
+                                "done": set(), "complete": False}
+                continue
+            run = runs.get(run_id)
+            if run is None:
+                continue
+            if kind == "planned":
+                run["chunks"].append(record)
+            elif kind == "ready":
+                run["ready"] = True
+            elif kind == "done":
+                run["done"].add(record["chunk"])
+            elif kind == "complete":
+                run["complete"] = True
+        return runs
+
+    def open_run(self, action, payload):
+        """
+        Продолжает незавершённый запуск действия с теми же входными данными
+        или начинает новый (его план записывает вызывающий через JournalRun.plan).
+        Незавершённые запуски действия с другими входными данными
+        или старше max_age секунд отбрасываются.
+        :return: JournalRun или None, если журнал действия занят другим процессом
+                 (тогда действие выполняется без журнала).
+        """
+        self.release()
+        self.path = self.action_path(action)
+        if not self._lock():
+            logging.warning(f"Журнал исправлений {self.path} занят другим процессом, "
+                            f"'{action}' выполняется без журнала")
+            return None
+        run_id = fingerprint(action, payload)
+        runs = self._load()
+        run = runs.get(run_id)
+        resumable = run is not None and run["ready"] and not run["complete"] and run["action"] == action
+        if resumable and self.max_age and run["time"] < time.time() - self.max_age:
+            logging.info(f"Журнал исправлений: прерванный запуск '{action}' старше {self.max_age} с отброшен, "
+                         f"план строится заново")
+        elif resumable:
+            logging.info(
+                f"Журнал исправлений: продолжение '{action}' — выполнено пакетов "
+                f"{len(run['done'] & {chunk['chunk'] for chunk in run['chunks']})} из {len(run['chunks'])}"
+            )
+            return JournalRun(self, run_id, action, run["meta"], run["chunks"], run["done"], resumed=True)
+        elif any(other["action"] == action and not other["complete"] for other in runs.values()):
+            logging.info(f"Журнал исправлений: входные данные '{action}' изменились, прерванный запуск отброшен")
+        self.compact(drop_action=action)
+        return JournalRun(self, run_id, action)
+
+    def append(self, record):
+        if self.file is None:
+            # Недописанная при сбое строка не должна склеиться с новой записью
+            torn = False
+            try:
+                with open(self.path, "rb") as f:
+                    if f.seek(0, os.SEEK_END):
+                        f.seek(-1, os.SEEK_END)
+                        torn = f.read(1) != b"\n"
+            except FileNotFoundError:
+                pass
+            self.file = open(self.path, "a")
+            if torn:
+                self.file.write("\n")
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def sync(self):
+        """
+        Сбрасывает записи на диск: отметка выполнения переживает сбой процесса.
+        """
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def compact(self, drop_action=None):
+        """
+        Оставляет в журнале только незавершённые запуски с записанным планом
+        (кроме запусков действия drop_action). Пустой журнал удаляется.
+        """
+        self.close()
+        runs = self._load()
+        keep = {run_id: run for run_id, run in runs.items()
+                if run["ready"] and not run["complete"] and run["action"] != drop_action}
+        if len(keep) == len(runs):
+            return
+        if not keep:
+            os.remove(self.path)
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                for run_id, run in keep.items():
+                    f.write(json.dumps({"type": "run", "run": run_id, "action": run["action"],
+                                        "meta": run["meta"], "time": run["time"]}, ensure_ascii=False) + "\n")
+                    for chunk in run["chunks"]:
+                        f.write(json.dumps(dict(chunk, type="planned", run=run_id), ensure_ascii=False) + "\n")
+                    f.write(json.dumps({"type": "ready", "run": run_id}) + "\n")
+                    for chunk in run["chunks"]:
+                        if chunk["chunk"] in run["done"]:
+                            f.write(json.dumps({"type": "done", "run": run_id, "chunk": chunk["chunk"]}) + "\n")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Ошибка при сжатии журнала исправлений {self.path}: {e}")
+            raise
+
+
+def open_journal(path=REMEDIATION_JOURNAL, max_age=REMEDIATION_JOURNAL_MAX_AGE):
+    """
+    Журнал по настройке REMEDIATION_JOURNAL или None, если он отключён.
+    """
+    return RemediationJournal(path, max_age) if path else None
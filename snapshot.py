@@ -0,0 +1,137 @@
+import gzip
+import json
+import logging
+import os
+
+# Настройки формата необязательны: офлайн-сравнение работает и без config.py
+try:
+    import config
+except ImportError:
+    config = None
+
+# Формат снимков vcenter_vms.json/zabbix_hosts.json: "json" (массив с отступами)
+# или "ndjson" (одна запись на строку, пишется и читается потоково)
+SNAPSHOT_FORMAT = getattr(config, "SNAPSHOT_FORMAT", "json")
+# Сжимать снимки gzip на лету (к имени файла добавляется .gz)
+SNAPSHOT_COMPRESS = getattr(config, "SNAPSHOT_COMPRESS", False)
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def find_snapshot(filename):
+    """
+    Возвращает путь к существующему снимку: сам filename или его сжатый вариант filename.gz.
+    """
+    if os.path.exists(filename):
+        return filename
+    if os.path.exists(filename + ".gz"):
+        return filename + ".gz"
+    return filename
+
+
+def _open_for_read(path):
+    with open(path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_snapshot(filename):
+    """
+    Генератор записей снимка. Сжатие gzip и формат (JSON-массив или NDJSON)
+    определяются автоматически по содержимому файла. NDJSON читается
+    построчно, без загрузки всего файла в память.
+    """
+    path = find_snapshot(filename)
+    with _open_for_read(path) as f:
+        first = ""
+        while True:
+            char = f.read(1)
+            if not char or not char.isspace():
+                first = char
+                break
+
+        if first == "[":
+            # Обычный JSON-массив читается целиком
+            yield from json.loads(first + f.read())
+            return
+
+        line = first + f.readline()
+        while line:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+            line = f.readline()
+
+
+def load_snapshot(filename):
+    """
+    Загружает снимок целиком в список.
+    """
+    return list(iter_snapshot(filename))
+
+
+class SnapshotWriter:
+    """
+    Потоковая запись снимка. Записи можно добавлять по мере получения;
+    файл пишется во временный и переименовывается только при успешном
+    закрытии, поэтому при ошибке старый снимок остаётся нетронутым.
+    В формате "json" записи накапливаются и сохраняются одним массивом
+    с отступами (как раньше), в формате "ndjson" — сразу по одной на строку.
+    """
+
+    def __init__(self, filename, fmt=None, compress=None):
+        self.fmt = fmt or SNAPSHOT_FORMAT
+        self.compress = SNAPSHOT_COMPRESS if compress is None else compress
+        self.filename = filename
+        self.path = filename + ".gz" if self.compress else filename
+        self.tmp_path = self.path + ".tmp"
+        self.count = 0
+        self._records = []
+        self._file = None
+
+    def __enter__(self):
+        if self.compress:
+            self._file = gzip.open(self.tmp_path, "wt", encoding="utf-8")
+        else:
+            self._file = open(self.tmp_path, "w", encoding="utf-8")
+        return self
+
+    def write(self, record):
+        if self.fmt == "ndjson":
+            self._file.write(json.dumps(record, ensure_ascii=False))
+            self._file.write("\n")
+        else:
+            self._records.append(record)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self.fmt != "ndjson":
+                json.dump(self._records, self._file, indent=4, ensure_ascii=False)
+        finally:
+            self._file.close()
+
+        if exc_type is not None:
+            os.remove(self.tmp_path)
+            return False
+
+        os.replace(self.tmp_path, self.path)
+        # Удаляем вариант снимка с другим сжатием, чтобы читатель не взял устаревший
+        stale = self.filename if self.compress else self.filename + ".gz"
+        if os.path.exists(stale):
+            os.remove(stale)
+        return False
+
+
+def save_snapshot(records, filename, fmt=None, compress=None):
+    """
+    Сохраняет записи в снимок в заданном (или настроенном) формате.
+    Возвращает путь к записанному файлу.
+    """
+    with SnapshotWriter(filename, fmt, compress) as writer:
+        for record in records:
+            writer.write(record)
+    logging.info(f"Данные успешно сохранены в файл: {writer.path} ({writer.count} записей)")
+    return writer.path
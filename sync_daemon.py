@@ -0,0 +1,145 @@
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+from datetime import datetime, timezone
+
+import config
+import metrics
+import profiling
+from log_setup import LOG_DIR, setup_logging
+from pipeline import DEFAULT_STAGES, PIPELINE_LOCK_FILE, STAGES, PipelineContext, acquire_lock, run_pipeline
+
+# Интервал между циклами и случайный разброс (секунды)
+DAEMON_INTERVAL = getattr(config, "DAEMON_INTERVAL", 300)
+DAEMON_JITTER = getattr(config, "DAEMON_JITTER", 30)
+# Максимальная пауза при повторяющихся ошибках (экспоненциальная задержка)
+DAEMON_MAX_BACKOFF = getattr(config, "DAEMON_MAX_BACKOFF", 3600)
+# Этапы цикла (по умолчанию все)
+DAEMON_STAGES = getattr(config, "DAEMON_STAGES", DEFAULT_STAGES)
+# Файл сводок по циклам: одна JSON-строка на цикл
+DAEMON_SUMMARY_FILE = getattr(config, "DAEMON_SUMMARY_FILE", os.path.join(LOG_DIR, "zabbix_scripts_sync_summary.jsonl"))
+
+
+def next_delay(failures, interval=DAEMON_INTERVAL, jitter=DAEMON_JITTER, max_backoff=DAEMON_MAX_BACKOFF):
+    """
+    Пауза до следующего цикла: интервал со случайным разбросом,
+    при ошибках подряд — экспоненциально растущая, но не больше max_backoff.
+    """
+    if failures:
+        delay = min(max_backoff, interval * (2 ** failures))
+    else:
+        delay = interval
+    return max(1.0, delay + random.uniform(-jitter, jitter))
+
+
+def cycle_summary(ctx, durations, ok, api_calls):
+    """
+    Компактная сводка цикла: длительности этапов, размеры инвентаря,
+    найденные расхождения, результаты исправления и число вызовов API.
+    """
+    data = ctx.data
+    summary = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "ok": ok,
+        "seconds": round(sum(durations.values()), 3),
+        "stages": {stage: round(seconds, 3) for stage, seconds in durations.items()},
+        "api_calls": api_calls
+    }
+    for key in ("vcenter_vms", "zabbix_hosts", "missing_hosts", "mismatched_hosts"):
+        if key in data:
+            summary[key] = len(data[key])
+    if data.get("vcenter_failed"):
+        summary["vcenter_failed"] = data["vcenter_failed"]
+    if "status_report" in data:
+        outcomes = list(data["status_report"]["results"].values())
+        summary["status"] = {outcome: outcomes.count(outcome) for outcome in set(outcomes)}
+    if "group_report" in data:
+        report = data["group_report"]
+        summary["groups"] = {key: len(report[key]) for key in ("added", "removed", "not_found", "failed")}
+    if "create_report" in data:
+        report = data["create_report"]
+        summary["create"] = {key: len(report[key]) for key in ("created", "skipped", "failed")}
+    return summary
+
+
+def write_summary(summary, filename=DAEMON_SUMMARY_FILE):
+    try:
+        with open(filename, "a") as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logging.error(f"Ошибка при записи сводки в файл {filename}: {e}")
+
+
+def run_daemon(stages=DAEMON_STAGES, interval=DAEMON_INTERVAL, once=False):
+    """
+    Постоянно работающий режим: подключения к VCenter и Zabbix открываются
+    один раз и переиспользуются, цикл выгрузка → сравнение → исправление
+    выполняется с заданным интервалом. Циклы не пересекаются: они идут
+    последовательно в одном потоке, а файловая блокировка не даёт запустить
+    параллельно второй экземпляр или конвейер из cron.
+    """
+    lock = acquire_lock(PIPELINE_LOCK_FILE)
+    if lock is None:
+        logging.error(f"Синхронизация уже выполняется (блокировка {PIPELINE_LOCK_FILE}).")
+        return False
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logging.info(f"Получен сигнал {signum}, демон завершается после текущего цикла.")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    ctx = PipelineContext()
+    failures = 0
+    logging.info(f"Демон синхронизации запущен: интервал {interval} с, этапы: {', '.join(stages)}")
+
+    while not stop.is_set():
+        # Данные прошлого цикла не переиспользуются, сохраняются только подключения
+        ctx.data.clear()
+        calls_before = ctx.api_calls()
+
+        with profiling.session("daemon"):
+            durations, ok = run_pipeline(stages, ctx=ctx)
+
+        summary = cycle_summary(ctx, durations, ok, ctx.api_calls() - calls_before)
+        write_summary(summary)
+        metrics.flush("daemon", ok)
+
+        if once:
+            break
+
+        failures = 0 if ok else failures + 1
+        delay = next_delay(failures, interval)
+        if failures:
+            logging.warning(f"Цикл завершился с ошибкой ({failures} подряд), следующий через {delay:.0f} с")
+        stop.wait(delay)
+
+    lock.close()
+    return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Демон синхронизации VCenter и Zabbix.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=DAEMON_STAGES,
+                        help="Этапы цикла (по умолчанию DAEMON_STAGES).")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL,
+                        help="Интервал между циклами, секунды.")
+    parser.add_argument("--once", action="store_true", help="Выполнить один цикл и выйти.")
+    parser.add_argument("--profile", metavar="DIR", default=profiling.PROFILE_DIR,
+                        help="Профилировать каждый цикл, результаты — в каталог DIR.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    setup_logging("sync_daemon")
+    args = parse_args()
+    profiling.enable(args.profile)
+    sys.exit(0 if run_daemon(args.stages, args.interval, args.once) else 1)
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+
+from pyVmomi import vim, vmodl
+
+import metrics
+from export_vcenter import (
+    VCENTERS, VM_PROPERTIES, build_vm_filter_spec, connect_to_vcenter,
+    nic_ips, resume_vcenter_session, vm_record
+)
+
+
+def load_delta_state(filename):
+    """
+    Загружает состояние инкрементального экспорта.
+    Если файла нет или он повреждён, возвращает None (будет полная выгрузка).
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"Не удалось прочитать состояние {filename}: {e}. Выполняется полная выгрузка.")
+        return None
+
+
+def save_delta_state(state, filename):
+    """
+    Сохраняет состояние инкрементального экспорта.
+    Файл содержит cookie сессии VCenter, поэтому доступен только владельцу.
+    """
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f, ensure_ascii=False)
+    logging.info(f"Состояние инкрементального экспорта сохранено: {filename}")
+
+
+def _prop_value(name, value):
+    if value is None:
+        return None
+    # Адаптеры гостевой ОС сохраняются в снимке списком их IP
+    if name == "guest.net":
+        return nic_ips(value)
+    return str(value)
+
+
+def apply_update_set(update_set, vms):
+    """
+    Применяет UpdateSet из WaitForUpdatesEx к снимку vms (moId → свойства VM).
+    Возвращает количество созданных, изменённых и удалённых VM.
+    """
+    counts = {"enter": 0, "modify": 0, "leave": 0}
+    for filter_update in update_set.filterSet or []:
+        for obj_update in filter_update.objectSet or []:
+            moid = obj_update.obj._moId
+            kind = str(obj_update.kind)
+            counts[kind] = counts.get(kind, 0) + 1
+
+            if kind == "leave":
+                vms.pop(moid, None)
+                continue
+
+            props = vms.setdefault(moid, {}) if kind == "modify" else {}
+            for change in obj_update.changeSet or []:
+                if str(change.op) in ("remove", "indirectRemove"):
+                    props[change.name] = None
+                else:
+                    props[change.name] = _prop_value(change.name, change.val)
+            vms[moid] = props
+    return counts
+
+
+def _create_collector(si):
+    """
+    Создаёт отдельный PropertyCollector с фильтром по всем VM.
+    ContainerView не уничтожается: фильтр ссылается на него, пока жива сессия.
+    """
+    content = si.RetrieveContent()
+    view = content.viewManager.CreateContainerView(
+        content.rootFolder, [vim.VirtualMachine], True
+    )
+    collector = content.propertyCollector.CreatePropertyCollector()
+    collector.CreateFilter(build_vm_filter_spec(view, VM_PROPERTIES), partialUpdates=False)
+    return collector
+
+
+def _collect_updates(collector, version, vms):
+    """
+    Забирает все накопленные обновления без ожидания (maxWaitSeconds=0).
+    Усечённые ответы дочитываются по новой версии. Возвращает последнюю версию.
+    """
+    options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0)
+    totals = {"enter": 0, "modify": 0, "leave": 0}
+    while True:
+        update_set = collector.WaitForUpdatesEx(version, options)
+        if update_set is None:
+            break
+        for kind, count in apply_update_set(update_set, vms).items():
+            totals[kind] = totals.get(kind, 0) + count
+        version = update_set.version
+        if not update_set.truncated:
+            break
+    logging.info(
+        f"Изменения VCenter: новых {totals['enter']}, изменённых {totals['modify']}, "
+        f"удалённых {totals['leave']}"
+    )
+    return version
+
+
+def get_vms_from_vcenter_delta(state_file, vcenter=None):
+    """
+    Инкрементальный экспорт VM из VCenter.
+    Использует постоянный фильтр PropertyCollector и версию WaitForUpdatesEx:
+    если сохранённая сессия ещё жива, запрашиваются только изменения с прошлого
+    запуска, и они накладываются на сохранённый снимок. Иначе выполняется
+    полная выгрузка с созданием нового фильтра.
+    Формат результата совпадает с get_vms_from_vcenter, но ошибки полной
+    выгрузки не подавляются: недоступный VCenter не должен выглядеть как
+    VCenter без VM.
+    :param vcenter: Параметры VCenter из VCENTERS (по умолчанию первый).
+    """
+    state = load_delta_state(state_file)
+    si = collector = None
+    vms = {}
+    version = ""
+
+    if state:
+        try:
+            si = resume_vcenter_session(state["session_cookie"], vcenter=vcenter)
+            if si is not None:
+                collector = vmodl.query.PropertyCollector(state["collector"], si._stub)
+                vms = state.get("vms", {})
+                version = state.get("version", "")
+        except Exception as e:
+            logging.warning(f"Не удалось восстановить сессию VCenter: {e}")
+            si = collector = None
+
+    if collector is not None:
+        try:
+            version = _collect_updates(collector, version, vms)
+        except (vmodl.fault.ManagedObjectNotFound, vmodl.query.InvalidCollectorVersion) as e:
+            logging.warning(f"Фильтр PropertyCollector недействителен ({e}). Выполняется полная выгрузка.")
+            collector = None
+    else:
+        logging.info("Сохранённая сессия недоступна. Выполняется полная выгрузка.")
+
+    if collector is None:
+        try:
+            if si is None:
+                si = connect_to_vcenter(disconnect_on_exit=False, vcenter=vcenter)
+            collector = _create_collector(si)
+            vms = {}
+            version = _collect_updates(collector, "", vms)
+        except Exception as e:
+            logging.error(f"Ошибка при извлечении данных о VM: {e}")
+            raise
+
+    save_delta_state({
+        "session_cookie": si._stub.cookie,
+        "collector": collector._moId,
+        "version": version,
+        "vms": vms
+    }, state_file)
+
+    result = [vm_record(props) for props in vms.values()]
+    metrics.gauge("inventory_size", len(result), source="vcenter", server=(vcenter or VCENTERS[0])["host"])
+    logging.info(f"Успешно получено {len(result)} виртуальных машин.")
+    return result
@@ -0,0 +1,330 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import profiling
+
+# Настройки необязательны: без config.py действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
+
+# Не более ZABBIX_WRITE_RATE изменяющих вызовов API в секунду (token bucket),
+# кратковременно — до ZABBIX_WRITE_BURST подряд
+ZABBIX_WRITE_RATE = getattr(config, "ZABBIX_WRITE_RATE", 10.0)
+ZABBIX_WRITE_BURST = getattr(config, "ZABBIX_WRITE_BURST", 5)
+# Пределы числа одновременных изменяющих вызовов; текущее значение подбирается
+# по задержке и ошибкам (AIMD): +1 за успешное «окно», вдвое меньше при перегрузке
+ZABBIX_WRITE_MIN_CONCURRENCY = getattr(config, "ZABBIX_WRITE_MIN_CONCURRENCY", 1)
+ZABBIX_WRITE_MAX_CONCURRENCY = getattr(config, "ZABBIX_WRITE_MAX_CONCURRENCY", 8)
+# Задержка вызова (секунды), выше которой сервер считается перегруженным
+ZABBIX_WRITE_TARGET_LATENCY = getattr(config, "ZABBIX_WRITE_TARGET_LATENCY", 2.0)
+# Повторы временных ошибок с экспоненциальной задержкой и случайным разбросом
+ZABBIX_WRITE_RETRIES = getattr(config, "ZABBIX_WRITE_RETRIES", 3)
+ZABBIX_WRITE_BACKOFF = getattr(config, "ZABBIX_WRITE_BACKOFF", 0.5)
+ZABBIX_WRITE_BACKOFF_MAX = getattr(config, "ZABBIX_WRITE_BACKOFF_MAX", 30.0)
+
+# Окно (секунды), по которому считается пропускная способность
+THROUGHPUT_WINDOW = 60.0
+
+# Признаки временной ошибки в ответе Zabbix API (перегрузка фронтенда или БД)
+TRANSIENT_ERRORS = (
+    "deadlock", "Deadlock", "Lock wait timeout", "Database error", "DBEXECUTE_ERROR",
+    "Too many connections", "timed out", "temporarily unavailable", "Service Unavailable"
+)
+
+# Неидемпотентные методы: повтор после таймаута или обрыва соединения мог бы
+# выполнить вызов дважды (повторный host.create падает с "already exists",
+# а hostid созданных первым вызовом хостов теряются)
+NON_IDEMPOTENT_METHODS = ("host.create",)
+
+
+def is_transient(error):
+    """
+    Можно ли повторить вызов после ошибки: сетевые ошибки и таймауты
+    (исключения requests — подклассы OSError), ответы HTTP 5xx/429
+    и ошибки API о блокировках и перегрузке БД.
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 429
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    return any(marker in str(error) for marker in TRANSIENT_ERRORS)
+
+
+def chunked(items, size):
+    """
+    Разбивает список на части не длиннее size (пакеты массовых вызовов API).
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def is_retryable(method, error):
+    """
+    Повторять ли вызов method после ошибки. Неидемпотентные методы
+    повторяются, только если сервер заведомо отклонил вызов целиком
+    (HTTP 429 или ошибка API о блокировке/перегрузке БД), но не после
+    таймаута, сетевой ошибки или HTTP 5xx, когда вызов мог выполниться.
+    """
+    if not is_transient(error):
+        return False
+    if method not in NON_IDEMPOTENT_METHODS:
+        return True
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code == 429
+    return not isinstance(error, (OSError, TimeoutError)) and "timed out" not in str(error)
+
+
+def backoff_delay(attempt, base=ZABBIX_WRITE_BACKOFF, limit=ZABBIX_WRITE_BACKOFF_MAX):
+    """
+    Задержка перед повтором attempt (с 1): случайная в [0, base * 2^(attempt-1)],
+    не больше limit («full jitter» — повторы разных потоков не совпадают по времени).
+    """
+    return random.uniform(0, min(limit, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """
+    Ограничение частоты: rate токенов в секунду, не более burst в запасе.
+    acquire() ждёт, пока не появится токен.
+    """
+
+    def __init__(self, rate=ZABBIX_WRITE_RATE, burst=ZABBIX_WRITE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        :return: Время ожидания токена (секунды).
+        """
+        if not self.rate:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AimdLimiter:
+    """
+    Ограничение числа одновременных вызовов с подстройкой (AIMD):
+    каждый успешный вызов быстрее target_latency увеличивает предел на 1/предел
+    (т.е. на 1 за «окно» из предела вызовов), медленный вызов или временная
+    ошибка уменьшают его вдвое, но не чаще одного раза за окно.
+    """
+
+    def __init__(self, minimum=ZABBIX_WRITE_MIN_CONCURRENCY, maximum=ZABBIX_WRITE_MAX_CONCURRENCY,
+                 target_latency=ZABBIX_WRITE_TARGET_LATENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_latency = target_latency
+        self.limit = float(self.minimum)
+        self.in_flight = 0
+        self.calls_since_decrease = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, overloaded=False):
+        """
+        :param latency: Задержка завершившегося вызова (None — не учитывать).
+        :param overloaded: Вызов завершился временной ошибкой.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.calls_since_decrease += 1
+            if overloaded or (latency is not None and latency > self.target_latency):
+                if self.calls_since_decrease >= int(self.limit):
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.calls_since_decrease = 0
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class WriteScheduler:
+    """
+    Общий планировщик изменяющих вызовов Zabbix API (host.massupdate,
+    hostgroup.massadd/massremove, host.create): ограничение частоты,
+    адаптивное число одновременных вызовов и повторы временных ошибок.
+    Вызовы передаются в submit() и выполняются в пуле потоков
+    (не больше max_concurrency), результат — concurrent.futures.Future.
+    Глубина очереди, число выполняемых вызовов, текущий предел и
+    пропускная способность выводятся в метрики zabbix_write_*.
+    """
+
+    def __init__(self, rate=ZABBIX_WRITE_RATE, burst=ZABBIX_WRITE_BURST,
+                 min_concurrency=ZABBIX_WRITE_MIN_CONCURRENCY, max_concurrency=ZABBIX_WRITE_MAX_CONCURRENCY,
+                 target_latency=ZABBIX_WRITE_TARGET_LATENCY, retries=ZABBIX_WRITE_RETRIES):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AimdLimiter(min_concurrency, max_concurrency, target_latency)
+        self.retries = retries
+        self.executor = None
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.stats = {"completed": 0, "failed": 0, "retries": 0, "seconds": 0.0}
+        self.finished = deque()
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.limiter.maximum,
+                                                   thread_name_prefix="zabbix-write")
+            return self.executor
+
+    def _update_gauges(self):
+        metrics.gauge("zabbix_write_queue_depth", self.queued)
+        metrics.gauge("zabbix_write_in_flight", self.limiter.in_flight)
+        metrics.gauge("zabbix_write_concurrency", round(self.limiter.limit, 2))
+
+    def submit(self, method, func, *args, **kwargs):
+        """
+        Ставит изменяющий вызов в очередь.
+        :param method: Метод API для метрик и лога (например, "host.massupdate").
+        :return: Future с результатом func(*args, **kwargs).
+        """
+        with self.lock:
+            self.queued += 1
+        self._update_gauges()
+        return self._executor().submit(profiling.profiled(self._run), method, func, args, kwargs, True)
+
+    def call(self, method, func, *args, **kwargs):
+        """
+        Выполняет изменяющий вызов в текущем потоке с соблюдением ограничений
+        и повторами временных ошибок. Постоянные ошибки и ошибка после
+        последнего повтора пробрасываются вызывающему.
+        """
+        return self._run(method, func, args, kwargs, False)
+
+    def _run(self, method, func, args, kwargs, queued):
+        attempt = 0
+        enqueued = time.monotonic()
+        while True:
+            self.limiter.acquire()
+            if queued:
+                with self.lock:
+                    self.queued -= 1
+                queued = False
+            self.bucket.acquire()
+            if attempt == 0:
+                metrics.observe("zabbix_write_wait_seconds", time.monotonic() - enqueued, method=method)
+            self._update_gauges()
+
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                latency = time.monotonic() - started
+                transient = is_transient(e)
+                # Ошибочный вызов не считается успешным: предел растёт только от успехов
+                self.limiter.release(latency if transient else None, overloaded=transient)
+                if not is_retryable(method, e) or attempt >= self.retries:
+                    self._finish(method, latency, ok=False)
+                    raise
+                attempt += 1
+                delay = backoff_delay(attempt)
+                with self.lock:
+                    self.stats["retries"] += 1
+                metrics.inc("zabbix_write_retries_total", method=method)
+                logging.warning(f"Временная ошибка {method} (попытка {attempt} из {self.retries}), "
+                                f"повтор через {delay:.1f} с: {e}")
+                time.sleep(delay)
+                continue
+
+            latency = time.monotonic() - started
+            self.limiter.release(latency)
+            self._finish(method, latency, ok=True)
+            return result
+
+    def _throughput(self, now):
+        """
+        Вызовов в секунду за последние THROUGHPUT_WINDOW секунд (под self.lock).
+        """
+        while self.finished and self.finished[0] < now - THROUGHPUT_WINDOW:
+            self.finished.popleft()
+        if not self.finished:
+            return 0.0
+        return round(len(self.finished) / max(1.0, min(THROUGHPUT_WINDOW, now - self.finished[0])), 2)
+
+    def _finish(self, method, latency, ok):
+        now = time.monotonic()
+        with self.lock:
+            self.stats["completed" if ok else "failed"] += 1
+            self.stats["seconds"] += latency
+            self.finished.append(now)
+            throughput = self._throughput(now)
+        metrics.inc("zabbix_write_total", method=method, outcome="ok" if ok else "failed")
+        metrics.gauge("zabbix_write_throughput", throughput)
+        self._update_gauges()
+
+    def snapshot(self):
+        """
+        :return: Словарь со счётчиками, текущей очередью, пределом и пропускной способностью.
+        """
+        with self.lock:
+            stats = dict(self.stats, queued=self.queued, throughput=self._throughput(time.monotonic()))
+        stats.update(in_flight=self.limiter.in_flight, concurrency=round(self.limiter.limit, 2))
+        return stats
+
+    def log_summary(self):
+        stats = self.snapshot()
+        if not stats["completed"] and not stats["failed"]:
+            return
+        logging.info(
+            f"Изменения Zabbix: выполнено {stats['completed']}, ошибок {stats['failed']}, "
+            f"повторов {stats['retries']}, предел параллельности {stats['concurrency']}, "
+            f"{stats['throughput']} вызовов/с"
+        )
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Общий для процесса планировщик изменений (создаётся при первом вызове),
+    чтобы этапы конвейера и демон вместе не превышали ограничения.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = WriteScheduler()
+            atexit.register(_scheduler.log_summary)
+        return _scheduler
+
+
+def configure(**settings):
+    """
+    Заменяет общий планировщик новым с указанными параметрами WriteScheduler
+    (например, для нагрузочного теста).
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = WriteScheduler(**settings)
+        return _scheduler
@@ -1,53 +1,40 @@
 import logging
-import json
-import re
-from pyzabbix import ZabbixAPI
 
-# Импортируем настройки из файла config.py
-from config import ZABBIX_URL, ZABBIX_USER, ZABBIX_PASSWORD
+import metrics
+import profiling
+from host_rules import normalize_hostname
+from log_setup import EventSummary, sample, setup_logging
+from remediation_journal import open_journal
+from snapshot import load_snapshot
+from write_scheduler import chunked, get_scheduler
 
-# Настройка логирования
-log_file = "/var/log/zabbix/zabbix_scripts_add_hosts_to_group.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
-
-def load_hosts_from_file(filename):
-    """
-    Загружает список хостов из JSON-файла.
-    """
-    try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filename}: {e}")
-        raise
+# Настройки необязательны: план исправлений (planner.py --dry-run)
+# строится и без config.py, действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
 
+# Группа, в которую добавляются хосты из VCenter
+GROUP_NAME = "vcenter_hosts"
 
-def normalize_hostname(vcenter_name):
-    """
-    Нормализует имя хоста из VCenter для сравнения с именами в Zabbix.
-    Например, преобразует 'VW-SWX002-a.miller' в 'SWX002'.
-    """
-    match = re.search(r"VW-(\w+)-", vcenter_name)
-    if match:
-        return match.group(1)  # Возвращаем часть, соответствующую шаблону
-    return vcenter_name  # Если шаблон не найден, возвращаем исходное имя
+# Размер пакета для hostgroup.massadd/massremove
+ZABBIX_BATCH_SIZE = getattr(config, "ZABBIX_BATCH_SIZE", 500)
+# Удалять из группы хосты, VM которых больше нет в VCenter
+ZABBIX_GROUP_REMOVE_STALE = getattr(config, "ZABBIX_GROUP_REMOVE_STALE", False)
+# Не удалять ничего, если удалить пришлось бы больше этой доли хостов группы:
+# вероятно, снимок VCenter пуст или неполон (None — без ограничения)
+ZABBIX_GROUP_REMOVE_MAX_RATIO = getattr(config, "ZABBIX_GROUP_REMOVE_MAX_RATIO", 0.5)
 
 
-def connect_to_zabbix():
+def load_hosts_from_file(filename):
     """
-    Подключается к Zabbix API и возвращает объект API.
+    Загружает список хостов из файла JSON или NDJSON (в т.ч. сжатого gzip).
     """
     try:
-        zapi = ZabbixAPI(ZABBIX_URL)
-        zapi.login(ZABBIX_USER, ZABBIX_PASSWORD)
-        logging.info("Успешно подключено к Zabbix API")
-        return zapi
+        return load_snapshot(filename)
     except Exception as e:
-        logging.error(f"Ошибка при подключении к Zabbix API: {e}")
+        logging.error(f"Ошибка при чтении файла {filename}: {e}")
         raise
 
 
@@ -70,13 +57,14 @@ def add_hosts_to_group(zapi, hosts, group_id):
     :param hosts: Список хостов (имена и статусы).
     :param group_id: ID группы хостов.
     """
+    summary = EventSummary("Добавление в группу 'vcenter_hosts'")
     for host in hosts:
         host_name = host["host"]
         vm_status = host["status"]
 
         # Пропускаем хосты со статусом poweredOff
         if vm_status == "poweredOff":
-            logging.info(f"Хост '{host_name}' выключен в VCenter. Пропускаем.")
+            summary.add("пропущены выключенные в VCenter", host_name)
             continue
 
         # Нормализуем имя хоста
@@ -85,7 +73,7 @@ def add_hosts_to_group(zapi, hosts, group_id):
         # Проверяем, существует ли хост в Zabbix
         zabbix_hosts = zapi.host.get(filter={"host": normalized_name}, selectGroups=["groupid"], output=["hostid"])
         if not zabbix_hosts:
-            logging.warning(f"Хост '{normalized_name}' не найден в Zabbix. Пропускаем.")
+            summary.add("не найдены в Zabbix", normalized_name, logging.WARNING)
             continue
 
         host_id = zabbix_hosts[0]["hostid"]
@@ -93,34 +81,205 @@ def add_hosts_to_group(zapi, hosts, group_id):
 
         # Проверяем, состоит ли хост уже в группе 'vcenter_hosts'
         if group_id in current_groups:
-            logging.info(f"Хост '{normalized_name}' уже состоит в группе 'vcenter_hosts'. Пропускаем.")
+            summary.add("уже состоят в группе", normalized_name)
             continue
 
         # Добавляем группу 'vcenter_hosts' к текущим группам
         updated_groups = list(set(current_groups + [group_id]))
 
         # Обновляем группы хоста
-        zapi.host.update(hostid=host_id, groups=[{"groupid": gid} for gid in updated_groups])
-        logging.info(f"Группа 'vcenter_hosts' добавлена к хосту '{normalized_name}'")
+        get_scheduler().call("host.update", zapi.host.update, hostid=host_id,
+                             groups=[{"groupid": gid} for gid in updated_groups])
+        summary.add("добавлены в группу", normalized_name)
+    summary.log()
 
 
-if __name__ == "__main__":
+def plan_group_chunks(zapi, wanted, known_vms, group_id, remove_stale=ZABBIX_GROUP_REMOVE_STALE,
+                      batch_size=ZABBIX_BATCH_SIZE):
+    """
+    Все хосты-кандидаты вместе с их группами запрашиваются одним host.get,
+    недостающие в группе хосты делятся на пакеты hostgroup.massadd.
+    При remove_stale=True хосты группы, VM которых нет в VCenter,
+    делятся на пакеты hostgroup.massremove.
+    :return: Кортеж (пакеты [{"op", "hosts": {имя: hostid}}], не найденные имена, число вызовов API).
+    """
+    # Кандидаты вместе с их группами — одним запросом
+    api_calls = 0
+    zabbix_hosts = []
+    if wanted:
+        zabbix_hosts = zapi.host.get(filter={"host": sorted(wanted)}, selectGroups=["groupid"], output=["hostid", "host"])
+        api_calls += 1
+
+    found = {host["host"]: host["hostid"] for host in zabbix_hosts}
+    not_found = sorted(wanted - set(found))
+    if not_found:
+        logging.warning(f"Не найдено в Zabbix хостов: {len(not_found)} ({sample(not_found)}). Пропускаем.")
+        logging.debug(f"Не найдены в Zabbix: {', '.join(not_found)}")
+
+    to_add = sorted(
+        host["host"] for host in zabbix_hosts
+        if group_id not in {group["groupid"] for group in host.get("groups", [])}
+    )
+    chunks = [
+        {"op": "hostgroup.massadd", "hosts": {name: found[name] for name in batch}}
+        for batch in chunked(to_add, batch_size)
+    ]
+
+    if remove_stale and not known_vms:
+        # Пустой снимок VCenter — почти всегда сбой экспорта, а не пустой парк
+        logging.warning("Список VM из VCenter пуст — удаление из группы пропущено.")
+    elif remove_stale:
+        members = zapi.host.get(groupids=[group_id], output=["hostid", "host"])
+        api_calls += 1
+        member_ids = {host["host"]: host["hostid"] for host in members}
+        to_remove = sorted(set(member_ids) - known_vms)
+        if stale_removal_allowed(len(to_remove), len(member_ids)):
+            chunks.extend(
+                {"op": "hostgroup.massremove", "hosts": {name: member_ids[name] for name in batch}}
+                for batch in chunked(to_remove, batch_size)
+            )
+    return chunks, not_found, api_calls
+
+
+def stale_removal_allowed(stale_count, member_count, max_ratio=ZABBIX_GROUP_REMOVE_MAX_RATIO):
+    """
+    Защита от неполного снимка VCenter: удаление из группы разрешено,
+    только если удаляемых хостов не больше max_ratio от числа хостов группы.
+    """
+    if not max_ratio or not stale_count or stale_count <= member_count * max_ratio:
+        return True
+    logging.error(
+        f"Удаление из группы пропущено: VM нет в VCenter у {stale_count} из {member_count} хостов группы "
+        f"(больше {max_ratio:.0%}). Вероятно, снимок VCenter неполон."
+    )
+    return False
+
+
+def sync_group_membership(zapi, hosts, group_id, remove_stale=ZABBIX_GROUP_REMOVE_STALE,
+                          batch_size=ZABBIX_BATCH_SIZE, journal=None):
+    """
+    Пакетно добавляет включённые VM в группу.
+    Все хосты-кандидаты вместе с их группами запрашиваются одним host.get,
+    недостающие хосты вычисляются по множеству в памяти и добавляются
+    пакетами hostgroup.massadd (остальные группы хостов не затрагиваются).
+    При remove_stale=True хосты группы, VM которых нет в VCenter,
+    удаляются из неё через hostgroup.massremove. Пакеты выполняются
+    через общий планировщик изменений.
+    С журналом (RemediationJournal) прерванный запуск с теми же входными
+    данными продолжается с контрольной точки: без повторных host.get
+    и без уже выполненных пакетов.
+    :return: Словарь {"added", "removed", "not_found", "failed": [имена], "api_calls": N}.
+    """
+    wanted = set()
+    known_vms = set()
+    for host in hosts:
+        normalized_name = normalize_hostname(host["host"])
+        known_vms.add(normalized_name)
+        if host["status"] != "poweredOff":
+            wanted.add(normalized_name)
+
+    run = None
+    if journal is not None:
+        run = journal.open_run("group", {
+            "group_id": group_id,
+            "wanted": sorted(wanted),
+            "known": sorted(known_vms) if remove_stale else None
+        })
+    api_calls = 0
+    if run is not None and run.resumed:
+        chunks, not_found = run.chunks, run.meta.get("not_found", [])
+    else:
+        chunks, not_found, api_calls = plan_group_chunks(zapi, wanted, known_vms, group_id, remove_stale, batch_size)
+        if run is not None:
+            chunks = run.plan(chunks, meta={"not_found": not_found})
+
+    done = {"hostgroup.massadd": [], "hostgroup.massremove": []}
+    if run is not None:
+        for chunk in chunks:
+            if chunk["chunk"] in run.done:
+                done[chunk["op"]].extend(chunk["hosts"])
+
+    failed = set()
+    scheduler = get_scheduler()
+    futures = []
+    for chunk in (run.pending() if run is not None else chunks):
+        hostids = list(chunk["hosts"].values())
+        if chunk["op"] == "hostgroup.massadd":
+            future = scheduler.submit(chunk["op"], zapi.hostgroup.massadd, groups=[{"groupid": group_id}],
+                                      hosts=[{"hostid": hostid} for hostid in hostids])
+        else:
+            future = scheduler.submit(chunk["op"], zapi.hostgroup.massremove, groupids=[group_id], hostids=hostids)
+        futures.append((chunk, future))
+
+    for chunk, future in futures:
+        batch = list(chunk["hosts"])
+        adding = chunk["op"] == "hostgroup.massadd"
+        api_calls += 1
+        try:
+            future.result()
+            if adding:
+                logging.info(f"Группа 'vcenter_hosts' добавлена к {len(batch)} хостам: {sample(batch)}")
+                logging.debug(f"Добавлены в группу: {', '.join(batch)}")
+            else:
+                logging.info(f"Из группы 'vcenter_hosts' удалено {len(batch)} хостов: {sample(batch)}")
+                logging.debug(f"Удалены из группы: {', '.join(batch)}")
+            done[chunk["op"]].extend(batch)
+            if run is not None:
+                run.record(chunk, ok=True)
+        except Exception as e:
+            failed.update(batch)
+            if adding:
+                logging.error(f"Ошибка при добавлении {len(batch)} хостов ({sample(batch)}) в группу: {e}")
+            else:
+                logging.error(f"Ошибка при удалении {len(batch)} хостов ({sample(batch)}) из группы: {e}")
+            if run is not None:
+                run.record(chunk, ok=False, error=e)
+
+    if run is not None:
+        run.complete()
+    report = {
+        "added": done["hostgroup.massadd"],
+        "removed": done["hostgroup.massremove"],
+        "not_found": not_found,
+        "failed": sorted(failed),
+        "api_calls": api_calls
+    }
+    logging.info(
+        f"Синхронизация группы завершена: добавлено {len(report['added'])}, удалено {len(report['removed'])}, "
+        f"не найдено {len(not_found)}, ошибок {len(failed)}, вызовов API {api_calls}"
+    )
+    for outcome in ("added", "removed", "not_found", "failed"):
+        metrics.inc("remediation_total", len(report[outcome]), action="group", outcome=outcome)
+    return report
+
+
+def main():
+    """
+    Добавляет включённые VM из vcenter_vms.json в группу 'vcenter_hosts'.
+    """
     try:
-        # Подключаемся к Zabbix
-        zapi = connect_to_zabbix()
+        with metrics.job("sync-groups"), profiling.job("sync-groups"):
+            # Подключаемся к Zabbix
+            from zabbix_client import connect_to_zabbix
+            zapi = connect_to_zabbix()
 
-        # Получаем ID группы 'vcenter_hosts'
-        group_name = "vcenter_hosts"
-        group_id = get_hostgroup_id(zapi, group_name)
-        if not group_id:
-            logging.error(f"Группа '{group_name}' не найдена в Zabbix. Создайте её вручную.")
-            raise ValueError(f"Группа '{group_name}' не существует.")
+            # Получаем ID группы 'vcenter_hosts'
+            group_name = GROUP_NAME
+            group_id = get_hostgroup_id(zapi, group_name)
+            if not group_id:
+                logging.error(f"Группа '{group_name}' не найдена в Zabbix. Создайте её вручную.")
+                raise ValueError(f"Группа '{group_name}' не существует.")
 
-        # Загружаем список хостов из JSON-файла
-        vcenter_vms = load_hosts_from_file("vcenter_vms.json")
+            # Загружаем список хостов из JSON-файла
+            vcenter_vms = load_hosts_from_file("vcenter_vms.json")
 
-        # Добавляем хосты в группу
-        add_hosts_to_group(zapi, vcenter_vms, group_id)
+            # Добавляем хосты в группу
+            sync_group_membership(zapi, vcenter_vms, group_id, journal=open_journal())
 
     except Exception as e:
-        logging.error(f"Произошла ошибка: {e}")
\ No newline at end of file
+        logging.error(f"Произошла ошибка: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("add_hosts_to_group")
+    main()
@@ -0,0 +1,221 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from pyzabbix import ZabbixAPI, ZabbixAPIException
+
+import config
+import metrics
+import profiling
+from config import ZABBIX_URL
+
+# Необязательные настройки с значениями по умолчанию
+ZABBIX_USER = getattr(config, "ZABBIX_USER", None)
+ZABBIX_PASSWORD = getattr(config, "ZABBIX_PASSWORD", None)
+# API-токен Zabbix (>= 5.4); если задан, логин/пароль не используются
+ZABBIX_API_TOKEN = getattr(config, "ZABBIX_API_TOKEN", None)
+# Файл для кэширования сессии между запусками (None — не кэшировать)
+ZABBIX_SESSION_CACHE = getattr(config, "ZABBIX_SESSION_CACHE", "~/.zabbix_scripts_session")
+# Размер пула HTTP-соединений (не меньше числа параллельных потоков)
+ZABBIX_HTTP_POOL_SIZE = getattr(config, "ZABBIX_HTTP_POOL_SIZE", 16)
+ZABBIX_HTTP_TIMEOUT = getattr(config, "ZABBIX_HTTP_TIMEOUT", 60)
+
+# Признаки истёкшей или недействительной сессии в ответе API
+SESSION_ERRORS = ("re-login", "Session terminated", "Not authorised", "Not authorized")
+
+
+class CallStats:
+    """
+    Потокобезопасная статистика вызовов API по методам:
+    количество, суммарная и максимальная задержка, байты запросов и ответов
+    (ответ — как передан по сети, т.е. сжатый, и после распаковки).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = {}
+
+    def record(self, method, seconds, request_bytes, response_bytes, response_wire_bytes, error=False):
+        with self.lock:
+            stats = self.methods.setdefault(method, {
+                "calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                "request_bytes": 0, "response_bytes": 0, "response_wire_bytes": 0
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["request_bytes"] += request_bytes
+            stats["response_bytes"] += response_bytes
+            stats["response_wire_bytes"] += response_wire_bytes
+
+    def snapshot(self):
+        with self.lock:
+            return {method: dict(stats) for method, stats in self.methods.items()}
+
+    def total_calls(self):
+        with self.lock:
+            return sum(stats["calls"] for stats in self.methods.values())
+
+    def log_summary(self):
+        for method, stats in sorted(self.snapshot().items()):
+            average = stats["seconds"] / stats["calls"] if stats["calls"] else 0.0
+            logging.info(
+                f"Zabbix API {method}: вызовов {stats['calls']}, ошибок {stats['errors']}, "
+                f"среднее {average * 1000:.1f} мс, максимум {stats['max_seconds'] * 1000:.1f} мс, "
+                f"отправлено {stats['request_bytes']} Б, получено {stats['response_wire_bytes']} Б "
+                f"({stats['response_bytes']} Б после распаковки)"
+            )
+
+
+def build_http_session(pool_size=ZABBIX_HTTP_POOL_SIZE):
+    """
+    HTTP-сессия с пулом keep-alive соединений и сжатыми ответами.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    return session
+
+
+class ZabbixClient(ZabbixAPI):
+    """
+    ZabbixAPI с повторным входом при истечении сессии и учётом
+    задержки и объёма каждого вызова.
+    """
+
+    def __init__(self, url=ZABBIX_URL, session=None, timeout=ZABBIX_HTTP_TIMEOUT,
+                 session_cache=ZABBIX_SESSION_CACHE, **kwargs):
+        self.stats = CallStats()
+        # Файл кэша сессии, куда сохраняется сессия после повторного входа (None — не сохранять)
+        self.session_cache = session_cache
+        self._local = threading.local()
+        self._login_lock = threading.Lock()
+        self._credentials = None
+        session = session or build_http_session()
+        session.hooks["response"].append(self._measure_response)
+        super().__init__(url, session=session, timeout=timeout, **kwargs)
+
+    def _measure_response(self, response, *args, **kwargs):
+        body = response.request.body or b""
+        wire = response.headers.get("Content-Length")
+        self._local.sizes = (
+            len(body),
+            len(response.content),
+            int(wire) if wire is not None else len(response.content)
+        )
+        return response
+
+    def login(self, user="", password="", api_token=None):
+        self._credentials = (user, password, api_token)
+        return super().login(user=user, password=password, api_token=api_token)
+
+    def _relogin(self, expired_auth):
+        with self._login_lock:
+            # Другой поток мог уже войти заново
+            if self.auth != expired_auth or self._credentials is None:
+                return
+            user, password, api_token = self._credentials
+            if api_token:
+                raise ZabbixAPIException("API-токен Zabbix недействителен или истёк.")
+            logging.warning("Сессия Zabbix API истекла, выполняется повторный вход.")
+            self.auth = ""
+            super().login(user=user, password=password)
+            save_cached_session(self.auth, self.session_cache)
+
+    def do_request(self, method, params=None):
+        auth = getattr(self, "auth", "")
+        try:
+            return self._timed_request(method, params)
+        except ZabbixAPIException as e:
+            if not any(marker in str(e) for marker in SESSION_ERRORS) or self._credentials is None:
+                raise
+        self._relogin(auth)
+        return self._timed_request(method, params)
+
+    def _timed_request(self, method, params):
+        self._local.sizes = (0, 0, 0)
+        started_at = time.time()
+        started = time.monotonic()
+        error = True
+        try:
+            result = super().do_request(method, params)
+            error = False
+            return result
+        finally:
+            seconds = time.monotonic() - started
+            self.stats.record(method, seconds, *self._local.sizes, error=error)
+            metrics.observe("zabbix_api_request_seconds", seconds, method=method)
+            profiling.record_call("zabbix", method, started_at, seconds, error)
+            if error:
+                metrics.inc("zabbix_api_errors_total", method=method)
+
+
+def load_cached_session(path=ZABBIX_SESSION_CACHE):
+    if not path:
+        return None
+    path = os.path.expanduser(path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return f.read().strip() or None
+    except OSError as e:
+        logging.warning(f"Не удалось прочитать кэш сессии Zabbix {path}: {e}")
+        return None
+
+
+def save_cached_session(auth, path=ZABBIX_SESSION_CACHE):
+    """
+    Сохраняет идентификатор сессии; файл доступен только владельцу.
+    """
+    if not path or not auth:
+        return
+    try:
+        fd = os.open(os.path.expanduser(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(auth)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить кэш сессии Zabbix {path}: {e}")
+
+
+def connect_to_zabbix(url=ZABBIX_URL, user=ZABBIX_USER, password=ZABBIX_PASSWORD,
+                      api_token=ZABBIX_API_TOKEN, session_cache=ZABBIX_SESSION_CACHE):
+    """
+    Подключается к Zabbix API и возвращает ZabbixClient.
+    Использует API-токен, если он задан; иначе пытается продолжить
+    закэшированную сессию и входит по логину и паролю, только если она истекла.
+    Сводка по вызовам API выводится в лог при завершении процесса.
+    """
+    try:
+        zapi = ZabbixClient(url, session_cache=session_cache)
+        if api_token:
+            zapi.login(api_token=api_token)
+            logging.info("Успешно подключено к Zabbix API (API-токен)")
+        else:
+            cached = load_cached_session(session_cache)
+            if cached:
+                zapi.auth = cached
+                try:
+                    zapi.user.checkAuthentication(sessionid=cached)
+                    # Запоминаем учётные данные для повторного входа при истечении сессии
+                    zapi._credentials = (user, password, None)
+                    logging.info("Продолжена сохранённая сессия Zabbix API")
+                except ZabbixAPIException:
+                    cached = None
+            if not cached:
+                zapi.auth = ""
+                zapi.login(user, password)
+                save_cached_session(zapi.auth, session_cache)
+                logging.info("Успешно подключено к Zabbix API")
+        atexit.register(zapi.stats.log_summary)
+        return zapi
+    except Exception as e:
+        logging.error(f"Ошибка при подключении к Zabbix API: {e}")
+        raise
@@ -0,0 +1,248 @@
+import logging
+import re
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import metrics
+import profiling
+from host_index import HostIndex
+from host_rules import normalize_hostname
+from log_setup import EventSummary, sample, setup_logging
+from snapshot import iter_snapshot, load_snapshot
+from write_scheduler import chunked, get_scheduler
+
+# Настройки необязательны: план исправлений (planner.py --dry-run)
+# строится и без config.py, действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
+
+# Группы и шаблоны (по именам), с которыми создаются хосты
+ZABBIX_CREATE_GROUPS = getattr(config, "ZABBIX_CREATE_GROUPS", ["vcenter_hosts"])
+ZABBIX_CREATE_TEMPLATES = getattr(config, "ZABBIX_CREATE_TEMPLATES", [])
+# Статус новых хостов (0 - enabled, 1 - disabled)
+ZABBIX_CREATE_STATUS = getattr(config, "ZABBIX_CREATE_STATUS", 0)
+# Порт агентского интерфейса
+ZABBIX_CREATE_AGENT_PORT = getattr(config, "ZABBIX_CREATE_AGENT_PORT", "10050")
+# Хостов в одном вызове host.create (параллельность задаёт общий планировщик изменений)
+ZABBIX_CREATE_BATCH_SIZE = getattr(config, "ZABBIX_CREATE_BATCH_SIZE", 100)
+
+# Тип интерфейса Zabbix: агент
+INTERFACE_TYPE_AGENT = 1
+
+# Признаки ошибки host.create, относящейся к отдельным хостам пакета
+# (дубликат имени или интерфейса, некорректный параметр элемента "/N/...").
+# Остальные ошибки (нет прав, шаблона, группы, сессии) касаются всего пакета.
+HOST_ERROR_MARKERS = ("already exists", "same name")
+HOST_ERROR_PATTERN = re.compile(r'"/\d+(/|")')
+
+
+def resolve_ids(zapi, groups=None, templates=None):
+    """
+    Получает ID групп и шаблонов по именам (по одному вызову API на список).
+    :return: Кортеж (ID групп, ID шаблонов, число вызовов API).
+    :raises ValueError: Если группа или шаблон не найдены.
+    """
+    groups = ZABBIX_CREATE_GROUPS if groups is None else groups
+    templates = ZABBIX_CREATE_TEMPLATES if templates is None else templates
+    api_calls = 0
+    group_ids, template_ids = [], []
+    if groups:
+        found = zapi.hostgroup.get(filter={"name": list(groups)}, output=["groupid", "name"])
+        api_calls += 1
+        missing = set(groups) - {group["name"] for group in found}
+        if missing:
+            raise ValueError(f"Группы не найдены в Zabbix: {', '.join(sorted(missing))}")
+        group_ids = [group["groupid"] for group in found]
+    if templates:
+        found = zapi.template.get(filter={"host": list(templates)}, output=["templateid", "host"])
+        api_calls += 1
+        missing = set(templates) - {template["host"] for template in found}
+        if missing:
+            raise ValueError(f"Шаблоны не найдены в Zabbix: {', '.join(sorted(missing))}")
+        template_ids = [template["templateid"] for template in found]
+    if not group_ids:
+        raise ValueError("Для создания хостов нужна хотя бы одна группа (ZABBIX_CREATE_GROUPS).")
+    return group_ids, template_ids, api_calls
+
+
+def host_payload(name, ip, group_ids, template_ids, status=ZABBIX_CREATE_STATUS, port=ZABBIX_CREATE_AGENT_PORT):
+    """
+    Параметры host.create для одного хоста с агентским интерфейсом по IP.
+    """
+    payload = {
+        "host": name,
+        "status": status,
+        "interfaces": [{
+            "type": INTERFACE_TYPE_AGENT,
+            "main": 1,
+            "useip": 1,
+            "ip": ip,
+            "dns": "",
+            "port": str(port)
+        }],
+        "groups": [{"groupid": group_id} for group_id in group_ids]
+    }
+    if template_ids:
+        payload["templates"] = [{"templateid": template_id} for template_id in template_ids]
+    return payload
+
+
+def select_new_hosts(missing_hosts, zabbix_index=None):
+    """
+    Отбирает хосты к созданию: нормализует имена и отсеивает VM без подходящего IP,
+    хосты, имя или любой IP которых уже есть в индексе Zabbix, и повторы в самом
+    списке — по имени и по IP (создаётся первая VM, остальные пропускаются).
+    Интерфейс создаётся по первому IP VM из диапазонов HOST_IP_INCLUDE/HOST_IP_EXCLUDE.
+    :return: Кортеж ({имя: IP} к созданию, {имя: причина пропуска}).
+    """
+    zabbix_index = zabbix_index if zabbix_index is not None else HostIndex()
+    selected = {}
+    selected_ips = set()
+    skipped = {}
+    for host in missing_hosts:
+        if not host.get("host"):
+            continue
+        name = normalize_hostname(host["host"])
+        ips = zabbix_index.ip_filter.select(HostIndex.host_ips(host))
+        ip = ips[0] if ips else None
+        if name in selected:
+            # Имя уже выбрано к созданию: повтор учитывается под исходным именем VM,
+            # чтобы хост не оказался в отчёте одновременно созданным и пропущенным
+            if host["host"] != name:
+                skipped[host["host"]] = f"повтор имени {name} в списке"
+            continue
+        if not ip:
+            skipped[name] = "нет IP"
+        elif zabbix_index.has_normalized(name):
+            skipped[name] = "имя уже есть в Zabbix"
+        elif zabbix_index.has_any_ip(ips):
+            skipped[name] = "IP уже есть в Zabbix"
+        elif not selected_ips.isdisjoint(ips):
+            skipped[name] = "IP совпадает с другим создаваемым хостом"
+        else:
+            selected[name] = ip
+            selected_ips.update(ips)
+            skipped.pop(name, None)
+    return selected, skipped
+
+
+def is_host_error(error):
+    """
+    Относится ли ошибка host.create к отдельным хостам пакета, а не ко всему вызову.
+    """
+    text = str(error)
+    return any(marker in text for marker in HOST_ERROR_MARKERS) or HOST_ERROR_PATTERN.search(text) is not None
+
+
+def _create_chunks(zapi, payloads, batch_size, scheduler):
+    """
+    Создаёт хосты пакетами host.create (массив параметров) через планировщик изменений.
+    host.create выполняется атомарно, поэтому пакет с ошибкой отдельных хостов
+    (см. is_host_error) делится пополам и отправляется заново, пока ошибочные
+    хосты не будут отделены от остальных. При прочих ошибках весь пакет
+    считается неудачным без повторных вызовов.
+    :return: Кортеж ({имя: hostid}, {имя: ошибка}, число вызовов API).
+    """
+    created, failed, api_calls = {}, {}, 0
+    pending = {}
+
+    def submit(chunk):
+        pending[scheduler.submit("host.create", zapi.host.create, *chunk)] = chunk
+
+    for chunk in chunked(payloads, batch_size):
+        submit(chunk)
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk = pending.pop(future)
+            api_calls += 1
+            try:
+                result = future.result()
+                created.update({payload["host"]: hostid for payload, hostid in zip(chunk, result["hostids"])})
+            except Exception as e:
+                if len(chunk) == 1 or not is_host_error(e):
+                    failed.update({payload["host"]: str(e) for payload in chunk})
+                    continue
+                middle = len(chunk) // 2
+                submit(chunk[:middle])
+                submit(chunk[middle:])
+    return created, failed, api_calls
+
+
+def create_missing_hosts(zapi, missing_hosts, zabbix_hosts=None, groups=None, templates=None,
+                         status=ZABBIX_CREATE_STATUS, batch_size=ZABBIX_CREATE_BATCH_SIZE, scheduler=None):
+    """
+    Создаёт в Zabbix хосты, отсутствующие по результатам сравнения.
+    Перед созданием хосты сверяются с индексом выгрузки Zabbix (по имени и IP)
+    и одним host.get по именам (на случай хостов, созданных после выгрузки).
+    Хосты создаются пакетами host.create через общий планировщик изменений
+    (ограничение частоты, адаптивная параллельность, повторы временных ошибок).
+    :param missing_hosts: Список {"host": имя VM, "ip": IP, "ips": [IP]} (missing_hosts.json).
+    :param zabbix_hosts: Выгрузка Zabbix (список или HostIndex) для проверки дубликатов.
+    :return: Словарь {"created": {имя: hostid}, "skipped": {имя: причина},
+             "failed": {имя: ошибка}, "api_calls": N}.
+    """
+    if zabbix_hosts is not None and not isinstance(zabbix_hosts, HostIndex):
+        zabbix_hosts = HostIndex.from_hosts(zabbix_hosts)
+    selected, skipped = select_new_hosts(missing_hosts, zabbix_hosts)
+    report = {"created": {}, "skipped": skipped, "failed": {}, "api_calls": 0}
+    if not selected:
+        return report
+
+    existing = zapi.host.get(filter={"host": list(selected)}, output=["host"])
+    report["api_calls"] += 1
+    for host in existing:
+        if selected.pop(host["host"], None) is not None:
+            skipped[host["host"]] = "имя уже есть в Zabbix"
+    if not selected:
+        return report
+
+    group_ids, template_ids, api_calls = resolve_ids(zapi, groups, templates)
+    report["api_calls"] += api_calls
+    payloads = [host_payload(name, ip, group_ids, template_ids, status) for name, ip in selected.items()]
+
+    created, failed, api_calls = _create_chunks(zapi, payloads, batch_size, scheduler or get_scheduler())
+    report["created"].update(created)
+    report["failed"].update(failed)
+    report["api_calls"] += api_calls
+
+    summary = EventSummary("Создание хостов")
+    for name, reason in skipped.items():
+        summary.add(f"пропущены ({reason})", name)
+    for name, error in report["failed"].items():
+        summary.add("ошибки", f"{name}: {error}", logging.ERROR)
+    summary.log()
+    if report["created"]:
+        logging.info(f"Создано хостов: {len(report['created'])} ({sample(report['created'])})")
+
+    for outcome in ("created", "skipped", "failed"):
+        metrics.inc("remediation_total", len(report[outcome]), action="create", outcome=outcome)
+    return report
+
+
+def main():
+    """
+    Создаёт в Zabbix хосты из missing_hosts.json.
+    """
+    try:
+        with metrics.job("create-hosts"), profiling.job("create-hosts"):
+            from zabbix_client import connect_to_zabbix
+            zapi = connect_to_zabbix()
+
+            missing_hosts = load_snapshot("missing_hosts.json")
+            zabbix_hosts = HostIndex.from_hosts(iter_snapshot("zabbix_hosts.json"))
+
+            report = create_missing_hosts(zapi, missing_hosts, zabbix_hosts)
+            logging.info(
+                f"Итого: создано {len(report['created'])}, пропущено {len(report['skipped'])}, "
+                f"ошибок {len(report['failed'])}, вызовов API {report['api_calls']}"
+            )
+
+    except Exception as e:
+        logging.error(f"Произошла ошибка: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("create_hosts")
+    main()
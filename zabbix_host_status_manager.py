@@ -1,17 +1,21 @@
 import logging
 import json
-from pyzabbix import ZabbixAPI
 
-# Импортируем настройки из файла config.py
-from config import ZABBIX_URL, ZABBIX_USER, ZABBIX_PASSWORD
+import metrics
+import profiling
+from log_setup import EventSummary, sample, setup_logging
+from remediation_journal import open_journal
+from write_scheduler import chunked, get_scheduler
 
-# Настройка логирования
-log_file = "/var/log/zabbix/zabbix_scripts_status_manager.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
-)
+# Настройки необязательны: план исправлений (planner.py --dry-run)
+# строится и без config.py, действуют значения по умолчанию
+try:
+    import config
+except ImportError:
+    config = None
+
+# Размер пакета для host.massupdate
+ZABBIX_BATCH_SIZE = getattr(config, "ZABBIX_BATCH_SIZE", 500)
 
 
 def load_hosts_from_file(filename):
@@ -26,19 +30,6 @@ def load_hosts_from_file(filename):
         raise
 
 
-def connect_to_zabbix():
-    """
-    Подключается к Zabbix API и возвращает объект API.
-    """
-    try:
-        zapi = ZabbixAPI(ZABBIX_URL)
-        zapi.login(ZABBIX_USER, ZABBIX_PASSWORD)
-        return zapi
-    except Exception as e:
-        logging.error(f"Ошибка при подключении к Zabbix API: {e}")
-        raise
-
-
 def determine_status(vmware_status):
     """
     Определяет статус Zabbix в зависимости от статуса VMware.
@@ -71,35 +62,170 @@ def change_host_status(zapi, host_name, status):
 
         # Проверка — если статус не меняется, пропускаем
         if int(host_info["status"]) == status:
-            logging.info(f"Хост '{host_name}' уже имеет статус {'enabled' if status == 0 else 'disabled'} — пропуск.")
+            logging.debug(f"Хост '{host_name}' уже имеет статус {'enabled' if status == 0 else 'disabled'} — пропуск.")
             return
 
         # Меняем статус хоста
-        zapi.host.update(hostid=host_id, status=status)
+        get_scheduler().call("host.update", zapi.host.update, hostid=host_id, status=status)
         new_status = "enabled" if status == 0 else "disabled"
         logging.info(f"Статус хоста '{host_name}' изменен на {new_status}")
     except Exception as e:
         logging.error(f"Ошибка при изменении статуса хоста '{host_name}': {e}")
 
 
-if __name__ == "__main__":
-    try:
-        zapi = connect_to_zabbix()
-        mismatched_hosts = load_hosts_from_file("mismatched_hosts.json")
+def build_status_changes(mismatched_hosts):
+    """
+    Строит словарь {имя хоста: новый статус Zabbix} из списка
+    хостов с несоответствием статусов.
+    """
+    statuses = {}
+    skipped = EventSummary("Подготовка изменений статусов")
+    for host in mismatched_hosts:
+        if "host" not in host or "vmware_status" not in host:
+            skipped.add("пропущены объекты с неверной структурой", host, logging.WARNING)
+            continue
+
+        new_status = determine_status(host["vmware_status"])
+        if new_status is None:
+            continue
 
-        for host in mismatched_hosts:
-            if "host" not in host or "vmware_status" not in host:
-                logging.warning(f"Пропущен объект с неверной структурой: {host}")
-                continue
+        statuses[host["host"]] = new_status
+    skipped.log()
+    return statuses
 
-            host_name = host["host"]
-            vmware_status = host["vmware_status"]
-            new_status = determine_status(vmware_status)
 
-            if new_status is None:
-                continue
+def plan_status_chunks(zapi, statuses, batch_size=ZABBIX_BATCH_SIZE):
+    """
+    Разрешает имена в hostid одним host.get и делит хосты, статус которых
+    нужно изменить, на пакеты по целевому статусу.
+    :return: Кортеж (пакеты [{"op", "status", "hosts": {имя: hostid}}],
+             {имя: not_found/skipped} для остальных хостов).
+    """
+    hosts = zapi.host.get(filter={"host": list(statuses)}, output=["hostid", "host", "status"])
+    zabbix_index = {host["host"]: host for host in hosts}
+
+    # Группируем хосты по целевому статусу
+    results = {}
+    groups = {}
+    summary = EventSummary("Изменение статусов")
+    for host_name, status in statuses.items():
+        host_info = zabbix_index.get(host_name)
+        if host_info is None:
+            summary.add("хосты не найдены в Zabbix", host_name, logging.ERROR)
+            results[host_name] = "not_found"
+            continue
 
-            change_host_status(zapi, host_name, new_status)
+        # Проверка — если статус не меняется, пропускаем
+        if int(host_info["status"]) == status:
+            summary.add(f"хосты уже имеют статус {'enabled' if status == 0 else 'disabled'}", host_name)
+            results[host_name] = "skipped"
+            continue
+
+        groups.setdefault(status, []).append(host_info)
+    summary.log()
+
+    chunks = [
+        {"op": "host.massupdate", "status": status, "hosts": {host["host"]: host["hostid"] for host in batch}}
+        for status, group in groups.items()
+        for batch in chunked(group, batch_size)
+    ]
+    return chunks, results
+
+
+def change_hosts_status_batch(zapi, statuses, batch_size=ZABBIX_BATCH_SIZE, journal=None):
+    """
+    Пакетно меняет статусы хостов в Zabbix.
+    Все имена разрешаются в hostid одним host.get, затем хосты группируются
+    по целевому статусу и обновляются пакетами host.massupdate через общий
+    планировщик изменений (параллельно, с ограничением частоты и повторами).
+    С журналом (RemediationJournal) пакеты и их выполнение записываются;
+    прерванный запуск с теми же статусами продолжается с контрольной точки
+    без повторного host.get и без уже выполненных пакетов.
+    :param zapi: Объект Zabbix API.
+    :param statuses: Словарь {имя хоста: новый статус (0 - enabled, 1 - disabled)}.
+    :param batch_size: Максимум хостов в одном вызове host.massupdate.
+    :param journal: RemediationJournal или None.
+    :return: Словарь {"results": {имя: not_found/skipped/updated/failed}, "api_calls": N}.
+    """
+    results = {}
+    api_calls = 0
+    if not statuses:
+        return {"results": results, "api_calls": api_calls}
+
+    run = journal.open_run("status", statuses) if journal is not None else None
+    if run is not None and run.resumed:
+        results.update(run.meta.get("results", {}))
+        chunks = run.chunks
+        for chunk in chunks:
+            if chunk["chunk"] in run.done:
+                results.update(dict.fromkeys(chunk["hosts"], "updated"))
+    else:
+        chunks, planned = plan_status_chunks(zapi, statuses, batch_size)
+        api_calls += 1
+        results.update(planned)
+        if run is not None:
+            chunks = run.plan(chunks, meta={"results": planned})
+
+    scheduler = get_scheduler()
+    futures = [
+        (chunk, scheduler.submit("host.massupdate", zapi.host.massupdate,
+                                 hosts=[{"hostid": hostid} for hostid in chunk["hosts"].values()],
+                                 status=chunk["status"]))
+        for chunk in (run.pending() if run is not None else chunks)
+    ]
+    for chunk, future in futures:
+        new_status = "enabled" if chunk["status"] == 0 else "disabled"
+        names = list(chunk["hosts"])
+        try:
+            future.result()
+            outcome = "updated"
+            logging.info(f"Статус {len(names)} хостов изменен на {new_status}: {sample(names)}")
+            logging.debug(f"Статус изменен на {new_status}: {', '.join(names)}")
+            if run is not None:
+                run.record(chunk, ok=True)
+        except Exception as e:
+            outcome = "failed"
+            logging.error(f"Ошибка при изменении статуса {len(names)} хостов ({sample(names)}): {e}")
+            logging.debug(f"Статус не изменен: {', '.join(names)}")
+            if run is not None:
+                run.record(chunk, ok=False, error=e)
+        api_calls += 1
+        for name in names:
+            results[name] = outcome
+
+    if run is not None:
+        run.complete()
+    outcomes = list(results.values())
+    for outcome in set(outcomes):
+        metrics.inc("remediation_total", outcomes.count(outcome), action="status", outcome=outcome)
+    logging.info(f"Пакетное изменение статусов завершено, вызовов API: {api_calls}")
+    return {"results": results, "api_calls": api_calls}
+
+
+def main():
+    """
+    Приводит статусы хостов Zabbix из mismatched_hosts.json к статусам VM.
+    """
+    try:
+        with metrics.job("sync-status"), profiling.job("sync-status"):
+            from zabbix_client import connect_to_zabbix
+            zapi = connect_to_zabbix()
+            mismatched_hosts = load_hosts_from_file("mismatched_hosts.json")
+
+            statuses = build_status_changes(mismatched_hosts)
+
+            report = change_hosts_status_batch(zapi, statuses, journal=open_journal())
+            outcomes = list(report["results"].values())
+            logging.info(
+                f"Итого: изменено {outcomes.count('updated')}, пропущено {outcomes.count('skipped')}, "
+                f"не найдено {outcomes.count('not_found')}, ошибок {outcomes.count('failed')}, "
+                f"вызовов API {report['api_calls']}"
+            )
 
     except Exception as e:
         logging.error(f"Произошла ошибка: {e}")
+
+
+if __name__ == "__main__":
+    setup_logging("status_manager")
+    main()